@@ -23,6 +23,22 @@ class Ingredient(Base):
     
     # Relationships
     sources = relationship("IngredientSource", back_populates="ingredient")
+    aliases = relationship(
+        "IngredientAlias",
+        back_populates="ingredient",
+        cascade="all, delete-orphan"
+    )
+    
+class IngredientAlias(Base):
+    """Normalized name or alternate name pointing at its ingredient, for indexed lookups."""
+    __tablename__ = "ingredient_aliases"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    normalized_alias = Column(String(255), unique=True, index=True, nullable=False)
+    ingredient_id = Column(Integer, ForeignKey("ingredients.id", ondelete="CASCADE"), index=True, nullable=False)
+    
+    # Relationships
+    ingredient = relationship("Ingredient", back_populates="aliases")
     
 class IngredientSource(Base):
     __tablename__ = "ingredient_sources"
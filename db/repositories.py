@@ -1,39 +1,89 @@
 import json
-from sqlalchemy.orm import Session
-from sqlalchemy import cast, or_, String
-from sqlalchemy.dialects.postgresql import JSONB
+from typing import Dict, List
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 
-from logger_manager import log_debug, log_error
+from logger_manager import log_debug
 from . import models
 from interfaces.ingredientModels import IngredientAnalysisResult 
 from interfaces.productModels import ProductCreate
-from datetime import datetime
+from utils.ingredient_cache import ingredient_cache
+from utils.text_utils import normalize_ingredient_name
+from datetime import datetime, timezone
     
 class IngredientRepository:
     def __init__(self, db: Session):
         self.db = db
     
-    def get_ingredient_by_name(self, name: str):        
-        exact_match = self.db.query(models.Ingredient).filter(models.Ingredient.name.ilike(name)).first()
+    def get_ingredient_by_name(self, name: str):
+        # Names and alternate names are both stored normalized in ingredient_aliases,
+        # so this is a single lookup on its unique index
+        normalized = normalize_ingredient_name(name)
+        if not normalized:
+            return None
+        
+        match = self.db.query(models.Ingredient).join(models.IngredientAlias).filter(
+            models.IngredientAlias.normalized_alias == normalized
+        ).first()
+        
+        if match:
+            log_debug(f"Match found for ingredient: {name}")
+        return match
     
-        if exact_match:
-            log_debug(f"Exact match found for ingredient: {name}")
-            return exact_match
+    def get_many_by_names(self, names: List[str]) -> Dict[str, models.Ingredient]:
+        """Resolve many names (exact or alternate) in one query, sources loaded eagerly.
         
-        # If no exact match, try searching in alternate names
-        try:
-            # Use .first() to return the model instance, not the query object
-            alternate_match = self.db.query(models.Ingredient).filter(
-                models.Ingredient.alternate_names.cast(JSONB).op('?')(name)
-            ).first()
-            
-            if alternate_match:
-                log_debug(f"Alternate match found for ingredient: {name}")
-            
-            return alternate_match
-        except Exception as e:
-            log_error(f"Error searching alternate names: {e}",e)
-            return None
+        Returns a dict keyed by normalized name, names that are not found are left out.
+        """
+        keys = list({key for key in (normalize_ingredient_name(name) for name in names) if key})
+        if not keys:
+            return {}
+        
+        rows = self.db.query(models.IngredientAlias.normalized_alias, models.Ingredient).join(
+            models.Ingredient, models.IngredientAlias.ingredient_id == models.Ingredient.id
+        ).filter(
+            models.IngredientAlias.normalized_alias.in_(keys)
+        ).options(selectinload(models.Ingredient.sources)).all()
+        
+        log_debug(f"Resolved {len(rows)} of {len(keys)} ingredient names in one query")
+        return {alias: ingredient for alias, ingredient in rows}
+    
+    def _sync_aliases(self, db_ingredient: models.Ingredient, alternate_names):
+        """Point the normalized name and alternate names of an ingredient at it."""
+        canonical = normalize_ingredient_name(db_ingredient.name)[:255]
+        wanted = []
+        for alias_name in [db_ingredient.name, *(alternate_names or [])]:
+            key = normalize_ingredient_name(alias_name)[:255]
+            if key and key not in wanted:
+                wanted.append(key)
+        
+        # Remove aliases the ingredient no longer has
+        for alias in list(db_ingredient.aliases):
+            if alias.normalized_alias not in wanted:
+                db_ingredient.aliases.remove(alias)
+        
+        existing = {
+            alias.normalized_alias: alias
+            for alias in self.db.query(models.IngredientAlias).filter(
+                models.IngredientAlias.normalized_alias.in_(wanted)
+            )
+        }
+        for key in wanted:
+            alias = existing.get(key)
+            if alias is None:
+                try:
+                    # savepoint, another worker may insert the same alias concurrently
+                    with self.db.begin_nested():
+                        self.db.add(models.IngredientAlias(normalized_alias=key, ingredient_id=db_ingredient.id))
+                except IntegrityError:
+                    log_debug(f"Alias {key} was taken concurrently, skipping")
+            elif alias.ingredient_id != db_ingredient.id and key == canonical \
+                    and normalize_ingredient_name(alias.ingredient.name) != key:
+                # an ingredient's own name wins over another ingredient's alternate name
+                log_debug(f"Reassigning alias {key} to ingredient {db_ingredient.name}")
+                alias.ingredient_id = db_ingredient.id
         
     def get_all_ingredients(self, skip: int = 0, limit: int = 100):
         return self.db.query(models.Ingredient).offset(skip).limit(limit).all()
@@ -56,34 +106,51 @@ class IngredientRepository:
             description=description,
             health_effects=health_effects,
             allergic_info=allergic_info,
-            diet_type=diet_type
+            diet_type=diet_type,
+            # version of the analysis, part of the product analysis cache key
+            updated_at=datetime.now(timezone.utc)
         )
-        self.db.add(db_ingredient)
-        self.db.commit()
-        self.db.refresh(db_ingredient)
-        
-        # Create source records
-        for source in ingredient_data.details_with_source:
-            db_source = models.IngredientSource(
-                ingredient_id=db_ingredient.id,
-                source_name=source.get("source", "Unknown"),
-                found=source.get("found", False),
-                summary=source.get("summary", ""),
-                data=source
-            )
-            self.db.add(db_source)
-        
-        self.db.commit()
+        try:
+            self.db.add(db_ingredient)
+            # flush for the id, the ingredient, its sources and aliases are committed together
+            self.db.flush()
+            
+            # Create source records
+            for source in ingredient_data.details_with_source:
+                db_source = models.IngredientSource(
+                    ingredient_id=db_ingredient.id,
+                    source_name=source.get("source", "Unknown"),
+                    found=source.get("found", False),
+                    summary=source.get("summary", ""),
+                    data=json.dumps(source, default=str)
+                )
+                self.db.add(db_source)
+            
+            self._sync_aliases(db_ingredient, ingredient_data.alternate_names)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        ingredient_cache.invalidate([name, *ingredient_data.alternate_names])
         return db_ingredient
     
     def update_ingredient(self, name: str, ingredient_data: IngredientAnalysisResult):
         db_ingredient = self.get_ingredient_by_name(name)
         if db_ingredient:
-            # Update ingredient fields
-            db_ingredient.alternate_names = ingredient_data.alternate_names
+            # Cached copies live under the old and the new names
+            try:
+                old_alternate_names = json.loads(db_ingredient.alternate_names or "[]")
+            except (TypeError, ValueError):
+                old_alternate_names = []
+            stale_names = [name, db_ingredient.name, *old_alternate_names, *ingredient_data.alternate_names]
+            
+            # Update ingredient fields, list fields are stored as json text
+            db_ingredient.alternate_names = json.dumps(ingredient_data.alternate_names)
             db_ingredient.safety_rating = ingredient_data.safety_rating
             db_ingredient.description = ingredient_data.description
-            db_ingredient.health_effects = ingredient_data.health_effects
+            db_ingredient.health_effects = json.dumps(ingredient_data.health_effects)
+            db_ingredient.updated_at = datetime.now(timezone.utc)
+            self._sync_aliases(db_ingredient, ingredient_data.alternate_names)
             
             # Delete old sources
             self.db.query(models.IngredientSource).filter(
@@ -97,15 +164,80 @@ class IngredientRepository:
                     source_name=source.get("source", "Unknown"),
                     found=source.get("found", False),
                     summary=source.get("summary", ""),
-                    data=source
+                    data=json.dumps(source, default=str)
                 )
                 self.db.add(db_source)
             
             self.db.commit()
             self.db.refresh(db_ingredient)
+            ingredient_cache.invalidate(stale_names)
             return db_ingredient
         return None
 
+class AsyncIngredientRepository:
+    """IngredientRepository for AsyncSession, used on the request paths.
+    
+    Reads are native async queries with sources loaded eagerly (lazy loading
+    isn't possible on an AsyncSession). Writes reuse the sync repository
+    through run_sync so the alias bookkeeping lives in one place.
+    """
+    def __init__(self, db: AsyncSession):
+        self.db = db
+    
+    async def get_ingredient_by_name(self, name: str):
+        normalized = normalize_ingredient_name(name)
+        if not normalized:
+            return None
+        
+        result = await self.db.execute(
+            select(models.Ingredient).join(models.IngredientAlias).where(
+                models.IngredientAlias.normalized_alias == normalized
+            ).options(selectinload(models.Ingredient.sources)).limit(1)
+        )
+        match = result.scalars().first()
+        if match:
+            log_debug(f"Match found for ingredient: {name}")
+        return match
+    
+    async def get_ingredient_by_exact_name(self, name: str):
+        """Lookup on the unique Ingredient.name, also finds ingredients whose
+        normalized name is an alias of another ingredient."""
+        result = await self.db.execute(
+            select(models.Ingredient).where(models.Ingredient.name == name)
+            .options(selectinload(models.Ingredient.sources)).limit(1)
+        )
+        return result.scalars().first()
+    
+    async def get_many_by_names(self, names: List[str]) -> Dict[str, models.Ingredient]:
+        keys = list({key for key in (normalize_ingredient_name(name) for name in names) if key})
+        if not keys:
+            return {}
+        
+        result = await self.db.execute(
+            select(models.IngredientAlias.normalized_alias, models.Ingredient).join(
+                models.Ingredient, models.IngredientAlias.ingredient_id == models.Ingredient.id
+            ).where(
+                models.IngredientAlias.normalized_alias.in_(keys)
+            ).options(selectinload(models.Ingredient.sources))
+        )
+        rows = result.all()
+        log_debug(f"Resolved {len(rows)} of {len(keys)} ingredient names in one query")
+        return {alias: ingredient for alias, ingredient in rows}
+    
+    async def get_all_ingredients(self, skip: int = 0, limit: int = 100):
+        result = await self.db.execute(select(models.Ingredient).offset(skip).limit(limit))
+        return result.scalars().all()
+    
+    async def create_ingredient(self, ingredient_data: IngredientAnalysisResult):
+        return await self.db.run_sync(
+            lambda session: IngredientRepository(session).create_ingredient(ingredient_data)
+        )
+    
+    async def update_ingredient(self, name: str, ingredient_data: IngredientAnalysisResult):
+        return await self.db.run_sync(
+            lambda session: IngredientRepository(session).update_ingredient(name, ingredient_data)
+        )
+
 class ProductRepository:
     def __init__(self, db: Session):
         self.db = db
@@ -116,7 +248,15 @@ class ProductRepository:
         return db_product
 
     def _create_product(self, product_create: ProductCreate):
-        db_product = models.Product(
+        db_product = self._build_product(product_create)
+        self.db.add(db_product)
+        self.db.commit()
+        self.db.refresh(db_product)
+        return db_product
+
+    @staticmethod
+    def _build_product(product_create: ProductCreate) -> models.Product:
+        return models.Product(
             product_name=product_create.product_name,
             ingredients=product_create.ingredients,
             overall_safety_score=product_create.overall_safety_score,
@@ -131,12 +271,31 @@ class ProductRepository:
             timestamp=product_create.timestamp,
             ingredient_ids=product_create.ingredient_ids
         )
-        self.db.add(db_product)
-        self.db.commit()
-        self.db.refresh(db_product)
-        return db_product
 
     def _store_analysis_data(self, db_product, ingredients_analysis):
         db_product.ingredients_analysis = ingredients_analysis
         self.db.commit()
         self.db.refresh(db_product)
+
+class AsyncProductRepository:
+    """ProductRepository for AsyncSession, used on the request paths."""
+    def __init__(self, db: AsyncSession):
+        self.db = db
+    
+    async def add_product(self, product_create: ProductCreate):
+        db_product = ProductRepository._build_product(product_create)
+        self.db.add(db_product)
+        await self.db.commit()
+        await self.db.refresh(db_product)
+        return db_product
+    
+    async def get_product_by_id(self, product_id: int):
+        return await self.db.get(models.Product, product_id)
+    
+    async def get_product_by_marker_id(self, vuforia_id: str):
+        result = await self.db.execute(
+            select(models.Product).join(
+                models.Marker, models.Marker.product_id == models.Product.id
+            ).where(models.Marker.vuforia_id == vuforia_id).limit(1)
+        )
+        return result.scalars().first()
@@ -25,6 +25,11 @@ ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
 # for google ai studio
 LLM_API_KEY = os.getenv("LLM_API_KEY", None)
 LLM_MODEL_NAME = os.getenv("LLM_MODEL_NAME", "gemini-2.0-flash")
+# lower temperatures for more factual responses
+LLM_INGREDIENT_TEMPERATURE = float(os.getenv("LLM_INGREDIENT_TEMPERATURE", 0.3))
+LLM_PRODUCT_TEMPERATURE = float(os.getenv("LLM_PRODUCT_TEMPERATURE", 0.2))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 60))  # seconds
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 2))
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY", None)
 GOOGLE_CSE_ID = os.getenv("GOOGLE_CSE_ID", None)
@@ -33,6 +38,15 @@ USDA_API_KEY = os.getenv("USDA_API_KEY", "DEMO_KEY")
 
 # pg db url
 DATABASE_URL = os.getenv("DATABASE_URL", None)
+# async driver url, derived from DATABASE_URL (asyncpg / aiomysql) when not set
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", None)
+
+# database connection pool settings, shared by the sync and async engines
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true") == "true"
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))  # seconds
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))  # seconds
 
 # Vuforia keys
 VUFORIA_SERVER_ACCESS_KEY = os.getenv("VUFORIA_SERVER_ACCESS_KEY", None)
@@ -48,6 +62,35 @@ LANGSMITH_PROJECT = os.getenv("LANGSMITH_PROJECT", None)
 
 # app settings
 PARALLEL_RATE_LIMIT = int(os.getenv("PARALLEL_RATE_LIMIT", 10))
+# new ingredients analyzed per LLM call, 1 sends one call per ingredient
+LLM_ANALYSIS_BATCH_SIZE = int(os.getenv("LLM_ANALYSIS_BATCH_SIZE", 8))
+
+# Ingredient research: "tiered" queries local, database and web sources in
+# that order and stops once RESEARCH_MIN_SOURCES found data, "all" always
+# waits for every source
+RESEARCH_MODE = os.getenv("RESEARCH_MODE", "tiered")
+RESEARCH_MIN_SOURCES = int(os.getenv("RESEARCH_MIN_SOURCES", 2))
+RESEARCH_TIER_TIMEOUT = float(os.getenv("RESEARCH_TIER_TIMEOUT", 3))  # seconds before the next tier starts anyway
+RESEARCH_DEADLINE_SECONDS = float(os.getenv("RESEARCH_DEADLINE_SECONDS", 20))  # per ingredient
+
+# Hard deadlines, work still running when they pass is cancelled and a partial
+# result is returned. Per request (ingredients plus product analysis) and for
+# researching the new ingredients of a request (sources plus LLM analysis)
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", 35))
+INGREDIENT_DEADLINE_SECONDS = float(os.getenv("INGREDIENT_DEADLINE_SECONDS", 25))
+# of an ingredient deadline, kept free for the LLM analysis after collecting sources
+RESEARCH_ANALYSIS_RESERVE_SECONDS = float(os.getenv("RESEARCH_ANALYSIS_RESERVE_SECONDS", 5))
+
+# Ingredient analysis cache, in-process tier size and ttl in seconds
+INGREDIENT_CACHE_SIZE = int(os.getenv("INGREDIENT_CACHE_SIZE", 5000))
+INGREDIENT_CACHE_TTL = int(os.getenv("INGREDIENT_CACHE_TTL", 3600))
+# optional shared tier, e.g. redis://localhost:6379/0 (disabled when not set)
+REDIS_URL = os.getenv("REDIS_URL", None)
+
+# Pooled HTTP sessions for upstream APIs
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", 20))
+HTTP_KEEPALIVE_TIMEOUT = int(os.getenv("HTTP_KEEPALIVE_TIMEOUT", 30))  # seconds
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", 300))  # seconds
 
 # Rate limiting configuration in seconds
 PUBCHEM_TIMEOUT = int(os.getenv("PUBCHEM_TIMEOUT", 2))
@@ -56,6 +99,102 @@ PUBCHEM_MAX_RETRIES = int(os.getenv("PUBCHEM_MAX_RETRIES", 2))
 # Delay in seconds
 DUCKDUCKGO_RATE_LIMIT_DELAY = int(os.getenv("DUCKDUCKGO_RATE_LIMIT_DELAY", 2))
 DUCKDUCKGO_MAX_RETRIES = int(os.getenv("DUCKDUCKGO_MAX_RETRIES", 2))
+# threads for the blocking DuckDuckGo client
+WEB_SEARCH_WORKERS = int(os.getenv("WEB_SEARCH_WORKERS", 4))
+
+# Persistent cache of upstream source responses, keyed by source and normalized ingredient
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true") == "true"
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "cache/responses.sqlite3")
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 50000))
+# ttl in seconds per source, and for responses where nothing was found
+RESPONSE_CACHE_TTLS = {
+    "pubchem": int(os.getenv("RESPONSE_CACHE_TTL_PUBCHEM", 30 * 24 * 3600)),
+    "usda": int(os.getenv("RESPONSE_CACHE_TTL_USDA", 7 * 24 * 3600)),
+    "open_food_facts": int(os.getenv("RESPONSE_CACHE_TTL_OPEN_FOOD_FACTS", 3 * 24 * 3600)),
+    "wikipedia": int(os.getenv("RESPONSE_CACHE_TTL_WIKIPEDIA", 7 * 24 * 3600)),
+    "duckduckgo": int(os.getenv("RESPONSE_CACHE_TTL_DUCKDUCKGO", 24 * 3600)),
+}
+RESPONSE_CACHE_NEGATIVE_TTL = int(os.getenv("RESPONSE_CACHE_NEGATIVE_TTL", 6 * 3600))
+# Product analyses, keyed by the analyzed ingredient versions, user preferences,
+# model and prompt version, kept in the same store (0 disables)
+PRODUCT_ANALYSIS_CACHE_TTL = int(os.getenv("PRODUCT_ANALYSIS_CACHE_TTL", 7 * 24 * 3600))
+
+# How the overall product analysis is built: "llm" (the LLM writes it all),
+# "rules" (deterministic, no LLM) or "hybrid" (rules answer right away, the
+# LLM's free text is merged in by a background job)
+PRODUCT_ANALYSIS_MODE = os.getenv("PRODUCT_ANALYSIS_MODE", "llm").lower()
+
+# Background jobs (background=true on the product endpoints), persisted in SQLite
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "cache/jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", 24 * 3600))  # finished jobs are purged after this
+# running jobs hold a lease their process renews, a job whose lease ran out (its process died) is run again
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", 60))
+
+# Object detection models, loaded from MODEL_STORE_DIR/<name>/<version>. A
+# version missing from the store is downloaded from its handle once, unless
+# MODEL_DOWNLOAD_ENABLED is false (then the store has to be prepared in advance)
+MODEL_STORE_DIR = os.getenv("MODEL_STORE_DIR", "models")
+MODEL_DOWNLOAD_ENABLED = os.getenv("MODEL_DOWNLOAD_ENABLED", "true") == "true"
+FOOD_DETECTOR_HANDLE = os.getenv("FOOD_DETECTOR_HANDLE", "https://tfhub.dev/google/openimages_v4/ssd/mobilenet_v2/1")
+FOOD_DETECTOR_VERSION = os.getenv("FOOD_DETECTOR_VERSION", "1")
+# "tfhub" runs the SavedModel with TensorFlow, "onnx" (ONNX Runtime) and "tflite"
+# run the converted model from the same store directory, see scripts/convert_detector.py
+DETECTOR_BACKEND = os.getenv("DETECTOR_BACKEND", "tfhub").lower()
+
+# Object detection runs on its own threads: jobs running at once, jobs allowed
+# to wait (more get a 503) and TensorFlow threads per forward pass (0 = TF default)
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", 2))
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", 8))
+INFERENCE_INTRA_OP_THREADS = int(os.getenv("INFERENCE_INTRA_OP_THREADS", 0))
+
+# Micro-batching of detector calls: up to FOOD_DETECTOR_MAX_BATCH_SIZE images,
+# waiting at most DETECTION_BATCH_WAIT_MS for a batch to fill. The TF Hub
+# detector only takes one image per call, keep 1 unless the pinned model has a
+# batch dimension (1 skips the batcher). Batches are limited by INFERENCE_WORKERS too
+FOOD_DETECTOR_MAX_BATCH_SIZE = int(os.getenv("FOOD_DETECTOR_MAX_BATCH_SIZE", 1))
+DETECTION_BATCH_WAIT_MS = float(os.getenv("DETECTION_BATCH_WAIT_MS", 5))
+
+# Uploads are decoded and downscaled to at most this many pixels per side before
+# detection (the SSD downsamples much further internally), crops use the full image
+DETECTION_INPUT_SIZE = int(os.getenv("DETECTION_INPUT_SIZE", 640))
+
+# Per-upstream budgets shared by all requests of this process:
+# max calls in flight and requests per second (0 disables the rate limit)
+UPSTREAM_LIMITS = {
+    "gemini": {
+        "max_concurrency": int(os.getenv("GEMINI_MAX_CONCURRENCY", PARALLEL_RATE_LIMIT)),
+        "rate": float(os.getenv("GEMINI_RATE_LIMIT", 0)),
+    },
+    "duckduckgo": {
+        # adaptive, starts at rate and moves between min_rate and max_rate
+        # depending on how often DuckDuckGo rate limits us
+        "max_concurrency": int(os.getenv("DUCKDUCKGO_MAX_CONCURRENCY", 4)),
+        "rate": float(os.getenv("DUCKDUCKGO_RATE_LIMIT", 1)),
+        "min_rate": float(os.getenv("DUCKDUCKGO_MIN_RATE", 0.2)),
+        "max_rate": float(os.getenv("DUCKDUCKGO_MAX_RATE", 4)),
+        "burst": 4,
+    },
+    "pubchem": {
+        # PubChem allows at most 5 requests per second
+        "max_concurrency": int(os.getenv("PUBCHEM_MAX_CONCURRENCY", 5)),
+        "rate": float(os.getenv("PUBCHEM_RATE_LIMIT", 5)),
+        "burst": 5,
+    },
+    "usda": {
+        "max_concurrency": int(os.getenv("USDA_MAX_CONCURRENCY", PARALLEL_RATE_LIMIT)),
+        "rate": float(os.getenv("USDA_RATE_LIMIT", 0)),
+    },
+    "open_food_facts": {
+        "max_concurrency": int(os.getenv("OPEN_FOOD_FACTS_MAX_CONCURRENCY", 5)),
+        "rate": float(os.getenv("OPEN_FOOD_FACTS_RATE_LIMIT", 1.5)),
+        "burst": 3,
+    },
+    "wikipedia": {
+        "max_concurrency": int(os.getenv("WIKIPEDIA_MAX_CONCURRENCY", PARALLEL_RATE_LIMIT)),
+        "rate": float(os.getenv("WIKIPEDIA_RATE_LIMIT", 0)),
+    },
+}
 
 # fake response for testing
 SEND_FAKE_TARGET = os.getenv("SEND_FAKE_TARGET", False) == "true"
@@ -1,3 +1,4 @@
+from datetime import datetime
 from typing import Dict, List, Any, Optional, TypedDict
 from pydantic import BaseModel, Field
 
@@ -14,6 +15,10 @@ class IngredientAnalysisResult(BaseModel):
     allergic_info: Optional[List[str]] = None  # New field
     diet_type: Optional[str] = None  # New field
     details_with_source: List[Dict[str, Any]] = Field(default_factory=list)
+    # research hit its deadline, some sources (see details_with_source) are missing
+    timed_out: bool = False
+    # when the stored analysis last changed, None until stored
+    updated_at: Optional[datetime] = None
     
     class Config:
         from_attributes = True  # Enable ORM mode
@@ -22,6 +27,7 @@ class IngredientAnalysisResult(BaseModel):
 class IngredientState(TypedDict):
     ingredient: str
     sources_data: List[Dict[str, Any]]
+    answered_tiers: List[str]
     status: str
     result: Optional[Dict[str, Any]]
     local_db_checked: bool
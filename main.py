@@ -5,12 +5,18 @@ from fastapi.staticfiles import StaticFiles
 from routers.auth import router as auth_router
 from routers.analysis import router as analysis_router
 from routers.history import router as history_router
+from routers.jobs import router as jobs_router
 from routers.product import router as product_router
 import os
 import uvicorn
 from pathlib import Path
-import tensorflow as tf
-import tensorflow_hub as hub
+from db.database import async_engine
+from utils.http_clients import http_clients
+from services.job_queue import job_queue
+from services.llm_provider import warm_up_llm_clients
+from utils.detection import warm_up_detector
+from utils.inference_pool import inference_pool
+from utils.upstream_scheduler import upstream_scheduler
 from env import PORT
 
 
@@ -22,13 +28,28 @@ app = FastAPI()
 # Suppress TensorFlow warnings
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'  # 0=all, 1=no INFO, 2=no WARNING, 3=no ERROR
 
-# Store the model as a state variable in the app
 @app.on_event("startup")
 async def startup_event():
-    # Load model once during startup
-    print("Loading TensorFlow model...")
-    app.state.detector = hub.load("https://tfhub.dev/google/openimages_v4/ssd/mobilenet_v2/1").signatures['default']
-    print("TensorFlow model loaded successfully!")
+    # Load the detector (DETECTOR_BACKEND) from the local model store and run it once
+    print("Loading detection model...")
+    warm_up_detector()
+    print("Detection model loaded successfully!")
+    # Pooled keep-alive sessions for the upstream APIs
+    await http_clients.start()
+    upstream_scheduler.start()
+    # Create the shared LLM clients before the first request needs them
+    warm_up_llm_clients()
+    # Workers for background jobs, picks up jobs left over from the last run
+    await job_queue.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Stop the job workers, unfinished jobs resume on the next start
+    await job_queue.stop()
+    inference_pool.shutdown()
+    # Close pooled HTTP sessions and async database connections
+    await http_clients.close()
+    await async_engine.dispose()
 
 @app.get("/")
 def read_root():
@@ -56,6 +77,7 @@ app.include_router(analysis_router, prefix="/api/analyze")
 app.include_router(auth_router, prefix="/api/auth")
 app.include_router(product_router, prefix="/api/product")
 app.include_router(history_router, prefix="/api/history")
+app.include_router(jobs_router, prefix="/api/jobs")
 
 app.add_event_handler("startup", lambda: print("Starting up..."))
 
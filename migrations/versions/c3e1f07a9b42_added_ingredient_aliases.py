@@ -0,0 +1,91 @@
+"""added ingredient aliases
+
+Revision ID: c3e1f07a9b42
+Revises: 37b8cf50d624
+Create Date: 2025-06-02 10:14:27.503118
+
+"""
+import json
+import re
+import unicodedata
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3e1f07a9b42'
+down_revision: Union[str, None] = '37b8cf50d624'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_E_NUMBER_RE = re.compile(r"^e[\s\-]?(\d{3,4}[a-z]?)$")
+
+
+def normalize_ingredient_name(name: str) -> str:
+    """Copy of utils.text_utils.normalize_ingredient_name as of this revision,
+    migrations must not change when the app code does."""
+    if not name:
+        return ""
+    normalized = unicodedata.normalize("NFKC", str(name)).casefold()
+    normalized = _WHITESPACE_RE.sub(" ", normalized).strip(" .,;:*")
+
+    # collapse the common E-number spellings (E 330, E-330) into e330
+    e_number = _E_NUMBER_RE.match(normalized)
+    if e_number:
+        return f"e{e_number.group(1)}"
+    return normalized
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    aliases_table = op.create_table('ingredient_aliases',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('normalized_alias', sa.String(length=255), nullable=False),
+    sa.Column('ingredient_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['ingredient_id'], ['ingredients.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_ingredient_aliases_id'), 'ingredient_aliases', ['id'], unique=False)
+    op.create_index(op.f('ix_ingredient_aliases_normalized_alias'), 'ingredient_aliases', ['normalized_alias'], unique=True)
+    op.create_index(op.f('ix_ingredient_aliases_ingredient_id'), 'ingredient_aliases', ['ingredient_id'], unique=False)
+
+    # Backfill from existing ingredients, canonical names first so that they
+    # win over another ingredient's alternate name
+    rows = op.get_bind().execute(
+        sa.text("SELECT id, name, alternate_names FROM ingredients ORDER BY id")
+    ).fetchall()
+
+    taken = {}
+    for ingredient_id, name, _ in rows:
+        key = normalize_ingredient_name(name)[:255]
+        if key and key not in taken:
+            taken[key] = ingredient_id
+
+    for ingredient_id, _, alternate_names in rows:
+        try:
+            names = json.loads(alternate_names) if alternate_names else []
+        except (TypeError, ValueError):
+            names = []
+        if not isinstance(names, list):
+            continue
+        for alternate_name in names:
+            key = normalize_ingredient_name(alternate_name)[:255]
+            if key and key not in taken:
+                taken[key] = ingredient_id
+
+    if taken:
+        op.bulk_insert(aliases_table, [
+            {"normalized_alias": key, "ingredient_id": ingredient_id}
+            for key, ingredient_id in taken.items()
+        ])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_ingredient_aliases_ingredient_id'), table_name='ingredient_aliases')
+    op.drop_index(op.f('ix_ingredient_aliases_normalized_alias'), table_name='ingredient_aliases')
+    op.drop_index(op.f('ix_ingredient_aliases_id'), table_name='ingredient_aliases')
+    op.drop_table('ingredient_aliases')
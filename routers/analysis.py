@@ -1,38 +1,39 @@
-import asyncio
-import os
 from datetime import datetime
 import uuid
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
 import pytz
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Dict, Any
 from db.models import Marker, Product, User, Ingredient
 from interfaces.ingredientModels import IngredientAnalysisResult, IngredientRequest
 from interfaces.productModels import ProductIngredientsRequest
 from logger_manager import log_info, log_error
-from db.database import get_db,SessionLocal
-from db.repositories import IngredientRepository
+from db.database import get_async_db
 from dotenv import load_dotenv
 from langsmith import traceable
-from services.ingredientFinderAgent import IngredientInfoAgentLangGraph
-from services.productAnalyzerAgent import analyze_product_ingredients
+from services.ingredientFinderAgent import get_research_stats
+from services.productAnalyzerAgent import get_product_analysis_stats
 from services.auth_service import get_current_user
-from utils.db_utils import ingredient_db_to_pydantic
+from services.job_queue import job_queue
+from services.product_jobs import ANALYZE_PRODUCT_JOB
+from routers.jobs import job_accepted_response
+from utils.analyze import analyze_product, stream_product_analysis
 from interfaces.productModels import ProductAnalysisResponse
 from services.analysis_service import get_product_data_by_marker_id as get_analysis_service_data
-from utils.ingredient_utils import process_single_ingredient
+from utils.ingredient_cache import ingredient_cache
+from utils.ingredient_utils import get_known_ingredient, ingredient_single_flight, research_ingredient_before_deadline
+from utils.detection import detection_batcher
+from utils.inference_pool import inference_pool
+from utils.model_registry import model_registry
+from utils.response_cache import disk_cache
+from utils.sse import SSE_HEADERS, SSE_MEDIA_TYPE, sse_event
+from utils.upstream_scheduler import upstream_scheduler
 
 # Load environment variables
 load_dotenv()
 
-# Get rate limit from environment variable or use default
-PARALLEL_RATE_LIMIT = int(os.getenv("PARALLEL_RATE_LIMIT", 10))
-log_info(f"Using parallel rate limit of {PARALLEL_RATE_LIMIT}")
-
-# Create a semaphore to limit concurrent API calls
-llm_semaphore = asyncio.Semaphore(PARALLEL_RATE_LIMIT)
-
 
 router = APIRouter()
 
@@ -40,95 +41,75 @@ router = APIRouter()
 # process single ingredient 
 @router.post("/process_ingredient", response_model=IngredientAnalysisResult)
 @traceable
-async def process_ingredient_endpoint(request: IngredientRequest, db: Session = Depends(get_db)):
+async def process_ingredient_endpoint(request: IngredientRequest):
     try:
         log_info(f"Received request to process ingredient: {request.name}")
+        upstream_scheduler.new_flow()
         
-        # Check if we already have this ingredient in the database
-        repo = IngredientRepository(db)
-        db_ingredient = repo.get_ingredient_by_name(request.name)
+        # Check if we already have this ingredient (cache, then database)
+        known = await get_known_ingredient(request.name)
         
-        if db_ingredient:
+        if known:
             log_info(f"Found existing ingredient in database: {request.name}")
-            # Convert DB model to Pydantic model
-            # (This would need a function to correctly map the data)
-            return ingredient_db_to_pydantic(db_ingredient)
-        
-        # If not in database, get from agent
-        ingredient_finder = IngredientInfoAgentLangGraph()
-        # run async function if found event loop already running use normal function 
-        try:
-            result = await ingredient_finder.process_ingredient_async(request.name)
-        except RuntimeError:
-            # If the event loop is not running, run the function normally
-            result = ingredient_finder.process_ingredient(request.name)
-                    
+            return known
         
-        # Save to database
-        repo.create_ingredient(result)
-        log_info(f"Saved new ingredient to database: {request.name}")
+        # If not in database, get from agent (shared with concurrent requests for it),
+        # a timed out placeholder if that takes longer than the deadline
+        result = await research_ingredient_before_deadline(request.name)
+        if not result.timed_out:
+            log_info(f"Saved new ingredient to database: {request.name}")
         
         return result
     except Exception as e:
         log_error(f"Error processing ingredient: {e}",e)
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
+def _user_preferences(current_user: User) -> Dict[str, Any]:
+    # Safely get user preferences, handling the case where the preferences table doesn't exist
+    user_preferences = {}
+    if current_user:
+        user_preferences["user_id"] = current_user.id
+        try:
+            # Only try to access preferences if the relationship exists
+            if hasattr(current_user, 'preferences') and current_user.preferences:
+                user_preferences["allergies"] = current_user.preferences[0].allergens
+                user_preferences["dietary_restrictions"] = current_user.preferences[0].dietary_restrictions
+            else:
+                user_preferences["allergies"] = None
+                user_preferences["dietary_restrictions"] = None
+        except Exception as e:
+            log_error(f"Error accessing user preferences: {e}", e)
+            user_preferences["allergies"] = None
+            user_preferences["dietary_restrictions"] = None
+    return user_preferences
+
+
 @router.post("/process_product_ingredients", response_model=Dict[str, Any])
 @traceable
-async def process_ingredients_endpoint(product_ingredient: ProductIngredientsRequest, db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):    
+async def process_ingredients_endpoint(product_ingredient: ProductIngredientsRequest, background: bool = False, current_user: User = Depends(get_current_user)):    
+    """
+    Analyzes a product's ingredients for the current user. With background=true
+    the analysis runs as a background job, the response (202) has the job id
+    to poll /api/jobs/{job_id} with.
+    """
     log_info(f"process_ingredients_endpoint called for {len(product_ingredient.ingredients)} ingredients")
     ingredients = product_ingredient.ingredients
     try:
-        # Step 1: Process individual ingredients
-        ingredient_results = []
-            
-        log_info(f"Starting parallel ingredient processing with rate limit {PARALLEL_RATE_LIMIT}")
+        user_preferences = _user_preferences(current_user)
+        user_id = current_user.id if current_user else None
         
-        # Create tasks for parallel processing
-        tasks = []
-        for ingredient_name in ingredients:
-            task = process_single_ingredient(ingredient_name)
-            tasks.append(task)
+        if background:
+            job_id = await job_queue.submit(ANALYZE_PRODUCT_JOB, {
+                "ingredients": ingredients,
+                "user_preferences": user_preferences,
+                "user_id": user_id,
+            }, user_id=user_id)
+            return JSONResponse(job_accepted_response(job_id), status_code=202)
         
-        # Execute tasks concurrently with rate limiting
-        ingredient_results = await asyncio.gather(*tasks)
-        log_info(f"Completed parallel processing of {len(ingredient_results)} ingredients")
-                
-        # Step 2: Generate aggregate analysis with product analyzer agent
-        
-        # Safely get user preferences, handling the case where the preferences table doesn't exist
-        user_preferences = {}
-        if current_user:
-            user_preferences["user_id"] = current_user.id
-            try:
-                # Only try to access preferences if the relationship exists
-                if hasattr(current_user, 'preferences') and current_user.preferences:
-                    user_preferences["allergies"] = current_user.preferences[0].allergens
-                    user_preferences["dietary_restrictions"] = current_user.preferences[0].dietary_restrictions
-                else:
-                    user_preferences["allergies"] = None
-                    user_preferences["dietary_restrictions"] = None
-            except Exception as e:
-                log_error(f"Error accessing user preferences: {e}", e)
-                user_preferences["allergies"] = None
-                user_preferences["dietary_restrictions"] = None
-        
-        product_analysis = await analyze_product_ingredients(
-            ingredients_data=ingredient_results,
-            user_preferences=user_preferences
-        )
-        
-        # print("Product analysis result:", product_analysis)
-         
-        # Step 3: Prepare final response
-        result = {
-            "ingredients_count": len(ingredients),
-            "processed_ingredients": ingredient_results,
-            "ingredient_ids": product_analysis["ingredient_ids"],
-            "overall_analysis": product_analysis,
-            "user_id": current_user.id if current_user else None,
-            "timestamp": datetime.now(tz=pytz.timezone('Asia/Kolkata')).isoformat()
-        }
+        # Known ingredients are resolved in one query, only new ones are researched,
+        # then the product is analyzed with the product analyzer agent
+        result = await analyze_product(ingredients, user_preferences, user_id=user_id)
+        result["user_id"] = user_id
         
         log_info("process_ingredients_endpoint completed successfully")
         return result
@@ -138,15 +119,41 @@ async def process_ingredients_endpoint(product_ingredient: ProductIngredientsReq
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
 
+@router.post("/process_product_ingredients/stream")
+async def stream_ingredients_endpoint(product_ingredient: ProductIngredientsRequest, current_user: User = Depends(get_current_user)):
+    """
+    Streaming variant of /process_product_ingredients, as server-sent events:
+    an "ingredient" event per ingredient as soon as it is resolved (known ones
+    first), then the "overall_analysis" event. An "error" event ends the
+    stream if the analysis failed.
+    """
+    log_info(f"stream_ingredients_endpoint called for {len(product_ingredient.ingredients)} ingredients")
+    user_preferences = _user_preferences(current_user)
+    user_id = current_user.id if current_user else None
+
+    async def stream():
+        try:
+            async for event, data in stream_product_analysis(product_ingredient.ingredients, user_preferences, user_id=user_id):
+                if event == "overall_analysis":
+                    data["user_id"] = user_id
+                yield sse_event(data, event=event)
+            log_info("stream_ingredients_endpoint completed successfully")
+        except Exception as e:
+            log_error(f"Error in stream_ingredients_endpoint: {str(e)}", e)
+            yield sse_event({"detail": "Internal Server Error"}, event="error")
+
+    return StreamingResponse(stream(), media_type=SSE_MEDIA_TYPE, headers=SSE_HEADERS)
+
+
 @router.get("/get_by_marker_id/{target_id}", response_model=None)
-async def get_analysis_by_marker_id(target_id: str, db: Session = Depends(get_db)):
+async def get_analysis_by_marker_id(target_id: str, db: AsyncSession = Depends(get_async_db)):
     """
     Retrieves product analysis and ingredient information by marker ID.
     """
     log_info(f"Received request for analysis by marker ID: {target_id}")
     try:
         # Check if marker exists
-        marker = db.query(Marker).filter(Marker.vuforia_id == target_id).first()
+        marker = (await db.execute(select(Marker).where(Marker.vuforia_id == target_id).limit(1))).scalars().first()
         if not marker:
             return JSONResponse(
                 status_code=404,
@@ -158,7 +165,7 @@ async def get_analysis_by_marker_id(target_id: str, db: Session = Depends(get_db
             )
             
         # Check if product exists
-        product = db.query(Product).filter(Product.id == marker.product_id).first()
+        product = await db.get(Product, marker.product_id)
         if not product:
             return JSONResponse(
                 status_code=404,
@@ -170,7 +177,8 @@ async def get_analysis_by_marker_id(target_id: str, db: Session = Depends(get_db
             )
             
         # Try to get complete product data
-        product_data = get_analysis_service_data(db, target_id)
+        # the analysis service is sync code, run it on the async session's connection
+        product_data = await db.run_sync(lambda session: get_analysis_service_data(session, target_id))
         
         # If complete data retrieval fails, return minimal data
         if not product_data:
@@ -200,3 +208,23 @@ async def get_analysis_by_marker_id(target_id: str, db: Session = Depends(get_db
                 "timestamp": datetime.now(tz=pytz.timezone('Asia/Kolkata')).isoformat()
             }
         )
+
+
+@router.get("/metrics", response_model=Dict[str, Any])
+async def get_analysis_metrics():
+    """
+    Returns in-process counters for the ingredient analysis pipeline.
+    """
+    return {
+        "ingredient_single_flight": ingredient_single_flight.stats(),
+        "ingredient_cache": ingredient_cache.stats(),
+        "upstreams": upstream_scheduler.stats(),
+        "response_cache": await disk_cache.astats(),
+        "ingredient_research": get_research_stats(),
+        "product_analysis_cache": get_product_analysis_stats(),
+        "jobs": await job_queue.stats(),
+        "models": model_registry.stats(),
+        "inference": inference_pool.stats(),
+        "detection_batches": detection_batcher.stats() if detection_batcher else None,
+        "timestamp": datetime.now(tz=pytz.timezone('Asia/Kolkata')).isoformat()
+    }
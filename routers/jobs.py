@@ -0,0 +1,58 @@
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+
+from db.models import User
+from logger_manager import log_info
+from services.auth_service import get_current_user_optional
+from services.job_queue import job_queue
+from utils.sse import SSE_HEADERS, SSE_MEDIA_TYPE, sse_comment, sse_event
+
+router = APIRouter()
+
+
+def job_accepted_response(job_id: str) -> Dict[str, Any]:
+    """Body of the 202 response of an endpoint that queued a background job."""
+    return {
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/api/jobs/{job_id}",
+        "events_url": f"/api/jobs/{job_id}/events",
+    }
+
+
+async def _get_visible_job(job_id: str, current_user: Optional[User]) -> Dict[str, Any]:
+    # jobs of a user are theirs only, others get the same 404 as for a missing job
+    job = await job_queue.get(job_id)
+    if job is None or (job["user_id"] is not None and (current_user is None or current_user.id != job["user_id"])):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/{job_id}", response_model=Dict[str, Any])
+async def get_job(job_id: str, current_user: Optional[User] = Depends(get_current_user_optional)):
+    """
+    Returns a background job's status, progress and, once finished, its result or error.
+    Jobs started by a signed-in user are only returned to that user.
+    """
+    return await _get_visible_job(job_id, current_user)
+
+
+@router.get("/{job_id}/events")
+async def stream_job_events(job_id: str, current_user: Optional[User] = Depends(get_current_user_optional)):
+    """
+    Streams a background job's state as server-sent events, one per change,
+    until it succeeded or failed. Same access rules as /api/jobs/{job_id}.
+    """
+    await _get_visible_job(job_id, current_user)
+    log_info(f"Streaming events for job {job_id}")
+
+    async def stream():
+        async for job in job_queue.events(job_id):
+            if job is None:
+                yield sse_comment()
+            else:
+                yield sse_event(job, event=job["status"])
+
+    return StreamingResponse(stream(), media_type=SSE_MEDIA_TYPE, headers=SSE_HEADERS)
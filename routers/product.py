@@ -1,36 +1,35 @@
-from datetime import datetime
-import io
 from fastapi import APIRouter, Request, HTTPException, File, UploadFile, Form
 from fastapi.responses import JSONResponse, FileResponse
 from typing import List, Dict, Any
-from logger_manager import log_debug, log_info, log_error
+from logger_manager import log_debug, log_info, log_error, log_warning
 import os
 from services.auth_service import get_current_user
 from services.product_service import ProductService
-from db.models import Marker, Product
+from db.models import Marker
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from interfaces.productModels import ProductCreate
 from typing import Generator
-import numpy as np
-import tensorflow as tf # Ensure TensorFlow is imported
-import tensorflow_hub as hub
-from PIL import Image, ImageDraw, ImageFont, ImageOps
+from PIL import ImageDraw, ImageFont, ImageOps
 import requests
 from io import BytesIO # Keep BytesIO as it's used with PIL
 
-from db.database import get_db
+from db.database import get_async_db, get_db
 from fastapi import Depends
-from db.repositories import ProductRepository, IngredientRepository
+from db.repositories import AsyncProductRepository
 
 
 
 from services.ingredients import IngredientService 
+from services.job_queue import job_queue
 from services.productAnalyzerAgent import analyze_product_ingredients
-from utils.analyze import process_product_ingredients
-from utils.db_utils import add_product_to_database
+from services.product_jobs import ADD_PRODUCT_JOB, create_product as create_product_with_analysis
+from routers.jobs import job_accepted_response
+from utils.detection import crop_original, prepare_image, run_object_detection
+from utils.detection_postprocess import best_detection
 from utils.fetch_data import fetch_product_data_from_api
+from utils.inference_pool import InferencePoolFull, inference_pool
 import uuid
-import json
 
 # import environment variables
 from env import FAKE_TARGET_IMAGE_NAME, SEND_FAKE_TARGET,UPLOADED_IMAGES_DIR, VUFORIA_SERVER_ACCESS_KEY,VUFORIA_SERVER_SECRET_KEY,VUFORIA_TARGET_DATABASE_NAME,VUFORIA_TARGET_DATABASE_ID
@@ -38,58 +37,25 @@ from env import FAKE_TARGET_IMAGE_NAME, SEND_FAKE_TARGET,UPLOADED_IMAGES_DIR, VU
 router = APIRouter()
 
 
-TARGET_CLASSES = set(["Food processor", "Fast food", "Food", "Seafood", "Snack"])
-
-def run_object_detection(image: Image.Image, request: Request):
-    # Access the model from app state
-    detector = request.app.state.detector
-    image_np = np.array(image)
-    input_tensor = tf.convert_to_tensor(image_np)[tf.newaxis, ...]
-    input_tensor = tf.cast(input_tensor, tf.float32) / 255.0
-    results = detector(input_tensor)
-    results = {k: v.numpy() for k, v in results.items()}
-    return results, image_np
-
 def get_filtered_class_boxes(results):
-    # for same class, keep the one with the highest score
-    # and remove duplicates
-    high_boxes = None
-    high_classes = None
-    high_scores = None
-
-    for i in range(len(results["detection_scores"])):
-        class_name = results["detection_class_entities"][i].decode("utf-8")
-        box = results["detection_boxes"][i]
-        score = results["detection_scores"][i]
-        if class_name in TARGET_CLASSES:
-            if high_boxes is None:
-                high_boxes = box
-                high_classes = class_name
-                high_scores = score
-            else:
-                if score > high_scores:
-                    high_boxes = box
-                    high_classes = class_name
-                    high_scores = score
-    return high_boxes, high_classes, high_scores
-
-def crop_image(image_np, box):
-    ymin, xmin, ymax, xmax = box
-    im_width, im_height = image_np.shape[1], image_np.shape[0]
-    (left, right, top, bottom) = (xmin * im_width, xmax * im_width,
-                                    ymin * im_height, ymax * im_height)
-    cropped_image = image_np[int(top):int(bottom), int(left):int(right)]
-    return Image.fromarray(cropped_image)
-
-
+    # highest scoring detection of a target class, see utils.detection_postprocess
+    detection = best_detection(results)
+    if detection is None:
+        return None, None, None
+    return detection.box, detection.class_name, detection.score
 
 
 @router.post("/add")
 async def create_product(
     request: Request,
-    db: Session = Depends(get_db)
+    background: bool = False,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Endpoint to add a new product, its ingredients, and associated markers."""
+    """Endpoint to add a new product, its ingredients, and associated markers.
+
+    With background=true the product is created by a background job, the
+    response (202) has the job id to poll /api/jobs/{job_id} with.
+    """
     try:
         log_info("Create product endpoint called")
         # Get the request body
@@ -106,43 +72,6 @@ async def create_product(
         log_debug(f"Received product name: {name}")
         log_debug(f"Received ingredients: {ingredients_list}")
         log_debug(f"Received image name: {image_name}")
-            
-        # Save the uploaded image
-        image_path = os.path.join(UPLOADED_IMAGES_DIR, image_name)
-
-        # analyze the product ingredients
-        results = await process_product_ingredients(ingredients_list)
-        
-        # extract data from the analysis results 
-        #         result = {
-        #     "ingredients_count": len(product_ingredients),
-        #     "processed_ingredients": ingredient_results,
-        #     "ingredient_ids": product_analysis["ingredient_ids"],
-        #     "overall_analysis": product_analysis,
-        #     "timestamp": datetime.now(tz=pytz.timezone('Asia/Kolkata')).isoformat()
-        # }
-        # {{
-        # "overall_safety_score": (number between 1-10),
-        # "suitable_diet_types": (strings from "Vegan", "Vegetarian", "Non-Vegetarian"),
-        # "allergy_warnings": (array of strings),
-        # "usage_recommendations": (string with specific guidance),
-        # "health_insights": {{
-        # "benefits": (array of strings),
-        # "concerns": (array of strings)
-        # }},
-        # "ingredient_interactions": (array of strings),
-        # "key_takeaway": (string)
-        # }}
-        
-        # Check if the analysis results are valid
-        analysis_results = results.get("overall_analysis", {})
-        overall_safety_score = analysis_results.get("overall_safety_score", 5)
-        suitable_diet_types = analysis_results.get("suitable_diet_types", [])
-        allergy_warnings = analysis_results.get("allergy_warnings", [])
-        usage_recommendations = analysis_results.get("usage_recommendations", "")
-        health_insights = analysis_results.get("health_insights", {})
-        ingredient_interactions = analysis_results.get("ingredient_interactions", [])
-        key_takeaway = analysis_results.get("key_takeaway", "")
         
         current_user_id = 0
         try:
@@ -153,67 +82,74 @@ async def create_product(
             log_error("User not authenticated, using default user ID")
             current_user_id = 0  # Default user ID, change as needed
         
-        # Create product data model
-        product_create_data = ProductCreate(
-            product_name=name,
-            ingredients=json.dumps(ingredients_list),
-            overall_safety_score=overall_safety_score,
-            suitable_diet_types=json.dumps(suitable_diet_types),
-            allergy_warnings=json.dumps(allergy_warnings),
-            usage_recommendations=usage_recommendations,
-            health_insights=json.dumps(health_insights),
-            ingredient_interactions=json.dumps(ingredient_interactions),
-            key_takeaway=json.dumps(key_takeaway),
-            ingredients_count=results.get("ingredients_count", 0),
-            user_id=current_user_id,  # Can be updated later if needed
-            timestamp=results.get("timestamp", datetime.now().isoformat()),
-            ingredient_ids=json.dumps(results.get("ingredient_ids", [])),
-        )
-
-
-        # Add product to database
-        product_repo = ProductRepository(db)
-        product = product_repo.add_product(product_create_data)
-        
-        print(product)
-        
-        # Add Vuforia target if needed
-        await add_product_to_database(product.id, [image_name], db, {
+        product_data = {
             "name": name,
-            "ingredients": ingredients_list,
             "image_name": image_name,
-        })
+            "ingredients_list": ingredients_list,
+            "user_id": current_user_id,
+        }
+        if background:
+            job_id = await job_queue.submit(ADD_PRODUCT_JOB, product_data, user_id=current_user_id or None)
+            return JSONResponse(job_accepted_response(job_id), status_code=202)
         
-        return JSONResponse({
-            "message": "Product data and image processed successfully",
-            "product_id": product.id,
-            "image_name": image_name
-        })
+        # analyze the ingredients, save the product and add its marker
+        result = await create_product_with_analysis(db, **product_data)
+        return JSONResponse(result)
     except Exception as e:
         log_error(f"Error creating product: {e}", e)
         print(e)
         return JSONResponse({"error": str(e)}, status_code=500)
 
 
+def detect_food(image_data: bytes, timings: Dict[str, float]):
+    """Blocking part of process_image, runs on the inference pool.
+
+    Returns the detected class name and score and the saved crop's name,
+    or None when there's no food in the image.
+    """
+    # decoded at the detector's working size, not the camera's
+    with inference_pool.timed("decode", timings):
+        prepared = prepare_image(image_data)
+
+    with inference_pool.timed("inference", timings):
+        results, _ = run_object_detection(prepared.array)
+
+    with inference_pool.timed("postprocess", timings):
+        box, class_name, score = get_filtered_class_boxes(results)
+    if box is None:
+        return None
+
+    # Crop the detected object from the full resolution upload and save it temporarily
+    with inference_pool.timed("crop_save", timings):
+        cropped_img = crop_original(image_data, box)
+        unique_id = uuid.uuid4().hex
+        cropped_image_name = f"detected_{class_name}_{score:.2f}_{unique_id}.jpg"
+        cropped_image_path = os.path.join(
+            UPLOADED_IMAGES_DIR, cropped_image_name
+        )
+        cropped_img.save(cropped_image_path)
+    return class_name, score, cropped_image_name
+
+
 @router.post("/process_image")
 async def process_image_endpoint(image: UploadFile = File(...), db: Session = Depends(get_db), request: Request = None):
     """
     Receives an image file, performs object detection, and returns information about detected objects.
+    Answers 503 when the inference pool is saturated.
     """
     log_info("Process image endpoint called")
     try:
         # Read image from the uploaded file
         image_data = await image.read()
-        image = Image.open(io.BytesIO(image_data)).convert("RGB")
 
-        # Run object detection with the request object
-        results, image_np = run_object_detection(image, request)
-
-        # Get filtered class boxes
-        box, class_name, score = get_filtered_class_boxes(results)
+        # Decode, detect and crop off the event loop
+        timings = {}
+        detection = await inference_pool.run(detect_food, image_data, timings)
+        log_debug(f"Image processing timings: {timings}")
+        server_timing = {"Server-Timing": ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())}
         
         # Check if any objects were detected
-        if box is None:
+        if detection is None:
             log_info("No food objects detected in image")
             # if send dummy target is allowed send default image
             if SEND_FAKE_TARGET:
@@ -222,29 +158,22 @@ async def process_image_endpoint(image: UploadFile = File(...), db: Session = De
                     "score": float(0.24),
                     "image_name": FAKE_TARGET_IMAGE_NAME,
                     "detected": True
-                })
+                }, headers=server_timing)
             return JSONResponse({
                 "error": "No food objects detected in the image",
                 "detected": False
-            }, status_code=400)
-
-        # Crop the detected object
-        cropped_img = crop_image(image_np, box)
-
-        # Save the cropped image temporarily
-        unique_id = uuid.uuid4().hex
-        cropped_image_name = f"detected_{class_name}_{score:.2f}_{unique_id}.jpg"
-        cropped_image_path = os.path.join(
-            UPLOADED_IMAGES_DIR, cropped_image_name
-        )
-        cropped_img.save(cropped_image_path)
+            }, status_code=400, headers=server_timing)
 
+        class_name, score, cropped_image_name = detection
         return JSONResponse({
             "class_name": class_name,
             "score": float(score),
             "image_name": cropped_image_name,
             "detected": True
-        })
+        }, headers=server_timing)
+    except InferencePoolFull as e:
+        log_warning(f"Rejected image, {e}")
+        raise HTTPException(status_code=503, detail="Image processing is busy, please retry", headers={"Retry-After": "1"})
     except Exception as e:
         log_error(f"Error processing image: {e}", e)
         raise HTTPException(status_code=500, detail=f"Error processing image: {e}")
@@ -284,10 +213,10 @@ async def get_image(image_name: str):
     
 # In your API, add an endpoint like:
 @router.get("/marker/{vuforia_id}")
-async def get_product_by_marker(vuforia_id: str, db: Session = Depends(get_db)):
-    marker = db.query(Marker).filter(Marker.vuforia_id == vuforia_id).first()
+async def get_product_by_marker(vuforia_id: str, db: AsyncSession = Depends(get_async_db)):
+    marker = (await db.execute(select(Marker).where(Marker.vuforia_id == vuforia_id).limit(1))).scalars().first()
     if not marker:
         raise HTTPException(status_code=404, detail="Target not found")
     
-    product = db.query(Product).filter(Product.id == marker.product_id).first()
+    product = await AsyncProductRepository(db).get_product_by_id(marker.product_id)
     return product
\ No newline at end of file
@@ -0,0 +1,156 @@
+"""Convert the food detector from the model store to ONNX and/or TFLite.
+
+Run from the repository root, with tensorflow and tensorflow_hub installed
+(tf2onnx for onnx, onnxruntime for quantized onnx):
+
+    python scripts/convert_detector.py --formats onnx tflite --quantize dynamic
+
+Writes detector.onnx, detector.tflite and labels.json next to the SavedModel
+in MODEL_STORE_DIR/food_detector/<FOOD_DETECTOR_VERSION>, where the onnx and
+tflite backends (DETECTOR_BACKEND) load them. The converted models output
+class labels only, labels.json maps them to entity names. It's the full
+label table of the SavedModel (or the label map given with --label-map),
+the conversion fails when a target class is missing from it.
+
+Check the result with scripts/detector_parity.py before switching backends.
+"""
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from utils.detection import prepare_image
+from utils.detection_backends import LABELS_FILE, ONNX_MODEL_FILE, TFLITE_MODEL_FILE
+from utils.detection_postprocess import TARGET_CLASSES
+from utils.model_registry import FOOD_DETECTOR, model_registry
+
+IMAGE_PATTERNS = ("*.jpg", "*.jpeg", "*.png")
+
+
+def calibration_images(directory):
+    paths = []
+    for pattern in IMAGE_PATTERNS:
+        paths.extend(glob.glob(os.path.join(directory, "**", pattern), recursive=True))
+    if not paths:
+        sys.exit(f"No calibration images found in {directory}")
+    for path in sorted(paths):
+        with open(path, "rb") as f:
+            yield path, prepare_image(f.read()).array
+
+
+def saved_model_labels(model_dir):
+    """label -> entity name, read from the SavedModel's label lookup table."""
+    import tensorflow as tf
+    from tensorflow.core.protobuf import saved_model_pb2
+
+    saved_model = saved_model_pb2.SavedModel()
+    with open(os.path.join(model_dir, "saved_model.pb"), "rb") as f:
+        saved_model.ParseFromString(f.read())
+    tags = list(saved_model.meta_graphs[0].meta_info_def.tags)
+
+    # the signature maps labels to entities with a hash table, export it whole
+    best = {}
+    with tf.Graph().as_default() as graph, tf.compat.v1.Session(graph=graph) as sess:
+        tf.compat.v1.saved_model.loader.load(sess, tags, model_dir)
+        for op in graph.get_operations():
+            if op.type not in ("HashTableV2", "MutableHashTableV2"):
+                continue
+            key_dtype, value_dtype = op.get_attr("key_dtype"), op.get_attr("value_dtype")
+            if not key_dtype.is_integer or value_dtype != tf.string:
+                continue
+            keys, values = sess.run(tf.raw_ops.LookupTableExportV2(
+                table_handle=op.outputs[0], Tkeys=key_dtype, Tvalues=value_dtype,
+            ))
+            table = {int(label): entity.decode("utf-8") for label, entity in zip(keys, values)}
+            # there's also a label -> /m/ id table, the entity names are the one with the target classes
+            if len(TARGET_CLASSES & set(table.values())) > len(TARGET_CLASSES & set(best.values())):
+                best = table
+    return best
+
+
+def collect_labels(model_dir, label_map=None):
+    """Write labels.json with the detector's full label -> entity name table."""
+    if label_map:
+        with open(label_map) as f:
+            labels = {int(label): entity for label, entity in json.load(f).items()}
+    else:
+        labels = saved_model_labels(model_dir)
+
+    missing = TARGET_CLASSES - set(labels.values())
+    if missing:
+        sys.exit(f"No label for {', '.join(sorted(missing))} in the "
+                 f"{'label map' if label_map else 'SavedModel'}, the converted models would never detect them")
+
+    labels_path = os.path.join(model_dir, LABELS_FILE)
+    with open(labels_path, "w") as f:
+        json.dump({str(label): entity for label, entity in sorted(labels.items())}, f, indent=2)
+    print(f"Wrote {labels_path} ({len(labels)} labels)")
+
+
+def convert_onnx(model_dir, quantize, opset):
+    output = os.path.join(model_dir, ONNX_MODEL_FILE)
+    subprocess.run([
+        sys.executable, "-m", "tf2onnx.convert",
+        "--saved-model", model_dir,
+        "--signature_def", "default",
+        "--opset", str(opset),
+        "--output", output,
+    ], check=True)
+    if quantize != "none":
+        # ONNX Runtime only quantizes the weights here, int8 activations need a calibrated model
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(output, output, weight_type=QuantType.QUInt8)
+    print(f"Wrote {output}")
+
+
+def convert_tflite(model_dir, quantize, images, allow_tf_ops):
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_saved_model(model_dir, signature_keys=["default"])
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS]
+    if allow_tf_ops:
+        # ops without a TFLite kernel run through the Flex delegate, which needs tensorflow at runtime
+        converter.target_spec.supported_ops.append(tf.lite.OpsSet.SELECT_TF_OPS)
+    if quantize != "none":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantize == "int8":
+        def representative_dataset():
+            for _, image in images:
+                yield [image[np.newaxis, ...].astype(np.float32) / 255.0]
+        converter.representative_dataset = representative_dataset
+
+    output = os.path.join(model_dir, TFLITE_MODEL_FILE)
+    with open(output, "wb") as f:
+        f.write(converter.convert())
+    print(f"Wrote {output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--formats", nargs="+", choices=["onnx", "tflite"], default=["onnx", "tflite"])
+    parser.add_argument("--quantize", choices=["none", "dynamic", "int8"], default="dynamic",
+                        help="dynamic: int8 weights, int8: also int8 activations (tflite only, calibrated on the images)")
+    parser.add_argument("--calibration-dir", default="trials", help="images for int8 calibration")
+    parser.add_argument("--label-map", help="JSON label -> entity name table to use instead of the SavedModel's")
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--allow-tf-ops", action="store_true", help="tflite: fall back to TensorFlow ops the converter can't map")
+    args = parser.parse_args()
+
+    model_dir = model_registry.resolve(FOOD_DETECTOR)
+    print(f"Converting {model_dir}")
+    collect_labels(model_dir, args.label_map)
+    images = list(calibration_images(args.calibration_dir)) if args.quantize == "int8" else []
+    if "onnx" in args.formats:
+        convert_onnx(model_dir, args.quantize, args.opset)
+    if "tflite" in args.formats:
+        convert_tflite(model_dir, args.quantize, images, args.allow_tf_ops)
+
+
+if __name__ == "__main__":
+    main()
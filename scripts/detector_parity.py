@@ -0,0 +1,102 @@
+"""Compare a converted detector backend with the TF Hub SavedModel.
+
+Run from the repository root after scripts/convert_detector.py:
+
+    python scripts/detector_parity.py --backend onnx
+    python scripts/detector_parity.py --backend tflite --images trials
+
+For every image both backends run on the same pre-processed input, and
+the best target-class detection (what process_image returns) has to match:
+same class, boxes overlapping by at least --min-iou, scores within
+--max-score-diff. Exits with 1 when any image doesn't match.
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from utils.detection import prepare_image
+from utils.detection_backends import BACKENDS, TFHubBackend
+from utils.detection_postprocess import best_detection
+
+IMAGE_PATTERNS = ("*.jpg", "*.jpeg", "*.png")
+
+
+def iou(a, b):
+    ymin, xmin = max(a[0], b[0]), max(a[1], b[1])
+    ymax, xmax = min(a[2], b[2]), min(a[3], b[3])
+    intersection = max(ymax - ymin, 0) * max(xmax - xmin, 0)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def timed_detect(backend, image):
+    started = time.perf_counter()
+    results = backend.detect(image[np.newaxis, ...])
+    return results, time.perf_counter() - started
+
+
+def compare(reference, candidate, min_iou, max_score_diff):
+    """None when the best detections match, else why not."""
+    if reference is None or candidate is None:
+        return None if reference is candidate else f"detected {reference and reference.class_name} vs {candidate and candidate.class_name}"
+    if reference.class_name != candidate.class_name:
+        return f"class {reference.class_name} vs {candidate.class_name}"
+    overlap = iou(reference.box, candidate.box)
+    if overlap < min_iou:
+        return f"box IoU {overlap:.2f}"
+    if abs(reference.score - candidate.score) > max_score_diff:
+        return f"score {reference.score:.3f} vs {candidate.score:.3f}"
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=[name for name in BACKENDS if name != TFHubBackend.name], required=True)
+    parser.add_argument("--images", default="trials")
+    parser.add_argument("--min-iou", type=float, default=0.8)
+    parser.add_argument("--max-score-diff", type=float, default=0.05)
+    args = parser.parse_args()
+
+    paths = sorted(p for pattern in IMAGE_PATTERNS for p in glob.glob(os.path.join(args.images, "**", pattern), recursive=True))
+    if not paths:
+        sys.exit(f"No images found in {args.images}")
+
+    reference_backend = TFHubBackend()
+    candidate_backend = BACKENDS[args.backend]()
+    # first calls pay for loading and tracing, not part of the timings
+    reference_backend.warm_up()
+    candidate_backend.warm_up()
+
+    failures = 0
+    timings = {"tfhub": [], args.backend: []}
+    for path in paths:
+        with open(path, "rb") as f:
+            image = prepare_image(f.read()).array
+        reference_results, reference_seconds = timed_detect(reference_backend, image)
+        candidate_results, candidate_seconds = timed_detect(candidate_backend, image)
+        timings["tfhub"].append(reference_seconds)
+        timings[args.backend].append(candidate_seconds)
+
+        reference = best_detection(reference_results)
+        candidate = best_detection(candidate_results)
+        mismatch = compare(reference, candidate, args.min_iou, args.max_score_diff)
+        failures += mismatch is not None
+        detected = f"{reference.class_name} {reference.score:.3f}" if reference else "nothing"
+        print(f"{'FAIL' if mismatch else 'ok  '} {path}: {detected}"
+              f"{f' ({mismatch})' if mismatch else ''}"
+              f" [tfhub {reference_seconds * 1000:.0f}ms, {args.backend} {candidate_seconds * 1000:.0f}ms]")
+
+    for name, seconds in timings.items():
+        print(f"{name}: {np.mean(seconds) * 1000:.1f}ms per image")
+    print(f"{len(paths) - failures}/{len(paths)} images match")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,9 +3,10 @@ from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy import func
-from sqlalchemy.orm import Session,Mapped
-from db.database import get_db
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session,Mapped,selectinload
+from db.database import get_async_db, get_db
 from db.models import User
 from interfaces.authModels import UserResponse,TokenData
 from logger_manager import log_info, log_error
@@ -46,6 +47,18 @@ def get_user(db, email: str):
         log_error(f"Error getting user: {str(e)}",e)
         raise HTTPException(status_code=500, detail=str(e))
 
+async def get_user_async(db: AsyncSession, email: str):
+    """Get a user on an async session, preferences are loaded eagerly."""
+    log_info(f"Getting user: {email}")
+    try:
+        result = await db.execute(
+            select(User).options(selectinload(User.preferences)).where(func.lower(User.email) == email.lower())
+        )
+        return result.scalars().first()
+    except Exception as e:
+        log_error(f"Error getting user: {str(e)}",e)
+        raise HTTPException(status_code=500, detail=str(e))
+
 def authenticate_user(db: Session, username: str, password: str):
     user = db.query(User).filter(func.lower(User.email) == username.lower()).first()
     if not user:
@@ -98,7 +111,7 @@ async def get_token_from_request(request: Request = None, oauth_token: str = Non
 # Replace or add this function
 async def get_current_user(
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     oauth_token: str = Depends(oauth2_scheme_optional)
 ):
     """Enhanced user authentication that supports both standard OAuth2
@@ -137,7 +150,7 @@ async def get_current_user(
         raise HTTPException(status_code=500, detail=str(e))
     
     # Find the user
-    user = get_user(db, email=token_data.email)
+    user = await get_user_async(db, email=token_data.email)
     if user is None:
         log_error(f"User not found: {token_data.email}")
         raise credentials_exception
@@ -147,7 +160,7 @@ async def get_current_user(
 # Add this function for active users with flexible auth
 async def get_current_active_user(
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     oauth_token: str = Depends(oauth2_scheme_optional)
 ):
     """Get active user with flexible authentication"""
@@ -158,6 +171,16 @@ async def get_current_active_user(
         
     return UserResponse.from_orm(current_user)
 
+async def get_current_user_optional(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    oauth_token: str = Depends(oauth2_scheme_optional)
+):
+    """The current user, None when the request has no token (an invalid token is still rejected)"""
+    if not await get_token_from_request(request, oauth_token):
+        return None
+    return await get_current_user(request, db, oauth_token)
+
 async def get_current_user_old(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
     log_info("Getting current user")
     credentials_exception = HTTPException(
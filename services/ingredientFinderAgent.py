@@ -1,19 +1,30 @@
 import asyncio
-from functools import partial
 import os
 import json
 import traceback
-from typing import Dict, Any
-
-from langchain_google_genai import ChatGoogleGenerativeAI
+from collections import Counter
+from typing import Dict, Any, List, Optional
 
 # modular
 from interfaces.ingredientModels import IngredientAnalysisResult,IngredientState
 from logger_manager import log_debug, log_error, log_info, log_warning
+from services.llm_provider import get_ingredient_llm
 from utils.agent_tools import search_local_db,search_web,search_wikipedia,search_open_food_facts,search_usda,search_pubchem
+from utils.agent_tools import additive_index,local_db_result
+from utils.agent_tools import async_search_local_db,async_search_web,async_search_wikipedia,async_search_open_food_facts,async_search_usda,async_search_pubchem
+from utils.deadline import remaining_time, within_deadline
+from utils.text_utils import normalize_ingredient_name
+from utils.upstream_scheduler import upstream_scheduler
 
 # Load environment variables from .env file
-from env import GOOGLE_API_KEY, LLM_MODEL_NAME
+from env import (
+    LLM_ANALYSIS_BATCH_SIZE,
+    RESEARCH_ANALYSIS_RESERVE_SECONDS,
+    RESEARCH_DEADLINE_SECONDS,
+    RESEARCH_MIN_SOURCES,
+    RESEARCH_MODE,
+    RESEARCH_TIER_TIMEOUT,
+)
 
 def create_summary_from_source(source: Dict[str, Any]) -> str:
     """Create a meaningful summary from source data."""
@@ -27,9 +38,9 @@ def create_summary_from_source(source: Dict[str, Any]) -> str:
     if source_name == "Local DB":
         if isinstance(source_data, dict):
             # Get the most informative fields from local DB
-            return f"E-Number: {source_data.get('E No.', 'N/A')}, " \
-                   f"Category: {source_data.get('Functional Class', 'N/A')}, " \
-                   f"Description: {source_data.get('Main Use', '')[:100]}..."
+            return f"E-Number: {source_data.get('E Numbers') or 'N/A'}, " \
+                   f"Name: {source_data.get('Name of Additive') or 'N/A'}, " \
+                   f"Description: {(source_data.get('Description') or '')[:100]}..."
     
     elif source_name == "DuckDuckGo":
         if isinstance(source_data, list) and source_data:
@@ -78,63 +89,70 @@ def create_summary_from_source(source: Dict[str, Any]) -> str:
     # Default for unknown or complex sources
     return f"Found data from {source_name} ({type(source_data).__name__})"
 
-def analyze_ingredient(state: IngredientState) -> IngredientState:
-    """Analyze ingredient data with LLM to generate structured information.
-    
-    Takes the current state with collected sources_data and uses an LLM to generate
-    a comprehensive analysis of the ingredient including safety rating, health effects,
-    description, and alternate names.
-    
-    Args:
-        state: The current IngredientState containing all collected data
-        
-    Returns:
-        Updated state with analysis results
-    """
-    
-    # Basic validation
-    if not GOOGLE_API_KEY:
-        log_error("No Google API key found in environment variables")
-        new_state = state.copy()
-        new_state["result"] = {
-            "name": state["ingredient"],
-            "is_found": False,
-            "description": "Error: Missing API credentials for analysis"
-        }
-        new_state["analysis_done"] = True
-        new_state["status"] = "analysis_error"
-        return new_state
-    
-    # Initialize LLM
-    try:
-        llm = ChatGoogleGenerativeAI(
-            google_GOOGLE_API_KEY=GOOGLE_API_KEY,
-            model=LLM_MODEL_NAME,
-            temperature=0.3,  # Lower temperature for more factual responses
-            # convert_system_message_to_human=True
-        )
-    except Exception as e:
-        log_error(f"Error initializing LLM: {e}",e)
-        new_state = state.copy()
-        new_state["result"] = {
-            "name": state["ingredient"],
-            "is_found": False,
-            "description": f"Error initializing LLM: {str(e)}"
-        }
-        new_state["analysis_done"] = True
-        new_state["status"] = "analysis_error"
-        return new_state
-    
-    # Get sources from state
+# What the LLM is asked for, shared by the single and the batched prompt
+ANALYSIS_INSTRUCTIONS = """
+        1. Safety rating (scale 1-10, where 1=unsafe for consumption, 5=moderate concerns, 10=very safe)
+        2. List of potential health effects (both positive & negative, maximum 5 points)
+        3. Brief description of what this ingredient is, how it's used, and its properties
+        4. Alternative names for this ingredient
+        5. Allergic information of the ingredient like which type of allergies we can got, etc.
+        6. Diet Type of that ingredient like Vegan, Vegetarian, Non-Vegetarian
+"""
+
+ANALYSIS_FIELDS = """
+        - "safety_rating": (number between 1-10)
+        - "health_effects": (array of strings)
+        - "description": (string)
+        - "alternate_names": (array of strings)
+        - "allergic_info": (array of strings)
+        - "diet_type" : (string from vegan,vegetarian,non-vegetarian,unknown)
+"""
+
+ANALYSIS_GUIDELINES = """
+        Only include factual information supported by the provided data. If information is 
+        unavailable for any field, use appropriate default values. But if information is too obvious you can fill appropriate information just make sure only relevant data is there in the output.
+"""
+
+
+def _error_state(state: IngredientState, description: str) -> IngredientState:
+    new_state = state.copy()
+    new_state["result"] = {
+        "name": state["ingredient"],
+        "is_found": False,
+        "description": description
+    }
+    new_state["analysis_done"] = True
+    new_state["status"] = "analysis_error"
+    return new_state
+
+
+def _complete_state(state: IngredientState, result: Dict[str, Any]) -> IngredientState:
+    new_state = state.copy()
+    new_state["result"] = result
+    new_state["analysis_done"] = True
+    new_state["status"] = "analysis_complete"
+    return new_state
+
+
+def _timed_out_state(state: IngredientState) -> IngredientState:
+    # the deadline passed before the LLM answered, keep what the sources found
+    result = _default_result(state)
+    result["description"] = "Analysis timed out, the information below is incomplete."
+    result["timed_out"] = True
+    new_state = _complete_state(state, result)
+    new_state["status"] = "analysis_timed_out"
+    return new_state
+
+
+def _found_sources(state: IngredientState) -> List[Dict[str, Any]]:
+    return [source for source in state["sources_data"] if source.get('found', False)]
+
+
+def _default_result(state: IngredientState) -> Dict[str, Any]:
+    """Result structure before analysis, with the per-source summaries."""
     sources_data = state["sources_data"]
-    log_info(f"Analyzing ingredient with {len(sources_data)} total sources")
-    
-    # Filter for successful sources only
-    found_sources = [source for source in sources_data if source.get('found', False)]
-    log_info(f"Found {len(found_sources)} sources with usable data")
-    
-    # Create default result structure
-    result = {
+    found_sources = _found_sources(state)
+    return {
         "name": state["ingredient"],
         "alternate_names": [],
         "is_found": len(found_sources) > 0,
@@ -146,120 +164,282 @@ def analyze_ingredient(state: IngredientState) -> IngredientState:
                 "source": source.get("source", "Unknown"),
                 "found": source.get("found", False),
                 "summary": create_summary_from_source(source) if source.get("found", False) else "No data found",
+                "tier": source.get("tier"),
+                "timed_out": source.get("timed_out", False),
             }
             for source in sources_data
         ]
     }
-    
-    # If we have data, analyze it
-    if found_sources:
-        # Format source data for the prompt
-        source_texts = []
-        for i, source in enumerate(found_sources):
-            source_name = source.get('source', f'Source {i+1}')
-            source_data = source.get('data')
+
+
+def _format_sources(found_sources: List[Dict[str, Any]]) -> str:
+    """Format source data for the prompt."""
+    source_texts = []
+    for i, source in enumerate(found_sources):
+        source_name = source.get('source', f'Source {i+1}')
+        source_data = source.get('data')
+        
+        # Process different data formats appropriately
+        try:
+            if isinstance(source_data, dict):
+                source_text = format_dict_source(source_name, source_data)
+            elif isinstance(source_data, list):
+                source_text = format_list_source(source_name, source_data)
+            elif isinstance(source_data, str):
+                # For string data, include as is (limiting length)
+                source_text = f"--- {source_name} ---\n{source_data[:1500]}"
+            else:
+                # For other types, convert to string
+                source_text = f"--- {source_name} ---\n{str(source_data)[:1000]}"
             
-            # Process different data formats appropriately
-            try:
-                if isinstance(source_data, dict):
-                    source_text = format_dict_source(source_name, source_data)
-                elif isinstance(source_data, list):
-                    source_text = format_list_source(source_name, source_data)
-                elif isinstance(source_data, str):
-                    # For string data, include as is (limiting length)
-                    source_text = f"--- {source_name} ---\n{source_data[:1500]}"
-                else:
-                    # For other types, convert to string
-                    source_text = f"--- {source_name} ---\n{str(source_data)[:1000]}"
-                
-                source_texts.append(source_text)
-            except Exception as e:
-                log_error(f"Error formatting source {source_name}: {e}",e)
-                source_texts.append(f"--- {source_name} ---\nError formatting data: {str(e)}")
-        
-        # Combine all source texts
-        combined_data = "\n\n".join(source_texts)
-        log_info(f"Combined data for analysis:\n{combined_data[:500]}...(truncated)")
-        
-        # Create the analysis prompt
-        analysis_prompt = f"""
+            source_texts.append(source_text)
+        except Exception as e:
+            log_error(f"Error formatting source {source_name}: {e}",e)
+            source_texts.append(f"--- {source_name} ---\nError formatting data: {str(e)}")
+    
+    # Combine all source texts
+    return "\n\n".join(source_texts)
+
+
+def _apply_analysis(result: Dict[str, Any], analysis: Dict[str, Any]):
+    # Update result with analyzed data
+    result.update({
+        "safety_rating": analysis.get("safety_rating", 5),
+        "description": analysis.get("description", "No description available."),
+        "health_effects": analysis.get("health_effects", []),
+        "alternate_names": analysis.get("alternate_names", []),
+        "allergic_info": analysis.get("allergic_info", []),
+        "diet_type": analysis.get("diet_type", "unknown"),
+    })
+
+
+def _is_string_list(value: Any) -> bool:
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+
+def _validate_batch_entry(entry: Any) -> Optional[Dict[str, Any]]:
+    """Check one entry of a batched response, returns the cleaned entry or None."""
+    if not isinstance(entry, dict):
+        return None
+    rating = entry.get("safety_rating")
+    if isinstance(rating, bool) or not isinstance(rating, (int, float)) or not 1 <= rating <= 10:
+        return None
+    if not isinstance(entry.get("description"), str) or not entry["description"].strip():
+        return None
+    if not _is_string_list(entry.get("health_effects")):
+        return None
+    for key in ("alternate_names", "allergic_info"):
+        if key in entry and not _is_string_list(entry[key]):
+            return None
+    if "diet_type" in entry and not isinstance(entry["diet_type"], str):
+        return None
+    return {**entry, "safety_rating": int(round(rating))}
+
+
+def _build_analysis_prompt(state: IngredientState, found_sources: List[Dict[str, Any]]) -> str:
+    combined_data = _format_sources(found_sources)
+    log_info(f"Combined data for analysis:\n{combined_data[:500]}...(truncated)")
+    
+    # Create the analysis prompt
+    return f"""
         Task: Analyze food ingredient data and provide a structured assessment.
         
         Ingredient: {state["ingredient"]}
         
         Based on the following data sources, provide:
-        1. Safety rating (scale 1-10, where 1=unsafe for consumption, 5=moderate concerns, 10=very safe)
-        2. List of potential health effects (both positive & negative, maximum 5 points)
-        3. Brief description of what this ingredient is, how it's used, and its properties
-        4. Alternative names for this ingredient
-        5. Allergic information of the ingredient like which type of allergies we can got, etc.
-        6. Diet Type of that ingredient like Vegan, Vegetarian, Non-Vegetarian
-        
+        {ANALYSIS_INSTRUCTIONS}
         Available data:
         {combined_data}
         
         Format your response as a JSON object with these keys:
-        - "safety_rating": (number between 1-10)
-        - "health_effects": (array of strings)
-        - "description": (string)
-        - "alternate_names": (array of strings)
-        - "allergic_info": (array of strings)
-        - "diet_type" : (string from vegan,vegetarian,non-vegetarian,unknown)
-        
-        Only include factual information supported by the provided data. If information is 
-        unavailable for any field, use appropriate default values. But if information is too obvious you can fill appropriate information just make sure only relevant data is there in the output.
+        {ANALYSIS_FIELDS}
+        {ANALYSIS_GUIDELINES}
         """
+
+
+def _apply_llm_response(result: Dict[str, Any], analysis_text: str):
+    """Parse the JSON object from an LLM response into the result."""
+    try:
+        log_debug(f"LLM response: {analysis_text[:500]}...(truncated)")
+        
+        # Find JSON in the response
+        start_idx = analysis_text.find('{')
+        end_idx = analysis_text.rfind('}') + 1
         
-        # Process with LLM
+        if start_idx >= 0 and end_idx > start_idx:
+            json_str = analysis_text[start_idx:end_idx]
+            analysis = json.loads(json_str)
+            _apply_analysis(result, analysis)
+            log_info(f"Analysis complete - Safety Rating: {result['safety_rating']}")
+        else:
+            log_warning("Could not find JSON in LLM response")
+            result["description"] = "Error: Failed to parse LLM analysis output."
+    except json.JSONDecodeError as e:
+        log_error(f"JSON parsing error: {e}",e)
+        result["description"] = f"Error parsing analysis: {str(e)}"
+
+
+def _apply_llm_error(result: Dict[str, Any], e: Exception):
+    log_error(f"Error in LLM analysis: {e}",e)
+    log_error(traceback.format_exc())
+    result.update({
+        "description": f"Error in analysis: {str(e)}",
+        "health_effects": ["Error in analysis"],
+    })
+
+
+def analyze_ingredient(state: IngredientState) -> IngredientState:
+    """Analyze ingredient data with LLM to generate structured information.
+    
+    Takes the current state with collected sources_data and uses an LLM to generate
+    a comprehensive analysis of the ingredient including safety rating, health effects,
+    description, and alternate names. Blocking, see analyze_ingredient_async.
+    
+    Args:
+        state: The current IngredientState containing all collected data
+        
+    Returns:
+        Updated state with analysis results
+    """
+    
+    # Initialize LLM
+    try:
+        llm = get_ingredient_llm()
+    except Exception as e:
+        log_error(f"Error initializing LLM: {e}",e)
+        return _error_state(state, f"Error initializing LLM: {str(e)}")
+    
+    # Get sources from state
+    log_info(f"Analyzing ingredient with {len(state['sources_data'])} total sources")
+    
+    # Filter for successful sources only
+    found_sources = _found_sources(state)
+    log_info(f"Found {len(found_sources)} sources with usable data")
+    
+    # Create default result structure
+    result = _default_result(state)
+    
+    # If we have data, analyze it
+    if found_sources:
+        analysis_prompt = _build_analysis_prompt(state, found_sources)
         try:
             log_info("Sending analysis prompt to LLM")
             llm_response = llm.invoke(analysis_prompt)
             log_info("Received LLM response")
-            
-            # Extract and parse JSON from LLM response
-            try:
-                analysis_text = llm_response.content
-                log_debug(f"LLM response: {analysis_text[:500]}...(truncated)")
-                
-                # Find JSON in the response
-                start_idx = analysis_text.find('{')
-                end_idx = analysis_text.rfind('}') + 1
-                
-                if start_idx >= 0 and end_idx > start_idx:
-                    json_str = analysis_text[start_idx:end_idx]
-                    analysis = json.loads(json_str)
-                    
-                    # Update result with analyzed data
-                    result.update({
-                        "safety_rating": analysis.get("safety_rating", 5),
-                        "description": analysis.get("description", "No description available."),
-                        "health_effects": analysis.get("health_effects", []),
-                        "alternate_names": analysis.get("alternate_names", []),
-                        "allergic_info": analysis.get("allergic_info", []),
-                        "diet_type": analysis.get("diet_type", "unknown"),
-                    })
-                    log_info(f"Analysis complete - Safety Rating: {result['safety_rating']}")
-                else:
-                    log_warning("Could not find JSON in LLM response")
-                    result["description"] = "Error: Failed to parse LLM analysis output."
-            except json.JSONDecodeError as e:
-                log_error(f"JSON parsing error: {e}",e)
-                result["description"] = f"Error parsing analysis: {str(e)}"
-                
+            _apply_llm_response(result, llm_response.content)
         except Exception as e:
-            log_error(f"Error in LLM analysis: {e}",e)
-            log_error(traceback.format_exc())
-            result.update({
-                "description": f"Error in analysis: {str(e)}",
-                "health_effects": ["Error in analysis"],
-            })
+            _apply_llm_error(result, e)
     
     # Update state with results
-    new_state = state.copy()
-    new_state["result"] = result
-    new_state["analysis_done"] = True
-    new_state["status"] = "analysis_complete"
-    return new_state
+    return _complete_state(state, result)
+
+
+async def analyze_ingredient_async(state: IngredientState) -> IngredientState:
+    """Same as analyze_ingredient, without blocking the event loop."""
+    try:
+        llm = get_ingredient_llm()
+    except Exception as e:
+        log_error(f"Error initializing LLM: {e}",e)
+        return _error_state(state, f"Error initializing LLM: {str(e)}")
+    
+    log_info(f"Analyzing ingredient with {len(state['sources_data'])} total sources")
+    found_sources = _found_sources(state)
+    log_info(f"Found {len(found_sources)} sources with usable data")
+    result = _default_result(state)
+    
+    if found_sources:
+        analysis_prompt = _build_analysis_prompt(state, found_sources)
+        try:
+            log_info("Sending analysis prompt to LLM")
+            llm_response = await llm.ainvoke(analysis_prompt)
+            log_info("Received LLM response")
+            _apply_llm_response(result, llm_response.content)
+        except Exception as e:
+            _apply_llm_error(result, e)
+    
+    return _complete_state(state, result)
+
+
+async def analyze_ingredients_batch(states: List[IngredientState]) -> List[Optional[IngredientState]]:
+    """Analyze several ingredients with a single LLM call.
+    
+    The collected data of every ingredient is packed into one prompt and the
+    LLM answers with a JSON array keyed by ingredient name. Each entry is
+    validated on its own.
+    
+    Args:
+        states: IngredientStates containing the collected data
+        
+    Returns:
+        Updated states in the same order, None for every ingredient whose entry
+        was missing or invalid so the caller can analyze it on its own
+    """
+    analyzed: List[Optional[IngredientState]] = [None] * len(states)
+    
+    # ingredients without any data don't need the LLM
+    pending = []
+    for i, state in enumerate(states):
+        if _found_sources(state):
+            pending.append(i)
+        else:
+            analyzed[i] = _complete_state(state, _default_result(state))
+    if not pending:
+        return analyzed
+    
+    ingredient_blocks = [
+        f"### Ingredient: {states[i]['ingredient']}\n{_format_sources(_found_sources(states[i]))}"
+        for i in pending
+    ]
+    analysis_prompt = f"""
+        Task: Analyze the data of several food ingredients and provide a structured assessment of each.
+        
+        For every ingredient below, based on its data sources, provide:
+        {ANALYSIS_INSTRUCTIONS}
+        Ingredients and their available data:
+        
+{chr(10).join(ingredient_blocks)}
+        
+        Format your response as a JSON array with exactly one object per ingredient, with these keys:
+        - "ingredient": (the ingredient name exactly as given after "### Ingredient:")
+        {ANALYSIS_FIELDS}
+        {ANALYSIS_GUIDELINES}
+        """
+    
+    try:
+        llm = get_ingredient_llm()
+        log_info(f"Sending batched analysis prompt to LLM for {len(pending)} ingredients")
+        llm_response = await llm.ainvoke(analysis_prompt)
+        analysis_text = llm_response.content
+        log_debug(f"LLM batch response: {analysis_text[:500]}...(truncated)")
+        
+        start_idx = analysis_text.find('[')
+        end_idx = analysis_text.rfind(']') + 1
+        entries = json.loads(analysis_text[start_idx:end_idx]) if 0 <= start_idx < end_idx else None
+    except Exception as e:
+        log_error(f"Error in batched LLM analysis: {e}",e)
+        return analyzed
+    
+    if not isinstance(entries, list):
+        log_warning("Could not find a JSON array in the batched LLM response")
+        return analyzed
+    
+    by_name = {}
+    for entry in entries:
+        if isinstance(entry, dict) and isinstance(entry.get("ingredient"), str):
+            by_name.setdefault(normalize_ingredient_name(entry["ingredient"]), entry)
+    
+    for i in pending:
+        state = states[i]
+        analysis = _validate_batch_entry(by_name.get(normalize_ingredient_name(state["ingredient"])))
+        if analysis is None:
+            log_warning(f"Invalid or missing batch analysis for {state['ingredient']}")
+            continue
+        result = _default_result(state)
+        _apply_analysis(result, analysis)
+        analyzed[i] = _complete_state(state, result)
+    
+    log_info(f"Batched analysis complete for {sum(1 for i in pending if analyzed[i] is not None)}/{len(pending)} ingredients")
+    return analyzed
 
 def format_dict_source(source_name: str, source_data: dict) -> str:
     """Format dictionary source data for LLM consumption."""
@@ -339,27 +519,57 @@ def format_list_source(source_name: str, source_data: list) -> str:
     
     return source_text
 
+# Sources grouped from cheap/local to slow, queried in this order in tiered mode
+RESEARCH_TIERS = [
+    ("local", [async_search_local_db]),
+    ("databases", [async_search_open_food_facts, async_search_usda, async_search_pubchem]),
+    ("web", [async_search_wikipedia, async_search_web]),
+]
+
+# "source" label each search puts on its results, also used for the markers
+# of searches that timed out or were cancelled so they line up with real results
+SOURCE_NAMES = {
+    async_search_local_db: "Local DB",
+    async_search_open_food_facts: "Open Food Facts",
+    async_search_usda: "USDA FoodData Central",
+    async_search_pubchem: "PubChem",
+    async_search_wikipedia: "Wikipedia",
+    async_search_web: "DuckDuckGo",
+}
+
+# of a deadline, kept free for storing the results after the LLM analysis
+STORE_RESERVE_SECONDS = 0.5
+
+# In-process counters for tiered research, see get_research_stats
+research_stats = Counter()
+
+
+def get_research_stats() -> Dict[str, Any]:
+    return {"mode": RESEARCH_MODE, **research_stats}
+
+
+def _source_name(search_func) -> str:
+    if search_func in SOURCE_NAMES:
+        return SOURCE_NAMES[search_func]
+    tool_name = search_func.__name__.replace("async_", "")
+    return tool_name.replace("search_", "").replace("_", " ").title()
+
+
+def _timed_out_source(search_func, tier_name: Optional[str] = None) -> Dict[str, Any]:
+    # marker for a source that didn't answer before the deadline
+    research_stats["sources_timed_out"] += 1
+    return {"source": _source_name(search_func), "found": False, "data": None, "timed_out": True, "tier": tier_name}
+
+
 class IngredientInfoAgentLangGraph:
-    async def _fetch_data_from_source(self, tool_func, ingredient: str) -> Dict[str, Any]:
+    async def _fetch_data_from_source(self, search_func, ingredient: str) -> Dict[str, Any]:
         """Fetch data from a single source asynchronously."""
-        # Get tool name safely - handle both function tools and structured tools
-        if hasattr(tool_func, "name"):
-            # For structured tools
-            tool_name = tool_func.name
-        elif hasattr(tool_func, "__name__"):
-            # For function tools
-            tool_name = tool_func.__name__
-        else:
-            # Fallback
-            tool_name = str(tool_func).split()[0]
-        
-        source_name = tool_name.replace("search_", "").replace("_", " ").title()
+        source_name = _source_name(search_func)
         log_info(f"Searching {source_name} for {ingredient}")
         
         try:
-            # Run the tool function in a thread pool to avoid blocking
-            loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(None, partial(tool_func.invoke, ingredient))
+            # Native coroutine, no executor thread per source
+            result = await search_func(ingredient)
             
             if result.get("found", False):
                 log_info(f"{source_name} found data for {ingredient}")
@@ -368,47 +578,210 @@ class IngredientInfoAgentLangGraph:
             log_error(f"Error in {source_name} search: {e}",e)
             return {"source": source_name, "found": False, "error": str(e)}
     
-    async def process_ingredient_async(self, ingredient: str) -> IngredientAnalysisResult:
-        """Process an ingredient using parallel data fetching."""
-        log_info(f"=== Parallel processing for: {ingredient} ===")
+    async def _research_tiered(self, ingredient: str, local_db: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Query the source tiers in order until enough sources found data.
+        
+        A tier that hasn't finished within RESEARCH_TIER_TIMEOUT doesn't hold
+        back the next one, its sources keep running. Once RESEARCH_MIN_SOURCES
+        sources found data, everything still running is cancelled. At
+        RESEARCH_DEADLINE_SECONDS (or earlier, leaving RESEARCH_ANALYSIS_RESERVE_SECONDS
+        of the current deadline for the analysis) the sources still running,
+        or not started yet, are marked timed out.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + remaining_time(RESEARCH_DEADLINE_SECONDS, RESEARCH_ANALYSIS_RESERVE_SECONDS)
+        results = []
+        pending = {}
+        started = set()
+        
+        def sufficient() -> bool:
+            return sum(1 for result in results if result.get("found")) >= RESEARCH_MIN_SOURCES
+        
+        async def wait(until: float, tier_tasks=None):
+            while pending and not sufficient():
+                if tier_tasks is not None and all(task.done() for task in tier_tasks):
+                    return
+                timeout = until - loop.time()
+                if timeout <= 0:
+                    return
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    tier_name, search_func = pending.pop(task)
+                    results.append({**task.result(), "tier": tier_name})
         
-        # Define all the tools to run in parallel
-        tools = [
-            search_local_db,
-            search_web,
-            search_wikipedia,
-            search_open_food_facts,
-            search_usda,
-            search_pubchem
-        ]
+        try:
+            for tier_name, tools in RESEARCH_TIERS:
+                if sufficient() or loop.time() >= deadline:
+                    break
+                started.add(tier_name)
+                tier_tasks = []
+                for search_func in tools:
+                    if search_func is async_search_local_db and local_db is not None:
+                        results.append({**local_db, "tier": tier_name})
+                        continue
+                    task = loop.create_task(self._fetch_data_from_source(search_func, ingredient))
+                    pending[task] = (tier_name, search_func)
+                    tier_tasks.append(task)
+                await wait(min(deadline, loop.time() + RESEARCH_TIER_TIMEOUT), tier_tasks)
+            
+            # all tiers started, give the slow sources until the deadline
+            await wait(deadline)
+        finally:
+            # enough evidence, deadline reached, or we were cancelled
+            timed_out = not sufficient() and loop.time() >= deadline
+            for task, (tier_name, search_func) in pending.items():
+                task.cancel()
+                if timed_out:
+                    results.append(_timed_out_source(search_func, tier_name))
+                else:
+                    research_stats["sources_cancelled"] += 1
+                    results.append({"source": _source_name(search_func), "found": False, "error": "cancelled", "tier": tier_name})
+            if timed_out:
+                for tier_name, tools in RESEARCH_TIERS:
+                    if tier_name not in started:
+                        results.extend(_timed_out_source(search_func, tier_name) for search_func in tools)
+        
+        research_stats["ingredients"] += 1
+        research_stats["early_exits" if sufficient() else "insufficient"] += 1
+        if loop.time() >= deadline:
+            research_stats["deadline_reached"] += 1
+        return results
+    
+    async def collect_sources(self, ingredient: str, local_db: Optional[Dict[str, Any]] = None) -> IngredientState:
+        """Fetch data for an ingredient from the sources.
         
-        # Create tasks for each tool
-        tasks = [self._fetch_data_from_source(tool, ingredient) for tool in tools]
+        In "tiered" RESEARCH_MODE the sources are queried tier by tier (see
+        _research_tiered), in "all" mode every source is queried in parallel
+        until RESEARCH_DEADLINE_SECONDS (or earlier, as in tiered mode).
+        `local_db` is an already looked up local DB result (see process_ingredients_async).
+        """
+        log_info(f"=== Parallel processing for: {ingredient} ===")
         
-        # Run all tasks concurrently and collect results
-        results = await asyncio.gather(*tasks)
+        if RESEARCH_MODE == "tiered":
+            results = await self._research_tiered(ingredient, local_db)
+        else:
+            # Define all the sources to run in parallel
+            tools = [
+                async_search_web,
+                async_search_wikipedia,
+                async_search_open_food_facts,
+                async_search_usda,
+                async_search_pubchem
+            ]
+            if local_db is None:
+                tools.insert(0, async_search_local_db)
+            
+            # Create tasks for each tool
+            loop = asyncio.get_running_loop()
+            tasks = [loop.create_task(self._fetch_data_from_source(tool, ingredient)) for tool in tools]
+            
+            # Run all tasks concurrently and collect results, sources still running at the deadline are dropped
+            try:
+                done, _ = await asyncio.wait(tasks, timeout=remaining_time(RESEARCH_DEADLINE_SECONDS, RESEARCH_ANALYSIS_RESERVE_SECONDS))
+            finally:
+                for task in tasks:
+                    task.cancel()
+            results = [task.result() if task in done else _timed_out_source(tool) for tool, task in zip(tools, tasks)]
+            if local_db is not None:
+                results.insert(0, local_db)
         
         # Filter for successful results
         sources_data = [result for result in results if not result.get("error")]
+        queried = {result.get("source") for result in sources_data if not result.get("timed_out")}
+        answered_tiers = []
+        for result in sources_data:
+            if result.get("found") and result.get("tier") and result["tier"] not in answered_tiers:
+                answered_tiers.append(result["tier"])
+        for tier_name in answered_tiers:
+            research_stats[f"answered_by_{tier_name}"] += 1
+        if answered_tiers:
+            log_info(f"Tiers that answered for {ingredient}: {', '.join(answered_tiers)}")
         
         # Create a state for analysis
         state = {
             "ingredient": ingredient,
             "sources_data": sources_data,
+            "answered_tiers": answered_tiers,
             "result": None,
             "status": "ready_for_analysis",
             "analysis_done": False,
-            "local_db_checked": True,
-            "web_search_done": True,
-            "wikipedia_checked": True,
-            "open_food_facts_checked": True,
-            "usda_checked": True,
-            "pubchem_checked": True
+            "local_db_checked": "Local DB" in queried,
+            "web_search_done": "DuckDuckGo" in queried,
+            "wikipedia_checked": "Wikipedia" in queried,
+            "open_food_facts_checked": bool(queried & {"Open Food Facts", "Open Food Facts Products"}),
+            "usda_checked": "USDA FoodData Central" in queried,
+            "pubchem_checked": "PubChem" in queried
         }
+        return state
+    
+    async def _analyze_single(self, state: IngredientState) -> IngredientState:
+        async def analyze() -> IngredientState:
+            # Run the analysis within the Gemini budget
+            async with upstream_scheduler.slot("gemini"):
+                return await analyze_ingredient_async(state)
         
-        # Run the analysis with the collected data
-        final_state = analyze_ingredient(state)
+        try:
+            return await within_deadline(analyze(), reserve=STORE_RESERVE_SECONDS)
+        except asyncio.TimeoutError:
+            log_warning(f"Analysis deadline passed for {state['ingredient']}")
+            research_stats["analyses_timed_out"] += 1
+            return _timed_out_state(state)
+    
+    async def _analyze_batch(self, states: List[IngredientState]) -> List[IngredientState]:
+        if len(states) == 1:
+            return [await self._analyze_single(states[0])]
         
+        async def analyze() -> List[Optional[IngredientState]]:
+            async with upstream_scheduler.slot("gemini"):
+                return await analyze_ingredients_batch(states)
+        
+        try:
+            analyzed = await within_deadline(analyze(), reserve=STORE_RESERVE_SECONDS)
+        except asyncio.TimeoutError:
+            log_warning(f"Analysis deadline passed for a batch of {len(states)} ingredients")
+            research_stats["analyses_timed_out"] += len(states)
+            return [_timed_out_state(state) for state in states]
+        
+        # entries that failed to parse or validate get their own call
+        failed = [i for i, state in enumerate(analyzed) if state is None]
+        if failed:
+            log_warning(f"Falling back to single analysis for {len(failed)} of {len(states)} ingredients")
+            retried = await asyncio.gather(*[self._analyze_single(states[i]) for i in failed])
+            for i, state in zip(failed, retried):
+                analyzed[i] = state
+        return analyzed
+    
+    async def process_ingredient_async(self, ingredient: str) -> IngredientAnalysisResult:
+        """Process an ingredient using parallel data fetching."""
+        state = await self.collect_sources(ingredient)
+        final_state = await self._analyze_single(state)
+        return self._build_result(ingredient, final_state)
+    
+    async def process_ingredients_async(self, ingredients: List[str]) -> List[IngredientAnalysisResult]:
+        """Process several ingredients, analyzing them in batches of LLM_ANALYSIS_BATCH_SIZE.
+        
+        Each batch is analyzed as soon as the data of its own ingredients is
+        collected, batches run concurrently.
+        """
+        batch_size = max(1, LLM_ANALYSIS_BATCH_SIZE)
+        
+        # the local DB is an in-memory index, look the whole list up at once
+        local_records = additive_index.lookup_many(ingredients)
+        
+        async def process_batch(batch: List[str]) -> List[IngredientAnalysisResult]:
+            states = await asyncio.gather(*[
+                self.collect_sources(ingredient, local_db_result(local_records.get(ingredient)))
+                for ingredient in batch
+            ])
+            final_states = await self._analyze_batch(list(states))
+            return [self._build_result(ingredient, final_state) for ingredient, final_state in zip(batch, final_states)]
+        
+        batches = [ingredients[i:i + batch_size] for i in range(0, len(ingredients), batch_size)]
+        batch_results = await asyncio.gather(*[process_batch(batch) for batch in batches])
+        return [result for results in batch_results for result in results]
+    
+    def _build_result(self, ingredient: str, final_state: IngredientState) -> IngredientAnalysisResult:
+        sources_data = final_state["sources_data"]
         # Extract the result or create a default
         if final_state.get("result"):
             log_info(f"Analysis complete for {ingredient}")
@@ -416,19 +789,11 @@ class IngredientInfoAgentLangGraph:
             if "id" not in final_state["result"]:
                 final_state["result"]["id"] = 0  # Will be replaced with actual DB ID
             
-            result = IngredientAnalysisResult(**final_state["result"])
-            
-            # Save to database using SessionLocal
-            from db.database import SessionLocal
-            from db.repositories import IngredientRepository
-            
-            with SessionLocal() as db:
-                repo = IngredientRepository(db)
-                db_ingredient = repo.create_ingredient(result)
-                # Update with real database ID
-                result.id = db_ingredient.id
-                
-            return result
+            # Callers persist the result (see utils.ingredient_utils.research_ingredient),
+            # saving here as well made their own insert hit the unique name constraint
+            result = final_state["result"]
+            timed_out = result.get("timed_out") or any(source.get("timed_out") for source in sources_data)
+            return IngredientAnalysisResult(**{**result, "timed_out": bool(timed_out)})
         else:
             log_info(f"No result in final state for {ingredient}, returning default")
             # Include id field in default result
@@ -440,7 +805,8 @@ class IngredientInfoAgentLangGraph:
                 safety_rating=0,
                 description="No reliable information found",
                 health_effects=["Unknown"],
-                details_with_source=sources_data
+                details_with_source=sources_data,
+                timed_out=any(source.get("timed_out") for source in sources_data)
             )
         
     def process_ingredient(self, ingredient: str) -> IngredientAnalysisResult:
@@ -503,13 +869,14 @@ class IngredientInfoAgentLangGraph:
         # Extract the result or create a default
         if final_state.get("result"):
             log_info(f"Analysis complete for {ingredient}")
-
+            final_state["result"].setdefault("id", 0)  # Will be replaced with actual DB ID
             return IngredientAnalysisResult(**final_state["result"])
         else:
             log_info(f"No result in final state for {ingredient}, returning default")
             return IngredientAnalysisResult(
                 name=ingredient, 
                 is_found=len(sources_data) > 0, 
+                id=0,
                 details_with_source=sources_data
             )
         
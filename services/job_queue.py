@@ -0,0 +1,352 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+import pytz
+from fastapi.encoders import jsonable_encoder
+
+from logger_manager import log_error, log_info, log_warning
+from env import JOB_LEASE_SECONDS, JOB_QUEUE_PATH, JOB_RETENTION_SECONDS, JOB_WORKERS
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED = (SUCCEEDED, FAILED)
+
+
+class JobProgress:
+    """progress(stage, **details), called by handlers as they go.
+
+    `last` is the progress an interrupted earlier run of the job got to, None
+    on the first run. Handlers whose steps aren't safe to repeat record what
+    they did in the details and skip it when the job is run again.
+    """
+
+    def __init__(self, update: Callable[[Dict[str, Any]], None], last: Optional[Dict[str, Any]] = None):
+        self._update = update
+        self.last = last
+
+    def __call__(self, stage: str, **details):
+        self._update({"stage": stage, **details})
+
+
+JobHandler = Callable[[Dict[str, Any], JobProgress], Awaitable[Any]]
+
+
+def _isoformat(timestamp: Optional[float]) -> Optional[str]:
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, tz=pytz.timezone('Asia/Kolkata')).isoformat()
+
+
+class JobQueue:
+    """Background jobs persisted in a SQLite file and run by a pool of asyncio workers.
+
+    `submit` stores the job and returns its id right away, a worker runs the
+    handler registered for the job's kind and stores its result. Handlers
+    report progress, which is kept with the job and pushed to `events`
+    subscribers. Jobs still queued are picked up again on `start`. The SQLite
+    calls run on the queue's own thread, never on the event loop.
+
+    Several processes can share the file. A running job holds a lease its
+    process renews every third of `lease_seconds`, a job whose lease ran out
+    (the process died or was stopped) is queued again by whichever process
+    notices first, jobs of live processes are left alone.
+    """
+
+    def __init__(self, path: str, workers: int, retention_seconds: int, lease_seconds: int):
+        self.path = path
+        self.workers = workers
+        self.retention_seconds = retention_seconds
+        self.lease_seconds = lease_seconds
+        self._handlers: Dict[str, JobHandler] = {}
+        self._lock = threading.Lock()
+        # one thread, so writes land in the order they were made
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job_queue")
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self._lease_task: Optional[asyncio.Task] = None
+        self._subscribers: Dict[str, List[asyncio.Queue]] = {}
+        # owner of the jobs this instance runs, made on start
+        self.instance_id: Optional[str] = None
+
+        self.submitted = 0
+        self.succeeded = 0
+        self.failed = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, "
+            "payload TEXT NOT NULL, progress TEXT, result TEXT, error TEXT, owner TEXT, lease_expires_at REAL, user_id INTEGER, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        # files written before jobs had an owner, a lease and a user
+        for column, column_type in (("owner", "TEXT"), ("lease_expires_at", "REAL"), ("user_id", "INTEGER")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_jobs_status ON jobs (status, created_at)")
+
+    def register(self, kind: str, handler: JobHandler):
+        self._handlers[kind] = handler
+
+    def _call(self, func: Callable, *args) -> asyncio.Future:
+        # submitted right away, so calls run in the order they were made even if not awaited
+        return asyncio.wrap_future(self._executor.submit(func, *args))
+
+    async def start(self):
+        """Start the workers, picking up the jobs not finished before the last shutdown."""
+        self._queue = asyncio.Queue()
+        self.instance_id = uuid.uuid4().hex
+        purged, queued = await self._call(self._prepare_start, time.time())
+        for (job_id,) in queued:
+            self._queue.put_nowait(job_id)
+
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._lease_task = asyncio.create_task(self._renew_leases())
+        log_info(f"Job queue started with {self.workers} workers, {len(queued)} queued jobs, {purged} old jobs purged")
+
+    async def stop(self):
+        # jobs still running stay marked running, they're run again once their lease runs out
+        tasks = [*self._worker_tasks, *([self._lease_task] if self._lease_task else [])]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._worker_tasks = []
+        self._lease_task = None
+
+    def _prepare_start(self, now: float):
+        self._requeue_expired(now)
+        with self._lock:
+            purged = self._conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                (SUCCEEDED, FAILED, now - self.retention_seconds),
+            ).rowcount
+            queued = self._conn.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created_at", (QUEUED,)
+            ).fetchall()
+        return purged, queued
+
+    def _requeue_expired(self, now: float) -> List[str]:
+        """Queue the running jobs whose lease ran out again, returns their ids."""
+        requeued = []
+        with self._lock:
+            expired = self._conn.execute(
+                "SELECT id FROM jobs WHERE status = ? AND (lease_expires_at IS NULL OR lease_expires_at < ?)",
+                (RUNNING, now),
+            ).fetchall()
+            for (job_id,) in expired:
+                # checked again, another process may have renewed or requeued it meanwhile
+                if self._conn.execute(
+                    "UPDATE jobs SET status = ?, owner = NULL, lease_expires_at = NULL "
+                    "WHERE id = ? AND status = ? AND (lease_expires_at IS NULL OR lease_expires_at < ?)",
+                    (QUEUED, job_id, RUNNING, now),
+                ).rowcount:
+                    requeued.append(job_id)
+        if requeued:
+            log_warning(f"Requeued {len(requeued)} jobs whose lease ran out")
+        return requeued
+
+    def _renew(self, now: float) -> List[str]:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET lease_expires_at = ? WHERE status = ? AND owner = ?",
+                (now + self.lease_seconds, RUNNING, self.instance_id),
+            )
+        # jobs of processes that died since
+        return self._requeue_expired(now)
+
+    async def _renew_leases(self):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                for job_id in await self._call(self._renew, time.time()):
+                    self._queue.put_nowait(job_id)
+            except sqlite3.Error as e:
+                log_error(f"Could not renew job leases: {e}", e)
+
+    def _insert(self, job_id: str, kind: str, payload: str, user_id: Optional[int]):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, status, payload, user_id, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, kind, QUEUED, payload, user_id, time.time()),
+            )
+
+    async def submit(self, kind: str, payload: Dict[str, Any], user_id: Optional[int] = None) -> str:
+        """Queue a job, returns its id. Jobs of a user are only shown to that user."""
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = uuid.uuid4().hex
+        await self._call(self._insert, job_id, kind, json.dumps(jsonable_encoder(payload)), user_id)
+        self.submitted += 1
+        if self._queue is not None:
+            self._queue.put_nowait(job_id)
+        else:
+            log_warning(f"Job queue not started, job {job_id} runs on the next start")
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self._call(self._get, job_id)
+
+    def _get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, kind, status, progress, result, error, created_at, started_at, finished_at, user_id "
+                "FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "job_id": row[0],
+            "kind": row[1],
+            "status": row[2],
+            "progress": json.loads(row[3]) if row[3] else None,
+            "result": json.loads(row[4]) if row[4] else None,
+            "error": row[5],
+            "created_at": _isoformat(row[6]),
+            "started_at": _isoformat(row[7]),
+            "finished_at": _isoformat(row[8]),
+            "user_id": row[9],
+        }
+
+    async def events(self, job_id: str, heartbeat: float = 15) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """The job's state now and after every change, until it finished.
+
+        Yields None when nothing changed for `heartbeat` seconds, so streams
+        can send a keep-alive.
+        """
+        updates = asyncio.Queue()
+        self._subscribers.setdefault(job_id, []).append(updates)
+        try:
+            job = await self.get(job_id)
+            while job is not None:
+                yield job
+                if job["status"] in FINISHED:
+                    return
+                try:
+                    job = await asyncio.wait_for(updates.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield None
+                    # catch up on anything done by another process
+                    job = await self.get(job_id)
+        finally:
+            subscribers = self._subscribers.get(job_id, [])
+            if updates in subscribers:
+                subscribers.remove(updates)
+            if not subscribers:
+                self._subscribers.pop(job_id, None)
+
+    def _update(self, job_id: str, **fields) -> asyncio.Future:
+        """Write the fields, subscribers get the job once written. Awaiting is
+        optional (progress doesn't), later writes land after this one anyway."""
+        future = self._call(self._write, job_id, fields, bool(self._subscribers.get(job_id)))
+        future.add_done_callback(lambda written: self._notify(job_id, written))
+        return future
+
+    def _write(self, job_id: str, fields: Dict[str, Any], read_back: bool) -> Optional[Dict[str, Any]]:
+        columns = ", ".join(f"{column} = ?" for column in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+        return self._get(job_id) if read_back else None
+
+    def _notify(self, job_id: str, written: asyncio.Future):
+        if written.cancelled():
+            return
+        if written.exception() is not None:
+            log_error(f"Could not update job {job_id}: {written.exception()}", written.exception())
+            return
+        job = written.result()
+        if job is not None:
+            for updates in self._subscribers.get(job_id, []):
+                updates.put_nowait(job)
+
+    def _claim(self, job_id: str) -> Optional[tuple]:
+        # atomic, so a job is only run once even if several processes share the file
+        now = time.time()
+        with self._lock:
+            claimed = self._conn.execute(
+                "UPDATE jobs SET status = ?, owner = ?, lease_expires_at = ?, started_at = ? WHERE id = ? AND status = ?",
+                (RUNNING, self.instance_id, now + self.lease_seconds, now, job_id, QUEUED),
+            ).rowcount
+            if not claimed:
+                return None
+            return self._conn.execute("SELECT kind, payload, progress FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception as e:
+                log_error(f"Job queue error for job {job_id}: {e}", e)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str):
+        claimed = await self._call(self._claim, job_id)
+        if claimed is None:
+            return
+        kind, payload, last_progress = claimed
+        # progress is only set once a job ran, so this is a job picked up again after an interruption
+        last_progress = json.loads(last_progress) if last_progress else None
+        self._update(job_id, progress=json.dumps({"stage": "started"}))
+        progress = JobProgress(
+            lambda state: self._update(job_id, progress=json.dumps(jsonable_encoder(state))),
+            last_progress,
+        )
+
+        if last_progress is not None:
+            log_info(f"Resuming {kind} job {job_id} from {last_progress.get('stage')}")
+        else:
+            log_info(f"Running {kind} job {job_id}")
+        try:
+            result = await self._handlers[kind](json.loads(payload), progress)
+        except Exception as e:
+            log_error(f"{kind} job {job_id} failed: {e}", e)
+            self.failed += 1
+            await self._update(job_id, status=FAILED, error=str(e), finished_at=time.time())
+            return
+        self.succeeded += 1
+        await self._update(
+            job_id,
+            status=SUCCEEDED,
+            result=json.dumps(jsonable_encoder(result), default=str),
+            progress=json.dumps({"stage": "done"}),
+            finished_at=time.time(),
+        )
+        log_info(f"{kind} job {job_id} succeeded")
+
+    def _count_by_status(self):
+        with self._lock:
+            return self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+
+    async def stats(self) -> Dict[str, Any]:
+        try:
+            rows = await self._call(self._count_by_status)
+        except sqlite3.Error:
+            rows = []
+        return {
+            "workers": len(self._worker_tasks),
+            "pending": self._queue.qsize() if self._queue is not None else 0,
+            "submitted": self.submitted,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "jobs": dict(rows),
+        }
+
+
+job_queue = JobQueue(JOB_QUEUE_PATH, JOB_WORKERS, JOB_RETENTION_SECONDS, JOB_LEASE_SECONDS)
@@ -0,0 +1,60 @@
+import threading
+from typing import Dict, Tuple
+
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+from logger_manager import log_error, log_info
+
+from env import (
+    LLM_API_KEY,
+    LLM_INGREDIENT_TEMPERATURE,
+    LLM_MAX_RETRIES,
+    LLM_MODEL_NAME,
+    LLM_PRODUCT_TEMPERATURE,
+    LLM_TIMEOUT,
+)
+
+# Process-wide chat clients keyed by (model, temperature), each one keeps its
+# transport so it isn't rebuilt for every ingredient or product
+_clients: Dict[Tuple[str, float], ChatGoogleGenerativeAI] = {}
+_lock = threading.Lock()
+
+
+def get_llm(temperature: float, model: str = LLM_MODEL_NAME) -> ChatGoogleGenerativeAI:
+    """Return the shared chat client for a model and temperature, created on first use."""
+    key = (model, float(temperature))
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = ChatGoogleGenerativeAI(
+                google_api_key=LLM_API_KEY,
+                model=model,
+                temperature=temperature,
+                timeout=LLM_TIMEOUT,
+                max_retries=LLM_MAX_RETRIES,
+            )
+            _clients[key] = client
+            log_info(f"Created LLM client for {model} (temperature {temperature})")
+    return client
+
+
+def get_ingredient_llm() -> ChatGoogleGenerativeAI:
+    return get_llm(LLM_INGREDIENT_TEMPERATURE)
+
+
+def get_product_llm() -> ChatGoogleGenerativeAI:
+    return get_llm(LLM_PRODUCT_TEMPERATURE)
+
+
+def warm_up_llm_clients():
+    """Create the clients used by the agents at startup instead of on the first request."""
+    try:
+        get_ingredient_llm()
+        get_product_llm()
+    except Exception as e:
+        # not fatal, the agents retry on first use and report the error there
+        log_error(f"Error creating LLM clients: {e}", e)
@@ -1,33 +1,148 @@
+import asyncio
+import hashlib
+import json
 import os
+from collections import Counter
 from typing import List, Dict, Any, Optional
 from langchain_core.messages import HumanMessage
-from langchain_google_genai import ChatGoogleGenerativeAI
-from logger_manager import log_error, log_info
+from logger_manager import log_error, log_info, log_warning
 from interfaces.ingredientModels import IngredientAnalysisResult
+from services.job_queue import JobProgress, job_queue
+from services.llm_provider import get_product_llm
+from services.product_rules import analyze_product_rules, enrich_analysis
+from utils.deadline import within_deadline
+from utils.response_cache import disk_cache
+from utils.upstream_scheduler import upstream_scheduler
+from env import LLM_MODEL_NAME, PRODUCT_ANALYSIS_CACHE_TTL, PRODUCT_ANALYSIS_MODE
+
+# Bump when the prompt below changes, analyses cached for older prompts are then ignored
+PRODUCT_PROMPT_VERSION = 1
+PRODUCT_ANALYSIS_NAMESPACE = "product_analysis"
+
+# job kind of the LLM enrichment in "hybrid" mode, see services.job_queue
+ENRICH_ANALYSIS_JOB = "enrich_product_analysis"
+
+# In-process counters for the product analysis cache, see get_product_analysis_stats
+product_analysis_stats = Counter()
+
+
+def get_product_analysis_stats() -> Dict[str, Any]:
+    return dict(product_analysis_stats)
+
+
+def _normalize_preference(value: Any) -> List[str]:
+    # "Nut allergy, vegetarian" and "vegetarian,nut allergy" are the same profile
+    if not value:
+        return []
+    items = value.split(",") if isinstance(value, str) else value
+    return sorted({str(item).strip().lower() for item in items if str(item).strip()})
+
+
+def _analysis_cache_key(
+    ingredients_data: List[IngredientAnalysisResult],
+    user_preferences: Optional[Dict[str, Any]],
+) -> Optional[str]:
+    """Canonical key of a product analysis, None when it shouldn't be cached.
+
+    Covers the ingredients' ids and versions (their updated_at), the user
+    preferences that go into the prompt, the model and the prompt version.
+    Ingredients that aren't stored (placeholders, timed out research) have
+    no stable version, analyses including them aren't cached.
+    """
+    if PRODUCT_ANALYSIS_CACHE_TTL <= 0 or not ingredients_data:
+        return None
+    if any(not ingredient.id or ingredient.timed_out for ingredient in ingredients_data):
+        return None
+    preferences = None
+    if user_preferences:
+        preferences = {
+            "allergies": _normalize_preference(user_preferences.get("allergies")),
+            "dietary_restrictions": _normalize_preference(user_preferences.get("dietary_restrictions")),
+        }
+    material = {
+        "ingredients": sorted(
+            [ingredient.id, ingredient.updated_at.isoformat() if ingredient.updated_at else None]
+            for ingredient in ingredients_data
+        ),
+        "preferences": preferences,
+        "model": LLM_MODEL_NAME,
+        "prompt_version": PRODUCT_PROMPT_VERSION,
+    }
+    return hashlib.sha256(json.dumps(material, sort_keys=True).encode("utf-8")).hexdigest()
 
-# Load environment variables
-from env import LLM_API_KEY, LLM_MODEL_NAME
 
 async def analyze_product_ingredients(
     ingredients_data: List[IngredientAnalysisResult],
-    user_preferences: Optional[Dict[str, Any]] = None
+    user_preferences: Optional[Dict[str, Any]] = None,
+    wait_for_enrichment: bool = False,
+    user_id: Optional[int] = None,
 ) -> Dict[str, Any]:
     """
     Analyze multiple ingredients to provide a comprehensive product analysis
     for AR display, considering user preferences and dietary restrictions.
+
+    Built according to PRODUCT_ANALYSIS_MODE. In "hybrid" mode the rules
+    analysis is returned right away and the LLM's free text is merged in by
+    a background job (its id in "enrichment_job_id"), unless
+    wait_for_enrichment is set, then both are merged before returning.
+    """
+    if PRODUCT_ANALYSIS_MODE == "rules":
+        return analyze_product_rules(ingredients_data, user_preferences)
+    if PRODUCT_ANALYSIS_MODE != "hybrid":
+        return await _analyze_with_llm(ingredients_data, user_preferences)
+
+    analysis = analyze_product_rules(ingredients_data, user_preferences)
+    if wait_for_enrichment:
+        return enrich_analysis(analysis, await _analyze_with_llm(ingredients_data, user_preferences))
+    analysis["enrichment_job_id"] = await job_queue.submit(ENRICH_ANALYSIS_JOB, {
+        "ingredients": ingredients_data,
+        "user_preferences": user_preferences,
+    }, user_id=user_id)  # personalized, only shown to that user
+    return analysis
+
+
+async def _enrich_analysis_job(payload: Dict[str, Any], progress: JobProgress) -> Dict[str, Any]:
+    ingredients_data = [IngredientAnalysisResult(**ingredient) for ingredient in payload["ingredients"]]
+    user_preferences = payload.get("user_preferences")
+    analysis = analyze_product_rules(ingredients_data, user_preferences)
+    progress("llm")
+    return enrich_analysis(analysis, await _analyze_with_llm(ingredients_data, user_preferences))
+
+
+job_queue.register(ENRICH_ANALYSIS_JOB, _enrich_analysis_job)
+
+
+async def _analyze_with_llm(
+    ingredients_data: List[IngredientAnalysisResult],
+    user_preferences: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Product analysis written by the LLM.
+    Falls back to the rules analysis, marked timed_out, when the request's
+    deadline passes before the LLM answered. Successful analyses are cached
+    per ingredient set and preferences for PRODUCT_ANALYSIS_CACHE_TTL.
     """
     log_info(f"Analyzing product with {len(ingredients_data)} ingredients")
+    ingredient_ids = [ingredient.id for ingredient in ingredients_data]
     
-    # Initialize LLM    
-    llm = ChatGoogleGenerativeAI(
-        google_LLM_API_KEY=LLM_API_KEY,
-        model=LLM_MODEL_NAME,
-        temperature=0.2  # Lower temperature for more factual responses
-    )
+    cache_key = _analysis_cache_key(ingredients_data, user_preferences)
+    if cache_key is not None:
+        cached = await disk_cache.aget(PRODUCT_ANALYSIS_NAMESPACE, cache_key)
+        if cached is not None:
+            log_info("Product analysis cache hit")
+            product_analysis_stats["hits"] += 1
+            # ids in the order of this request
+            cached["ingredient_ids"] = ingredient_ids
+            return cached
+        product_analysis_stats["misses"] += 1
+    else:
+        product_analysis_stats["uncacheable"] += 1
+    
+    # Shared LLM client
+    llm = get_product_llm()
     
     # Prepare ingredient data for the prompt
     ingredients_summary = []
-    ingredient_ids = []
     for i, ingredient in enumerate(ingredients_data):
         ingredient_info = f"""
 Ingredient {i+1}: {ingredient.name}
@@ -38,7 +153,6 @@ Health Effects: {', '.join(ingredient.health_effects) if ingredient.health_effec
 Description: {ingredient.description[:200] + '...' if len(ingredient.description) > 200 else ingredient.description}
 """
         ingredients_summary.append(ingredient_info)
-        ingredient_ids.append(ingredient.id)
     
     # Add user preferences context if available
     user_context = ""
@@ -102,11 +216,15 @@ Also strictly follow the JSON format in your response.
     try:
         # Process with LLM
         message = HumanMessage(content=analysis_prompt)
-        llm_response = llm.invoke([message])
+        
+        async def invoke():
+            async with upstream_scheduler.slot("gemini"):
+                return await llm.ainvoke([message])
+        
+        llm_response = await within_deadline(invoke())
         analysis_text = llm_response.content
         
         # Extract JSON from response
-        import json
         import re
         
         # Find JSON in the response using regex
@@ -117,6 +235,8 @@ Also strictly follow the JSON format in your response.
                 analysis = json.loads(json_match.group(0))
                 analysis["ingredient_ids"] = ingredient_ids
                 log_info("Successfully parsed product analysis")
+                if cache_key is not None:
+                    await disk_cache.aset(PRODUCT_ANALYSIS_NAMESPACE, cache_key, analysis, PRODUCT_ANALYSIS_CACHE_TTL)
                 return analysis
             except json.JSONDecodeError as e:
                 log_error(f"JSON parsing error: {e}",e)
@@ -137,6 +257,12 @@ Also strictly follow the JSON format in your response.
                 "ingredient_ids": ingredient_ids
             }
     
+    except asyncio.TimeoutError:
+        log_warning("Product analysis deadline passed, using fallback analysis")
+        analysis = generate_fallback_analysis(ingredients_data, ingredient_ids)
+        analysis["timed_out"] = True
+        return analysis
+    
     except Exception as e:
         log_error(f"Error in product analysis: {e}",e)
         # Fallback analysis based on simple calculations
@@ -153,36 +279,9 @@ def calculate_average_safety(ingredients_data: List[IngredientAnalysisResult]) -
 
 def generate_fallback_analysis(ingredients_data: List[IngredientAnalysisResult], ingredient_ids: List[int]) -> Dict[str, Any]:
     """Generate a basic analysis when LLM processing fails."""
-    # Extract known allergens
-    allergens = []
-    for ingredient in ingredients_data:
-        if hasattr(ingredient, 'allergic_info') and ingredient.allergic_info:
-            allergens.extend(ingredient.allergic_info)
-    
-    # Determine diet type based on ingredients
-    diet_types = []
-    all_vegan = all(getattr(i, 'diet_type', '') == 'vegan' for i in ingredients_data 
-                    if hasattr(i, 'diet_type') and i.diet_type)
-    all_vegetarian = all(getattr(i, 'diet_type', '') in ['vegan', 'vegetarian'] 
-                         for i in ingredients_data if hasattr(i, 'diet_type') and i.diet_type)
-    
-    if all_vegan:
-        diet_types.append("Vegan")
-    if all_vegetarian:
-        diet_types.append("Vegetarian")
-    
-    # Calculate safety score
-    safety_score = calculate_average_safety(ingredients_data)
-    
-    return {
-        "overall_safety_score": safety_score,
-        "suitable_diet_types": diet_types,
-        "allergy_warnings": list(set(allergens)),
-        "usage_recommendations": "Please refer to product packaging for usage guidelines",
-        "health_insights": {
-            "benefits": [],
-            "concerns": ["Analysis system encountered an error, please check individual ingredients"]
-        },
-        "key_takeaway": f"Product has {len(ingredients_data)} ingredients with average safety score of {safety_score}/10",
-        "ingredient_ids": ingredient_ids
-    }
+    analysis = analyze_product_rules(ingredients_data)
+    analysis["health_insights"]["concerns"].append(
+        "Analysis system encountered an error, please check individual ingredients"
+    )
+    analysis["ingredient_ids"] = ingredient_ids
+    return analysis
@@ -0,0 +1,140 @@
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.database import AsyncSessionLocal
+from db.repositories import AsyncProductRepository
+from interfaces.productModels import ProductCreate
+from logger_manager import log_info
+from services.job_queue import JobProgress, job_queue
+from utils.analyze import analyze_product, process_product_ingredients
+from utils.db_utils import add_product_to_database
+
+# job kinds, see services.job_queue
+ANALYZE_PRODUCT_JOB = "analyze_product"
+ADD_PRODUCT_JOB = "add_product"
+
+
+async def create_product(
+    db: AsyncSession,
+    name: str,
+    image_name: str,
+    ingredients_list: List[str],
+    user_id: int,
+    progress: JobProgress = None,
+    product_id: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Analyze a new product's ingredients, save it and add its marker to Vuforia.
+
+    With `product_id`, the product was already saved (by an interrupted job)
+    and only its marker is added.
+    """
+    if product_id is None:
+        product_id = await _save_product(db, name, ingredients_list, user_id, progress)
+
+    # Add Vuforia target if needed, the product id is kept so a resumed job doesn't save it twice
+    if progress is not None:
+        progress("vuforia", product_id=product_id)
+    await add_product_to_database(product_id, [image_name], db, {
+        "name": name,
+        "ingredients": ingredients_list,
+        "image_name": image_name,
+    })
+
+    return {
+        "message": "Product data and image processed successfully",
+        "product_id": product_id,
+        "image_name": image_name
+    }
+
+
+async def _save_product(
+    db: AsyncSession,
+    name: str,
+    ingredients_list: List[str],
+    user_id: int,
+    progress: JobProgress = None,
+) -> int:
+    # analyze the product ingredients, the stored analysis has to be complete
+    results = await process_product_ingredients(ingredients_list, progress=progress, wait_for_enrichment=True)
+    if results is None:
+        raise Exception("Product ingredient analysis failed")
+
+    # extract data from the analysis results
+    #         result = {
+    #     "ingredients_count": len(product_ingredients),
+    #     "processed_ingredients": ingredient_results,
+    #     "ingredient_ids": product_analysis["ingredient_ids"],
+    #     "overall_analysis": product_analysis,
+    #     "timestamp": datetime.now(tz=pytz.timezone('Asia/Kolkata')).isoformat()
+    # }
+    # {{
+    # "overall_safety_score": (number between 1-10),
+    # "suitable_diet_types": (strings from "Vegan", "Vegetarian", "Non-Vegetarian"),
+    # "allergy_warnings": (array of strings),
+    # "usage_recommendations": (string with specific guidance),
+    # "health_insights": {{
+    # "benefits": (array of strings),
+    # "concerns": (array of strings)
+    # }},
+    # "ingredient_interactions": (array of strings),
+    # "key_takeaway": (string)
+    # }}
+
+    # Check if the analysis results are valid
+    analysis_results = results.get("overall_analysis", {})
+    overall_safety_score = analysis_results.get("overall_safety_score", 5)
+    suitable_diet_types = analysis_results.get("suitable_diet_types", [])
+    allergy_warnings = analysis_results.get("allergy_warnings", [])
+    usage_recommendations = analysis_results.get("usage_recommendations", "")
+    health_insights = analysis_results.get("health_insights", {})
+    ingredient_interactions = analysis_results.get("ingredient_interactions", [])
+    key_takeaway = analysis_results.get("key_takeaway", "")
+
+    # Create product data model
+    product_create_data = ProductCreate(
+        product_name=name,
+        ingredients=json.dumps(ingredients_list),
+        overall_safety_score=overall_safety_score,
+        suitable_diet_types=json.dumps(suitable_diet_types),
+        allergy_warnings=json.dumps(allergy_warnings),
+        usage_recommendations=usage_recommendations,
+        health_insights=json.dumps(health_insights),
+        ingredient_interactions=json.dumps(ingredient_interactions),
+        key_takeaway=json.dumps(key_takeaway),
+        ingredients_count=results.get("ingredients_count", 0),
+        user_id=user_id,  # Can be updated later if needed
+        timestamp=results.get("timestamp", datetime.now().isoformat()),
+        ingredient_ids=json.dumps(results.get("ingredient_ids", [])),
+    )
+
+    # Add product to database
+    if progress is not None:
+        progress("saving")
+    product_repo = AsyncProductRepository(db)
+    product = await product_repo.add_product(product_create_data)
+    log_info(f"Product {product.id} saved")
+    return product.id
+
+
+async def _analyze_product_job(payload: Dict[str, Any], progress: JobProgress) -> Dict[str, Any]:
+    result = await analyze_product(
+        payload["ingredients"], payload.get("user_preferences"), progress=progress, user_id=payload.get("user_id"),
+    )
+    result["user_id"] = payload.get("user_id")
+    return result
+
+
+async def _add_product_job(payload: Dict[str, Any], progress: JobProgress) -> Dict[str, Any]:
+    # picked up again after an interruption, skip what's done
+    product_id = (progress.last or {}).get("product_id")
+    if product_id is not None:
+        log_info(f"Product {product_id} already saved, resuming at the Vuforia step")
+    async with AsyncSessionLocal() as db:
+        return await create_product(db, progress=progress, product_id=product_id, **payload)
+
+
+job_queue.register(ANALYZE_PRODUCT_JOB, _analyze_product_job)
+job_queue.register(ADD_PRODUCT_JOB, _add_product_job)
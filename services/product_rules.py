@@ -0,0 +1,219 @@
+import re
+from typing import Any, Dict, List, Optional
+
+from interfaces.ingredientModels import IngredientAnalysisResult
+
+# Fields of a product analysis that are free text, written by the LLM when
+# available, everything else is computed by the rules below
+FREE_TEXT_FIELDS = ("usage_recommendations", "health_insights", "key_takeaway")
+
+MAX_ALLERGY_WARNINGS = 5
+MAX_CONCERNS = 3
+LOW_SAFETY_RATING = 3
+
+# Known interactions between ingredients, each rule matches when one name of
+# every group is in the product (names are compared lowercased, E-numbers included)
+KNOWN_INTERACTIONS = [
+    (
+        [
+            {"sodium benzoate", "potassium benzoate", "benzoic acid", "e210", "e211", "e212"},
+            {"ascorbic acid", "vitamin c", "e300"},
+        ],
+        "Benzoates with ascorbic acid (vitamin C) can form small amounts of benzene, especially with heat or light",
+    ),
+    (
+        [
+            {"monosodium glutamate", "msg", "e621"},
+            {"disodium inosinate", "disodium guanylate", "disodium 5'-ribonucleotides", "e627", "e631", "e635"},
+        ],
+        "Monosodium glutamate with ribonucleotides (E627/E631/E635) strongly amplifies savory taste",
+    ),
+    (
+        [
+            {"caffeine"},
+            {"guarana", "guarana extract", "yerba mate", "green tea extract"},
+        ],
+        "Contains caffeine from more than one source, total caffeine is higher than the listed caffeine alone",
+    ),
+]
+
+DIET_RANK = {"vegan": 0, "vegetarian": 1, "non-vegetarian": 2}
+
+# Names that contain an allergen word but aren't that allergen, left out
+# before matching ("coconut milk" is no milk, "nutmeg" no nut)
+ALLERGY_EXCLUSIONS = (
+    "nutmeg", "coconut", "butternut", "water chestnut", "eggplant",
+    "coconut milk", "almond milk", "oat milk", "rice milk", "soy milk",
+    "cocoa butter", "shea butter", "cream of tartar",
+)
+_ALLERGY_EXCLUSIONS_RE = re.compile(
+    r"\b(?:" + "|".join(re.escape(name) for name in sorted(ALLERGY_EXCLUSIONS, key=len, reverse=True)) + r")\b"
+)
+
+
+def _normalize_diet(diet_type: Optional[str]) -> Optional[str]:
+    if not diet_type:
+        return None
+    diet = diet_type.strip().lower().replace("_", "-").replace(" ", "-")
+    if diet in ("nonvegetarian", "non-veg", "nonveg"):
+        diet = "non-vegetarian"
+    return diet if diet in DIET_RANK else None
+
+
+def _preference_items(value: Any) -> List[str]:
+    if not value:
+        return []
+    items = value.split(",") if isinstance(value, str) else value
+    return [str(item).strip().lower() for item in items if str(item).strip()]
+
+
+def _allergy_term(allergy: str) -> str:
+    # "nuts" should match "tree nut", "eggs" should match "egg"
+    allergy = allergy.replace("allergy", "").strip()
+    return allergy[:-1] if len(allergy) > 3 and allergy.endswith("s") else allergy
+
+
+def _matches_allergy(term: str, text: str) -> bool:
+    # whole words only, plurals included, so "egg" matches "eggs" but not "eggplant"
+    text = _ALLERGY_EXCLUSIONS_RE.sub(" ", text)
+    return re.search(rf"\b{re.escape(term)}s?\b", text) is not None
+
+
+def _ingredient_names(ingredient: IngredientAnalysisResult) -> List[str]:
+    return [ingredient.name.lower(), *(name.lower() for name in ingredient.alternate_names)]
+
+
+def safety_score(ingredients_data: List[IngredientAnalysisResult]) -> int:
+    """Average safety rating, pulled down to at most 3 above the worst ingredient.
+
+    Ingredients without a rating (placeholders, rating 0) don't count.
+    """
+    ratings = [i.safety_rating for i in ingredients_data if i.safety_rating]
+    if not ratings:
+        return 5
+    average = sum(ratings) / len(ratings)
+    return max(1, min(10, round(min(average, min(ratings) + LOW_SAFETY_RATING))))
+
+
+def suitable_diet_types(ingredients_data: List[IngredientAnalysisResult]) -> List[str]:
+    diets = [_normalize_diet(i.diet_type) for i in ingredients_data]
+    known = [diet for diet in diets if diet is not None]
+    if not known:
+        return []
+    strictest = max(DIET_RANK[diet] for diet in known)
+    if strictest == DIET_RANK["non-vegetarian"]:
+        return ["Non-Vegetarian"]
+    if strictest == DIET_RANK["vegetarian"]:
+        return ["Vegetarian"]
+    return ["Vegan", "Vegetarian"]
+
+
+def diet_conflicts(ingredients_data: List[IngredientAnalysisResult], dietary_restrictions: Any) -> Optional[List[str]]:
+    """Ingredients that don't fit the user's vegan/vegetarian restriction, None when there is none."""
+    restrictions = _preference_items(dietary_restrictions)
+    if any("vegan" in restriction for restriction in restrictions):
+        allowed = DIET_RANK["vegan"]
+    elif any("vegetarian" in restriction and "non" not in restriction for restriction in restrictions):
+        allowed = DIET_RANK["vegetarian"]
+    else:
+        return None
+    return [
+        i.name for i in ingredients_data
+        if _normalize_diet(i.diet_type) is not None and DIET_RANK[_normalize_diet(i.diet_type)] > allowed
+    ]
+
+
+def allergy_warnings(ingredients_data: List[IngredientAnalysisResult], allergies: Any = None) -> List[str]:
+    """Matches with the user's allergies first, then the ingredients' own allergy info."""
+    warnings = []
+    for allergy in _preference_items(allergies):
+        term = _allergy_term(allergy)
+        if not term:
+            continue
+        for ingredient in ingredients_data:
+            haystack = _ingredient_names(ingredient) + [info.lower() for info in ingredient.allergic_info or []]
+            if any(_matches_allergy(term, text) for text in haystack):
+                warnings.append(f"Contains {ingredient.name}, which matches your {term} allergy")
+
+    seen = set()
+    general = []
+    for ingredient in ingredients_data:
+        for info in ingredient.allergic_info or []:
+            if info.strip() and info.strip().lower() not in seen:
+                seen.add(info.strip().lower())
+                general.append(info.strip())
+    return warnings + general[:MAX_ALLERGY_WARNINGS]
+
+
+def ingredient_interactions(ingredients_data: List[IngredientAnalysisResult]) -> List[str]:
+    names = {name for i in ingredients_data for name in _ingredient_names(i)}
+    return [
+        description for groups, description in KNOWN_INTERACTIONS
+        if all(names & group for group in groups)
+    ]
+
+
+def analyze_product_rules(
+    ingredients_data: List[IngredientAnalysisResult],
+    user_preferences: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """Product analysis computed from the ingredient data alone, no LLM involved.
+
+    Same fields as the LLM analysis. The free text fields (FREE_TEXT_FIELDS)
+    are generic, see services.productAnalyzerAgent for the LLM enrichment.
+    """
+    user_preferences = user_preferences or {}
+    score = safety_score(ingredients_data)
+    conflicts = diet_conflicts(ingredients_data, user_preferences.get("dietary_restrictions"))
+
+    concerns = [
+        f"{i.name} has a low safety rating ({i.safety_rating}/10)"
+        for i in ingredients_data if i.safety_rating and i.safety_rating <= LOW_SAFETY_RATING
+    ][:MAX_CONCERNS]
+    if conflicts:
+        concerns.insert(0, f"Not suitable for your diet: {', '.join(conflicts)}")
+
+    if score >= 7:
+        verdict = "generally safe"
+    elif score >= 4:
+        verdict = "fine in moderation"
+    else:
+        verdict = "best avoided"
+
+    return {
+        "overall_safety_score": score,
+        "suitable_diet_types": suitable_diet_types(ingredients_data),
+        "allergy_warnings": allergy_warnings(ingredients_data, user_preferences.get("allergies")),
+        "diet_compatible": None if conflicts is None else not conflicts,
+        "usage_recommendations": "Please refer to product packaging for usage guidelines",
+        "health_insights": {
+            "benefits": [],
+            "concerns": concerns,
+        },
+        "ingredient_interactions": ingredient_interactions(ingredients_data),
+        "key_takeaway": f"Product has {len(ingredients_data)} ingredients and is {verdict} (safety score {score}/10)",
+        "ingredient_ids": [i.id for i in ingredients_data],
+        "analysis_source": "rules",
+    }
+
+
+def enrich_analysis(rules_analysis: Dict[str, Any], llm_analysis: Dict[str, Any]) -> Dict[str, Any]:
+    """Rules analysis with the free text fields of an LLM analysis.
+
+    The computed fields stay as they are, interactions found by the LLM are
+    added to the known ones. A failed LLM analysis leaves it unchanged.
+    """
+    # the LLM analysis falls back to the rules when it fails
+    if llm_analysis.get("error") or llm_analysis.get("analysis_source"):
+        return rules_analysis
+    enriched = dict(rules_analysis)
+    for field in FREE_TEXT_FIELDS:
+        if llm_analysis.get(field):
+            enriched[field] = llm_analysis[field]
+    interactions = list(rules_analysis.get("ingredient_interactions", []))
+    for interaction in llm_analysis.get("ingredient_interactions") or []:
+        if interaction not in interactions:
+            interactions.append(interaction)
+    enriched["ingredient_interactions"] = interactions
+    enriched["analysis_source"] = "rules+llm"
+    return enriched
@@ -0,0 +1,56 @@
+"""Converted detector backends against the TF Hub SavedModel, on the images in trials/.
+
+Needs TensorFlow and the converted model (scripts/convert_detector.py),
+skipped otherwise. Same checks as scripts/detector_parity.py.
+"""
+import glob
+import os
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+
+pytest.importorskip("tensorflow")
+
+from detector_parity import IMAGE_PATTERNS, compare  # noqa: E402
+from utils.detection import prepare_image  # noqa: E402
+from utils.detection_backends import BACKENDS, TFHubBackend  # noqa: E402
+from utils.detection_postprocess import best_detection  # noqa: E402
+from utils.model_registry import FOOD_DETECTOR, model_registry  # noqa: E402
+
+IMAGES = sorted(
+    path for pattern in IMAGE_PATTERNS
+    for path in glob.glob(os.path.join(ROOT, "trials", "**", pattern), recursive=True)
+)
+MIN_IOU = 0.8
+MAX_SCORE_DIFF = 0.05
+
+
+@pytest.fixture(scope="module")
+def reference():
+    return TFHubBackend()
+
+
+@pytest.fixture(scope="module", params=["onnx", "tflite"])
+def candidate(request):
+    backend = BACKENDS[request.param]
+    if not os.path.exists(os.path.join(model_registry.model_dir(FOOD_DETECTOR), backend.model_file)):
+        pytest.skip(f"{backend.model_file} not converted, run scripts/convert_detector.py")
+    try:
+        return backend()
+    except ImportError as e:
+        pytest.skip(f"{request.param} runtime not installed: {e}")
+
+
+@pytest.mark.skipif(not IMAGES, reason="no images in trials/")
+@pytest.mark.parametrize("path", IMAGES, ids=os.path.basename)
+def test_best_detection_matches(reference, candidate, path):
+    with open(path, "rb") as f:
+        image = prepare_image(f.read()).array[np.newaxis, ...]
+    expected = best_detection(reference.detect(image))
+    actual = best_detection(candidate.detect(image))
+    assert compare(expected, actual, MIN_IOU, MAX_SCORE_DIFF) is None
@@ -0,0 +1,117 @@
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+import pandas as pd
+
+from logger_manager import log_info, log_warning
+from utils.text_utils import normalize_ingredient_name
+
+NAME_COLUMN = "Name of Additive"
+E_NUMBER_COLUMN = "E Numbers"
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_E_NUMBER_RE = re.compile(r"\be[\s\-]?(\d{3,4}[a-z]?)\b")
+# "Riboflavin or lactoflavin (Vitamin B2)" -> riboflavin, lactoflavin, vitamin b2
+_SYNONYM_SPLIT_RE = re.compile(r"\s+or\s+|[(),;/]")
+
+
+class AdditiveIndex:
+    """In-memory lookup structure over the scraped E-number table.
+
+    Built once from the CSV, a lookup is a few dict operations instead of
+    a pandas scan:
+    - E-number map, "E330" / "e 330" -> record
+    - normalized name and synonym hash, "lactoflavin" -> record
+    - token inverted index for partial names, "citric" -> every record
+      whose name has that token
+
+    When several records match, the first one in file order wins, as with
+    the previous `str.contains` lookup.
+    """
+
+    def __init__(self, records: List[Dict[str, Any]]):
+        self.records = records
+        self._by_e_number: Dict[str, int] = {}
+        self._by_name: Dict[str, int] = {}
+        self._by_token: Dict[str, Set[int]] = {}
+
+        for row_id, record in enumerate(records):
+            e_number = normalize_ingredient_name(record.get(E_NUMBER_COLUMN) or "")
+            if e_number:
+                self._by_e_number.setdefault(e_number, row_id)
+
+            name = record.get(NAME_COLUMN) or ""
+            for synonym in [name, *_SYNONYM_SPLIT_RE.split(name)]:
+                key = normalize_ingredient_name(synonym)
+                if key:
+                    self._by_name.setdefault(key, row_id)
+            for token in self._tokens(name):
+                self._by_token.setdefault(token, set()).add(row_id)
+
+    @classmethod
+    def from_csv(cls, path: str) -> "AdditiveIndex":
+        if not os.path.exists(path):
+            log_warning("Scraped database not found!")
+            return cls([])
+        additives_df = pd.read_csv(path, encoding="utf-8-sig")
+        # NaN isn't valid JSON once the record is stored as a source
+        records = additives_df.astype(object).where(additives_df.notna(), None).to_dict("records")
+        log_info(f"Loaded database with {len(records)} entries")
+        return cls(records)
+
+    @staticmethod
+    def _tokens(text: str) -> List[str]:
+        return _TOKEN_RE.findall(normalize_ingredient_name(text))
+
+    def _token_matches(self, query: str) -> Set[int]:
+        tokens = self._tokens(query)
+        if not tokens:
+            return set()
+        matches = None
+        for token in tokens:
+            row_ids = self._by_token.get(token)
+            if row_ids is None:
+                # partial word ("flavin"), expand to the indexed tokens containing it
+                row_ids = set()
+                for indexed_token, token_rows in self._by_token.items():
+                    if token in indexed_token:
+                        row_ids |= token_rows
+            matches = row_ids if matches is None else matches & row_ids
+            if not matches:
+                return set()
+        return matches
+
+    def lookup(self, ingredient: str) -> Optional[Dict[str, Any]]:
+        """Find the additive record for an ingredient name or E-number."""
+        key = normalize_ingredient_name(ingredient)
+        if not key or not self.records:
+            return None
+
+        row_id = self._by_e_number.get(key)
+        if row_id is None:
+            row_id = self._by_name.get(key)
+        if row_id is None:
+            # E-number mentioned with the name, e.g. "citric acid (e330)"
+            for e_number in _E_NUMBER_RE.findall(key):
+                row_id = self._by_e_number.get(f"e{e_number}")
+                if row_id is not None:
+                    break
+        if row_id is None:
+            matches = self._token_matches(key)
+            row_id = min(matches) if matches else None
+        return self.records[row_id] if row_id is not None else None
+
+    def lookup_many(self, ingredients: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Look up a whole ingredient list, returns the records found keyed by the given name."""
+        found = {}
+        for ingredient in ingredients:
+            if ingredient in found:
+                continue
+            record = self.lookup(ingredient)
+            if record is not None:
+                found[ingredient] = record
+        return found
+
+    def __len__(self) -> int:
+        return len(self.records)
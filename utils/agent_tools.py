@@ -1,78 +1,117 @@
 import asyncio
-import os
+from concurrent.futures import ThreadPoolExecutor
 
-import pandas as pd
-
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 # modular
 from logger_manager import log_error, log_info, log_warning
 
 import aiohttp
 import time
-import requests
 
+from duckduckgo_search.exceptions import RatelimitException, TimeoutException
 from langchain_community.tools import DuckDuckGoSearchRun
-from langchain_community.tools import WikipediaQueryRun
-from langchain_community.utilities.wikipedia import WikipediaAPIWrapper
 from langchain_core.tools import tool
 
+from utils.additive_index import AdditiveIndex
+from utils.deadline import remaining_time
+from utils.http_clients import http_clients
+from utils.response_cache import cached_source
+from utils.upstream_scheduler import upstream_scheduler
+
 
 # Load environment variables from .env file
-from env import PUBCHEM_MAX_RETRIES, PUBCHEM_TIMEOUT,DUCKDUCKGO_MAX_RETRIES,DUCKDUCKGO_RATE_LIMIT_DELAY,USDA_API_KEY
+from env import PUBCHEM_MAX_RETRIES, PUBCHEM_TIMEOUT,DUCKDUCKGO_MAX_RETRIES,DUCKDUCKGO_RATE_LIMIT_DELAY,USDA_API_KEY,WEB_SEARCH_WORKERS
+
+WIKIPEDIA_API = "https://en.wikipedia.org/w/api.php"
+# same defaults as langchain's WikipediaAPIWrapper
+WIKIPEDIA_TOP_K_RESULTS = 3
+WIKIPEDIA_MAX_CHARS = 4000
 
 # Load Scraped Database
 SCRAPED_DB_PATH = "data/Food_Aditives_E_numbers.csv"  # Ensure this file exists
-if os.path.exists(SCRAPED_DB_PATH):
-    additives_df = pd.read_csv(SCRAPED_DB_PATH)
-    log_info(f"Loaded database with {len(additives_df)} entries")
-else:
-    additives_df = None
-    log_warning("Scraped database not found!")
+additive_index = AdditiveIndex.from_csv(SCRAPED_DB_PATH)
 
 
-# Define tool functions
-@tool("search_local_db")
-def search_local_db(ingredient: str) -> Dict[str, Any]:
-    """Search local database for ingredient information. E number database scrapped"""
-    log_info(f"Searching local DB for: {ingredient}")
-    if additives_df is not None:
-        match = additives_df[additives_df['Name of Additive'].str.contains(ingredient, case=False, na=False, regex=False)]
-        if not match.empty:
-            return {"source": "Local DB", "found": True, "data": match.iloc[0].to_dict()}
+# Dedicated pool for the blocking DuckDuckGo client, so it can't exhaust the
+# event loop's default executor
+web_search_executor = ThreadPoolExecutor(max_workers=WEB_SEARCH_WORKERS, thread_name_prefix="web_search")
+
+
+def _raise_if_transient(response: aiohttp.ClientResponse):
+    """Turn rate limiting and server errors into an error result, so they aren't cached as "not found"."""
+    if response.status == 429 or response.status >= 500:
+        response.raise_for_status()
+
+
+def _request_timeout(seconds: float) -> aiohttp.ClientTimeout:
+    """Timeout for one upstream request, cut short by the current deadline."""
+    # aiohttp treats a zero timeout as no timeout at all
+    return aiohttp.ClientTimeout(total=max(remaining_time(seconds), 0.01))
+
+
+def _run_sync(coro):
+    """Run a tool coroutine from sync code (LangChain .invoke, scripts)."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    # called synchronously from inside a running loop, run it on a worker thread
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, coro).result()
+
+
+def local_db_result(record: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if record is not None:
+        return {"source": "Local DB", "found": True, "data": record}
     return {"source": "Local DB", "found": False, "data": None}
 
-@tool("search_open_food_facts")
-def search_open_food_facts(ingredient: str) -> Dict[str, Any]:
-    """Search Open Food Facts database for ingredient information."""
+
+def _search_local_db(ingredient: str) -> Dict[str, Any]:
+    log_info(f"Searching local DB for: {ingredient}")
+    return local_db_result(additive_index.lookup(ingredient))
+
+
+async def async_search_local_db(ingredient: str) -> Dict[str, Any]:
+    """Search local database for ingredient information. E number database scrapped"""
+    return _search_local_db(ingredient)
+
+
+@cached_source("open_food_facts")
+async def async_search_open_food_facts(ingredient: str) -> Dict[str, Any]:
+    """Asynchronously search Open Food Facts database for ingredient information."""
     log_info(f"Searching Open Food Facts for: {ingredient}")
     
     try:
         open_food_facts_api = "https://world.openfoodfacts.org/api/v0"
-        # Search for the ingredient
-        search_url = f"{open_food_facts_api}/ingredient/{ingredient.lower().replace(' ', '-')}.json"
-        response = requests.get(search_url, timeout=10)
         
-        if response.status_code == 200:
-            data = response.json()
-            if data.get("status") == 1:  # Successfully found
-                return {
-                    "source": "Open Food Facts",
-                    "found": True,
-                    "data": data
-                }
-        
-        # Try searching products containing this ingredient
-        product_search_url = f"{open_food_facts_api}/search.json?ingredients_tags={ingredient.lower().replace(' ', '_')}&page_size=5"
-        response = requests.get(product_search_url, timeout=10)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if data.get("count") > 0:
-                return {
-                    "source": "Open Food Facts Products",
-                    "found": True,
-                    "data": data
-                }
+        async with http_clients.session("open_food_facts") as session:
+            # Search for the ingredient
+            search_url = f"{open_food_facts_api}/ingredient/{ingredient.lower().replace(' ', '-')}.json"
+            async with upstream_scheduler.slot("open_food_facts"):
+                async with session.get(search_url, timeout=_request_timeout(10)) as response:
+                    _raise_if_transient(response)
+                    if response.status == 200:
+                        data = await response.json(content_type=None)
+                        if data.get("status") == 1:  # Successfully found
+                            return {
+                                "source": "Open Food Facts",
+                                "found": True,
+                                "data": data
+                            }
+            
+            # Try searching products containing this ingredient
+            product_search_url = f"{open_food_facts_api}/search.json?ingredients_tags={ingredient.lower().replace(' ', '_')}&page_size=5"
+            async with upstream_scheduler.slot("open_food_facts"):
+                async with session.get(product_search_url, timeout=_request_timeout(10)) as response:
+                    _raise_if_transient(response)
+                    if response.status == 200:
+                        data = await response.json(content_type=None)
+                        if data.get("count", 0) > 0:
+                            return {
+                                "source": "Open Food Facts Products",
+                                "found": True,
+                                "data": data
+                            }
         
         return {"source": "Open Food Facts", "found": False, "data": None}
     
@@ -80,33 +119,37 @@ def search_open_food_facts(ingredient: str) -> Dict[str, Any]:
         log_error(f"Error searching Open Food Facts: {e}",e)
         return {"source": "Open Food Facts", "found": False, "error": str(e)}
 
-@tool("search_usda")
-def search_usda(ingredient: str) -> Dict[str, Any]:
-    """Search USDA FoodData Central for ingredient information."""
+
+@cached_source("usda")
+async def async_search_usda(ingredient: str) -> Dict[str, Any]:
+    """Asynchronously search USDA FoodData Central for ingredient information."""
     log_info(f"Searching USDA for: {ingredient}")
     
     try:
         usda_api = "https://api.nal.usda.gov/fdc/v1"
         
-        # Search for the ingredient
+        # Search for the ingredient, dataType is sent as a repeated parameter
         search_url = f"{usda_api}/foods/search"
-        params = {
-            "api_key": USDA_API_KEY,
-            "query": ingredient,
-            "dataType": ["Foundation", "SR Legacy", "Branded"],
-            "pageSize": 5
-        }
+        params = [
+            ("api_key", USDA_API_KEY),
+            ("query", ingredient),
+            ("dataType", "Foundation"),
+            ("dataType", "SR Legacy"),
+            ("dataType", "Branded"),
+            ("pageSize", "5"),
+        ]
         
-        response = requests.get(search_url, params=params, timeout=10)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if data.get("totalHits", 0) > 0:
-                return {
-                    "source": "USDA FoodData Central",
-                    "found": True,
-                    "data": data
-                }
+        async with http_clients.session("usda") as session, upstream_scheduler.slot("usda"):
+            async with session.get(search_url, params=params, timeout=_request_timeout(10)) as response:
+                _raise_if_transient(response)
+                if response.status == 200:
+                    data = await response.json(content_type=None)
+                    if data.get("totalHits", 0) > 0:
+                        return {
+                            "source": "USDA FoodData Central",
+                            "found": True,
+                            "data": data
+                        }
         
         return {"source": "USDA FoodData Central", "found": False, "data": None}
     
@@ -114,6 +157,7 @@ def search_usda(ingredient: str) -> Dict[str, Any]:
         log_error(f"Error searching USDA: {e}",e)
         return {"source": "USDA FoodData Central", "found": False, "error": str(e)}
 
+@cached_source("pubchem")
 async def async_search_pubchem(ingredient: str) -> Dict[str, Any]:
     """Asynchronously search PubChem for chemical information about the ingredient."""
     log_info(f"Searching PubChem for: {ingredient}")
@@ -122,29 +166,38 @@ async def async_search_pubchem(ingredient: str) -> Dict[str, Any]:
         pubchem_api = "https://pubchem.ncbi.nlm.nih.gov/rest/pug_view/data"
         # https://pubchem.ncbi.nlm.nih.gov/docs/pug-rest#section=Input
         
-        async with aiohttp.ClientSession() as session:
+        async with http_clients.session("pubchem") as session:
             # First try to get compound information by name
             search_url = f"{pubchem_api}/compound/name/{ingredient}/JSON"
+            # failures other than "not found", so a failed lookup isn't cached as a miss
+            failures = []
             
             async def fetch_data(url: str, timeout: int = PUBCHEM_TIMEOUT, retry_count: int = 0):
                 try:
-                    async with session.get(url, timeout=timeout) as response:
-                        if response.status == 200:
-                            return await response.json()
-                        else:
-                            log_warning(f"PubChem returned status: {response.status} for URL: {url}")
-                            return None
+                    # the slot is released before any backoff sleep
+                    async with upstream_scheduler.slot("pubchem"):
+                        async with session.get(url, timeout=_request_timeout(timeout)) as response:
+                            if response.status == 200:
+                                return await response.json()
+                            else:
+                                log_warning(f"PubChem returned status: {response.status} for URL: {url}")
+                                if response.status == 429 or response.status >= 500:
+                                    failures.append(f"status {response.status}")
+                                return None
                 except asyncio.TimeoutError:
-                    if retry_count < PUBCHEM_MAX_RETRIES:
-                        delay = (2 ** retry_count) * 5  # Exponential backoff
+                    delay = (2 ** retry_count) * 5  # Exponential backoff
+                    # no point in retrying when the deadline passes before the retry could finish
+                    if retry_count < PUBCHEM_MAX_RETRIES and remaining_time() > delay + timeout:
                         log_warning(f"PubChem timeout for URL '{url}'. Retrying in {delay:.2f} seconds (attempt {retry_count + 1}/{PUBCHEM_MAX_RETRIES})")
                         await asyncio.sleep(delay)
                         return await fetch_data(url, timeout, retry_count + 1)  # Recursive retry
                     else:
-                        log_error(f"Max retries reached for PubChem timeout on URL: {url}",asyncio.TimeoutError)
+                        log_error(f"Giving up on PubChem timeout for URL: {url}",asyncio.TimeoutError)
+                        failures.append("timeout")
                         return None
                 except Exception as e:
                     log_error(f"PubChem error for URL '{url}': {e}",e)
+                    failures.append(str(e))
                     return None
             
             data = await fetch_data(search_url)
@@ -170,56 +223,81 @@ async def async_search_pubchem(ingredient: str) -> Dict[str, Any]:
                     }
                 }
             
+            if failures:
+                return {"source": "PubChem", "found": False, "error": failures[0]}
             return {"source": "PubChem", "found": False, "data": None}
     
     except Exception as e:
         log_error(f"Error searching PubChem: {e}",e)
         return {"source": "PubChem", "found": False, "error": str(e)}
 
-@tool("search_pubchem")
-def search_pubchem(ingredient: str) -> Dict[str, Any]:
-    """Search PubChem for chemical information about the ingredient."""
-    # Use asyncio.run to handle the async operation from synchronous code
-    try:
-        # For Python 3.7+
-        return asyncio.run(async_search_pubchem(ingredient))
-    except RuntimeError:
-        # If already in an event loop (e.g., in FastAPI)
-        loop = asyncio.get_event_loop()
-        return loop.run_until_complete(async_search_pubchem(ingredient))
+async def _wikipedia_query(session: aiohttp.ClientSession, query: str) -> str:
+    """Search Wikipedia and return the intro of the top pages, formatted like WikipediaAPIWrapper."""
+    search_params = {
+        "action": "query",
+        "list": "search",
+        "srsearch": query,
+        "srlimit": str(WIKIPEDIA_TOP_K_RESULTS),
+        "srprop": "",
+        "format": "json",
+    }
+    async with upstream_scheduler.slot("wikipedia"):
+        async with session.get(WIKIPEDIA_API, params=search_params, timeout=_request_timeout(10)) as response:
+            _raise_if_transient(response)
+            if response.status != 200:
+                log_warning(f"Wikipedia search returned status: {response.status}")
+                return ""
+            search_data = await response.json(content_type=None)
     
-@tool("search_wikipedia")
-def search_wikipedia(ingredient: str) -> Dict[str, Any]:
-    """Search Wikipedia for ingredient information."""
+    titles = [item["title"] for item in search_data.get("query", {}).get("search", [])]
+    if not titles:
+        return ""
+    
+    # One request for the intro extracts of all result pages
+    extract_params = {
+        "action": "query",
+        "prop": "extracts",
+        "exintro": "1",
+        "explaintext": "1",
+        "redirects": "1",
+        "titles": "|".join(titles),
+        "format": "json",
+    }
+    async with upstream_scheduler.slot("wikipedia"):
+        async with session.get(WIKIPEDIA_API, params=extract_params, timeout=_request_timeout(10)) as response:
+            _raise_if_transient(response)
+            if response.status != 200:
+                log_warning(f"Wikipedia extracts returned status: {response.status}")
+                return ""
+            extract_data = await response.json(content_type=None)
+    
+    extracts = {
+        page.get("title"): page.get("extract", "")
+        for page in extract_data.get("query", {}).get("pages", {}).values()
+    }
+    summaries = [
+        f"Page: {title}\nSummary: {extracts[title]}"
+        for title in titles if extracts.get(title)
+    ]
+    return "\n\n".join(summaries)[:WIKIPEDIA_MAX_CHARS]
+
+
+@cached_source("wikipedia")
+async def async_search_wikipedia(ingredient: str) -> Dict[str, Any]:
+    """Asynchronously search Wikipedia for ingredient information."""
     log_info(f"Searching Wikipedia for: {ingredient}")
     
     try:
-        wikipedia = WikipediaQueryRun(api_wrapper=WikipediaAPIWrapper())
-        wiki_result = wikipedia.run(ingredient)
-        
-        if wiki_result and len(wiki_result) > 100:  # Only count substantial results
-            return {
-                "source": "Wikipedia",
-                "found": True,
-                "data": wiki_result
-            }
-        else:
-            # Try with more specific searches
-            food_wiki = wikipedia.run(f"{ingredient} food additive")
-            if food_wiki and len(food_wiki) > 100:
-                return {
-                    "source": "Wikipedia",
-                    "found": True,
-                    "data": food_wiki
-                }
-            
-            chemical_wiki = wikipedia.run(f"{ingredient} chemical compound")
-            if chemical_wiki and len(chemical_wiki) > 100:
-                return {
-                    "source": "Wikipedia",
-                    "found": True,
-                    "data": chemical_wiki
-                }
+        async with http_clients.session("wikipedia") as session:
+            # Try the plain name first, then more specific searches
+            for query in [ingredient, f"{ingredient} food additive", f"{ingredient} chemical compound"]:
+                wiki_result = await _wikipedia_query(session, query)
+                if wiki_result and len(wiki_result) > 100:  # Only count substantial results
+                    return {
+                        "source": "Wikipedia",
+                        "found": True,
+                        "data": wiki_result
+                    }
         
         return {"source": "Wikipedia", "found": False, "data": None}
     
@@ -227,16 +305,18 @@ def search_wikipedia(ingredient: str) -> Dict[str, Any]:
         log_error(f"Error searching Wikipedia: {e}",e)
         return {"source": "Wikipedia", "found": False, "error": str(e)}
 
-@tool("search_web")
-def search_web(ingredient: str) -> Dict[str, Any]:
-    """Search web for ingredient information using DuckDuckGo."""
+
+def _web_search_queries(ingredient: str) -> List[str]:
+    return [f"{ingredient} food ingredient safety", f"{ingredient} E-number food additive",f"{ingredient}'s allergic information",f"is {ingredient} vegan,vegetarian or Non-vegetarian"]
+
+
+def _search_web_blocking(ingredient: str) -> Dict[str, Any]:
     log_info(f"Searching web for: {ingredient}")
     
     try:
         duckduckgo = DuckDuckGoSearchRun()
-        search_queries = [f"{ingredient} food ingredient safety", f"{ingredient} E-number food additive",f"{ingredient}'s allergic information",f"is {ingredient} vegan,vegetarian or Non-vegetarian"]
         all_results = []
-        for query in search_queries:
+        for query in _web_search_queries(ingredient):
             time.sleep(DUCKDUCKGO_RATE_LIMIT_DELAY)
             result = duckduckgo.run(query)
             if result:
@@ -245,3 +325,80 @@ def search_web(ingredient: str) -> Dict[str, Any]:
     except Exception as e:
         log_error(f"Web search error: {e}",e)
         return {"source": "DuckDuckGo", "found": False, "error": str(e)}
+
+
+async def _duckduckgo_query(duckduckgo: DuckDuckGoSearchRun, query: str) -> str:
+    """Run one DuckDuckGo query within the adaptive duckduckgo budget, retrying when throttled."""
+    loop = asyncio.get_running_loop()
+    for attempt in range(DUCKDUCKGO_MAX_RETRIES + 1):
+        try:
+            # the blocking client runs on its own bounded pool
+            async with upstream_scheduler.slot("duckduckgo"):
+                result = await loop.run_in_executor(web_search_executor, duckduckgo.run, query)
+            upstream_scheduler.report_success("duckduckgo")
+            return result
+        except (RatelimitException, TimeoutException) as e:
+            if isinstance(e, RatelimitException):
+                upstream_scheduler.report_throttle("duckduckgo")
+            delay = DUCKDUCKGO_RATE_LIMIT_DELAY * (2 ** attempt)  # Exponential backoff
+            if attempt >= DUCKDUCKGO_MAX_RETRIES or remaining_time() <= delay:
+                raise
+            log_warning(f"DuckDuckGo {type(e).__name__} for '{query}'. Retrying in {delay} seconds (attempt {attempt + 1}/{DUCKDUCKGO_MAX_RETRIES})")
+            await asyncio.sleep(delay)
+
+
+@cached_source("duckduckgo")
+async def async_search_web(ingredient: str) -> Dict[str, Any]:
+    """Search web for ingredient information using DuckDuckGo."""
+    log_info(f"Searching web for: {ingredient}")
+    
+    duckduckgo = DuckDuckGoSearchRun()
+    queries = _web_search_queries(ingredient)
+    # all queries at once, pacing comes from the shared duckduckgo budget
+    results = await asyncio.gather(*[_duckduckgo_query(duckduckgo, query) for query in queries], return_exceptions=True)
+    
+    all_results = []
+    errors = []
+    for query, result in zip(queries, results):
+        if isinstance(result, Exception):
+            log_error(f"Web search error for '{query}': {result}", result)
+            errors.append(str(result))
+        elif result:
+            all_results.append({"query": query, "result": result})
+    
+    if errors and not all_results:
+        return {"source": "DuckDuckGo", "found": False, "error": errors[0]}
+    # partial results are used but not cached
+    return {"source": "DuckDuckGo", "found": bool(all_results), "data": all_results, "partial": bool(errors)}
+
+
+# LangChain tool wrappers, for agent use and sync callers
+@tool("search_local_db")
+def search_local_db(ingredient: str) -> Dict[str, Any]:
+    """Search local database for ingredient information. E number database scrapped"""
+    return _search_local_db(ingredient)
+
+@tool("search_open_food_facts")
+def search_open_food_facts(ingredient: str) -> Dict[str, Any]:
+    """Search Open Food Facts database for ingredient information."""
+    return _run_sync(async_search_open_food_facts(ingredient))
+
+@tool("search_usda")
+def search_usda(ingredient: str) -> Dict[str, Any]:
+    """Search USDA FoodData Central for ingredient information."""
+    return _run_sync(async_search_usda(ingredient))
+
+@tool("search_pubchem")
+def search_pubchem(ingredient: str) -> Dict[str, Any]:
+    """Search PubChem for chemical information about the ingredient."""
+    return _run_sync(async_search_pubchem(ingredient))
+    
+@tool("search_wikipedia")
+def search_wikipedia(ingredient: str) -> Dict[str, Any]:
+    """Search Wikipedia for ingredient information."""
+    return _run_sync(async_search_wikipedia(ingredient))
+
+@tool("search_web")
+def search_web(ingredient: str) -> Dict[str, Any]:
+    """Search web for ingredient information using DuckDuckGo."""
+    return _search_web_blocking(ingredient)
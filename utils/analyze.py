@@ -1,56 +1,109 @@
-import asyncio
 from datetime import datetime
 import pytz
-from typing import List, Dict, Any
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
+from env import REQUEST_DEADLINE_SECONDS
 from logger_manager import log_info, log_error
 from services.productAnalyzerAgent import analyze_product_ingredients
-from utils.ingredient_utils import process_single_ingredient
+from utils.deadline import deadline_scope
+from utils.ingredient_utils import iter_ingredients, process_ingredients
+from utils.upstream_scheduler import upstream_scheduler
 
-# Load environment variables
-from env import PARALLEL_RATE_LIMIT
 
-log_info(f"Using parallel rate limit of {PARALLEL_RATE_LIMIT}")
+def _report(progress, stage: str, **details):
+    if progress is not None:
+        progress(stage, **details)
 
-# Create a semaphore to limit concurrent API calls
-llm_semaphore = asyncio.Semaphore(PARALLEL_RATE_LIMIT)
 
+async def analyze_product(
+    product_ingredients: List[str],
+    user_preferences: Optional[Dict[str, Any]] = None,
+    progress=None,
+    wait_for_enrichment: bool = False,
+    user_id: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Analyze each ingredient, then the product as a whole.
 
-async def process_product_ingredients(product_ingredients: List[str]) -> Dict[str, Any]:    
-    log_info(f"process_product_ingredients called for {len(product_ingredients)} ingredients")
-    try:
+    `progress(stage, **details)` is called as the analysis goes (see
+    services.job_queue), errors are raised. wait_for_enrichment and user_id
+    are passed on to analyze_product_ingredients.
+    """
+    # upstream capacity is shared fairly between concurrent products
+    upstream_scheduler.new_flow()
+
+    # everything below is cut off at the deadline, with partial results
+    with deadline_scope(REQUEST_DEADLINE_SECONDS):
         # Step 1: Process individual ingredients
-        ingredient_results = []
-            
-        log_info(f"Starting parallel ingredient processing with rate limit {PARALLEL_RATE_LIMIT}")
-        
-        # Create tasks for parallel processing
-        tasks = []
-        for ingredient_name in product_ingredients:
-            task = process_single_ingredient(ingredient_name)
-            tasks.append(task)
-        
-        # Execute tasks concurrently with rate limiting
-        ingredient_results = await asyncio.gather(*tasks)
+        log_info("Starting parallel ingredient processing")
+        _report(progress, "ingredients", ingredients_count=len(product_ingredients))
+
+        # Known ingredients are resolved in one query, only new ones are researched
+        ingredient_results = await process_ingredients(product_ingredients)
         log_info(f"Completed parallel processing of {len(ingredient_results)} ingredients")
-            
+
+        # Step 2: Generate aggregate analysis with product analyzer agent
+        _report(progress, "product_analysis", processed_ingredients=len(ingredient_results))
+        product_analysis = await analyze_product_ingredients(
+            ingredients_data=ingredient_results,
+            user_preferences=user_preferences,
+            wait_for_enrichment=wait_for_enrichment,
+            user_id=user_id,
+        )
+
+    # Step 3: Prepare final response
+    return {
+        "ingredients_count": len(product_ingredients),
+        "processed_ingredients": ingredient_results,
+        "ingredient_ids": product_analysis["ingredient_ids"],
+        "overall_analysis": product_analysis,
+        "timed_out": any(i.timed_out for i in ingredient_results) or bool(product_analysis.get("timed_out")),
+        "timestamp": datetime.now(tz=pytz.timezone('Asia/Kolkata')).isoformat()
+    }
+
+
+async def stream_product_analysis(
+    product_ingredients: List[str],
+    user_preferences: Optional[Dict[str, Any]] = None,
+    user_id: Optional[int] = None,
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """Like analyze_product, but yields each ingredient as soon as it resolves.
+
+    Yields ("ingredient", {"index", "ingredient"}) per ingredient, known ones
+    first, then ("overall_analysis", {...}) with the product analysis last.
+    """
+    upstream_scheduler.new_flow()
+
+    with deadline_scope(REQUEST_DEADLINE_SECONDS):
+        ingredient_results = [None] * len(product_ingredients)
+        async for index, result in iter_ingredients(product_ingredients):
+            ingredient_results[index] = result
+            yield "ingredient", {"index": index, "ingredient": result}
+
         product_analysis = await analyze_product_ingredients(
-            ingredients_data=ingredient_results
+            ingredients_data=ingredient_results,
+            user_preferences=user_preferences,
+            user_id=user_id,
         )
-        
-        # print("Product analysis result:", product_analysis)
-        
-        # Step 3: Prepare final response
-        result = {
-            "ingredients_count": len(product_ingredients),
-            "processed_ingredients": ingredient_results,
-            "ingredient_ids": product_analysis["ingredient_ids"],
-            "overall_analysis": product_analysis,
-            "timestamp": datetime.now(tz=pytz.timezone('Asia/Kolkata')).isoformat()
-        }
 
+    yield "overall_analysis", {
+        "ingredients_count": len(product_ingredients),
+        "ingredient_ids": product_analysis["ingredient_ids"],
+        "overall_analysis": product_analysis,
+        "timed_out": any(i.timed_out for i in ingredient_results) or bool(product_analysis.get("timed_out")),
+        "timestamp": datetime.now(tz=pytz.timezone('Asia/Kolkata')).isoformat()
+    }
+
+
+async def process_product_ingredients(
+    product_ingredients: List[str],
+    progress=None,
+    wait_for_enrichment: bool = False,
+) -> Dict[str, Any]:
+    log_info(f"process_product_ingredients called for {len(product_ingredients)} ingredients")
+    try:
+        result = await analyze_product(product_ingredients, progress=progress, wait_for_enrichment=wait_for_enrichment)
         log_info("process_product_ingredients completed successfully")
         return result
-        
+
     except Exception as e:
         log_error(f"Error in process_product_ingredients: {str(e)}",e)
         return None
@@ -1,12 +1,13 @@
 from typing import Dict, List,Any
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from interfaces.ingredientModels import IngredientAnalysisResult
 from interfaces.productModels import ProductCreate
 from db.models import Marker
 from logger_manager import log_info, log_error
 from fastapi import HTTPException
 import os
-from services.product_service import ProductService
+from db.repositories import AsyncProductRepository
 from utils.vuforia_utils import add_target_to_vuforia
 from env import UPLOADED_IMAGES_DIR # Assuming add_target_to_vuforia and UPLOADED_IMAGES_DIR are needed and will remain in product.py for now. If they are also moved, the import needs adjustment.
 import json
@@ -26,6 +27,11 @@ def ingredient_db_to_pydantic(db_ingredient):
         else:
             health_effects = db_ingredient.health_effects or ["Unknown"]
             
+        if isinstance(db_ingredient.allergic_info, str):
+            allergic_info = json.loads(db_ingredient.allergic_info)
+        else:
+            allergic_info = db_ingredient.allergic_info
+            
         # Handle details_with_source, which should be a list of dictionaries
         if hasattr(db_ingredient, 'sources') and db_ingredient.sources:
             details = []
@@ -48,7 +54,10 @@ def ingredient_db_to_pydantic(db_ingredient):
             safety_rating=db_ingredient.safety_rating or 5,
             description=db_ingredient.description or "No description available",
             health_effects=health_effects,
-            details_with_source=details
+            details_with_source=details,
+            allergic_info=allergic_info,
+            diet_type=db_ingredient.diet_type,
+            updated_at=db_ingredient.updated_at or db_ingredient.created_at
         )
     except Exception as e:
         log_error(f"Error converting DB ingredient to Pydantic model: {e}", e)
@@ -61,14 +70,16 @@ def ingredient_db_to_pydantic(db_ingredient):
             safety_rating=db_ingredient.safety_rating or 5,
             description=db_ingredient.description or "No description available",
             health_effects=["Unknown"],
-            details_with_source=[]
+            details_with_source=[],
+            diet_type=db_ingredient.diet_type,
+            updated_at=db_ingredient.updated_at or db_ingredient.created_at
         )
 
 
 async def add_product_to_database(
     product_id: int,
     image_names: List[str],
-    db: Session,
+    db: AsyncSession,
     product_data: Dict[str, Any],
 ):
     """
@@ -76,8 +87,7 @@ async def add_product_to_database(
     """
     try:
         log_info(f"Adding markers to product with ID {product_id} in database")
-        product_service = ProductService(db)
-        product = product_service.get_product_by_id(product_id)
+        product = await AsyncProductRepository(db).get_product_by_id(product_id)
         if not product:
             raise Exception(f"Product with ID {product_id} not found")
 
@@ -86,7 +96,9 @@ async def add_product_to_database(
             image_path = os.path.join(UPLOADED_IMAGES_DIR, image_name)
 
             vuforia_id = await add_target_to_vuforia(image_name, image_path)
-            existing_marker = db.query(Marker).filter_by(image_name=image_name, product_id=product.id).first()
+            existing_marker = (await db.execute(
+                select(Marker).filter_by(image_name=image_name, product_id=product.id).limit(1)
+            )).scalars().first()
 
             if not existing_marker:
                 marker = Marker(image_name=image_name, vuforia_id=vuforia_id, product_id=product.id)
@@ -95,10 +107,10 @@ async def add_product_to_database(
                 log_info(f"Marker {image_name} already exists for product {product_id}. Updating Vuforia ID.")
                 existing_marker.vuforia_id = vuforia_id
 
-        db.commit()
+        await db.commit()
         log_info(f"Product markers added/updated successfully in database")
         return True
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         log_error(f"Error adding/updating markers for product {product_id} in database: {e}",e)
         raise HTTPException(status_code=500, detail=f"Error adding/updating markers for product {product_id}: {e}")
\ No newline at end of file
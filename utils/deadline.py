@@ -0,0 +1,83 @@
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class Deadline:
+    """Point in (monotonic) time by which a piece of work has to be done.
+
+    A request creates one with `deadline_scope`, everything it awaits reads
+    the remaining budget from `remaining_time` and caps its own timeouts,
+    backoffs and retries with it. Nested scopes can only shorten it.
+    """
+
+    def __init__(self, expires_at: float):
+        self.expires_at = expires_at
+
+    @classmethod
+    def after(cls, seconds: float) -> "Deadline":
+        return cls(time.monotonic() + seconds)
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def child(self, seconds: float) -> "Deadline":
+        """A deadline `seconds` from now, but never later than this one."""
+        return Deadline(min(self.expires_at, time.monotonic() + seconds))
+
+
+# Deadline of the current request, tasks started by it inherit it
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar("deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+@contextmanager
+def deadline_scope(seconds: float) -> Iterator[Deadline]:
+    """Run the block (and the tasks it starts) under a deadline `seconds` from now.
+
+    Within an outer scope the earlier of both deadlines applies.
+    """
+    parent = _current_deadline.get()
+    deadline = parent.child(seconds) if parent is not None else Deadline.after(seconds)
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        try:
+            _current_deadline.reset(token)
+        except ValueError:
+            # an async generator holding the scope across a yield was closed
+            # from another context (e.g. after the client went away)
+            pass
+
+
+def remaining_time(cap: float = float("inf"), reserve: float = 0.0) -> float:
+    """Seconds left before the current deadline, at most `cap` (`cap` when there is no deadline).
+
+    `reserve` seconds are kept free for work that still has to happen after.
+    """
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return cap
+    return min(cap, max(0.0, deadline.remaining() - reserve))
+
+
+async def within_deadline(aw: Awaitable[T], cap: Optional[float] = None, reserve: float = 0.0) -> T:
+    """Await `aw`, cancelling it once the current deadline (less `reserve`, or `cap` seconds) passed.
+
+    Raises asyncio.TimeoutError like asyncio.wait_for.
+    """
+    timeout = remaining_time(cap if cap is not None else float("inf"), reserve)
+    if timeout == float("inf"):
+        return await aw
+    return await asyncio.wait_for(aw, timeout=timeout)
@@ -0,0 +1,102 @@
+import io
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+from env import DETECTION_BATCH_WAIT_MS, DETECTION_INPUT_SIZE, FOOD_DETECTOR_MAX_BATCH_SIZE
+from logger_manager import log_error
+from utils.detection_backends import get_detector_backend
+from utils.micro_batcher import MicroBatcher, pad_to_common_shape
+from utils.model_registry import FOOD_DETECTOR
+
+
+@dataclass
+class PreparedImage:
+    """An upload decoded and downscaled for the detector."""
+    array: np.ndarray  # uint8, height x width x 3, at most DETECTION_INPUT_SIZE per side
+
+
+def prepare_image(image_data: bytes, max_side: int = DETECTION_INPUT_SIZE) -> PreparedImage:
+    """Decode an upload at the detector's working size.
+
+    JPEGs are decoded in draft mode straight at 1/2, 1/4 or 1/8 scale (the
+    smallest still at least max_side), so a 12MP photo is never decoded at
+    full resolution. Boxes are normalized, so they apply to the original too.
+    """
+    image = Image.open(io.BytesIO(image_data))
+    original_size = image.size
+    ratio = min(1.0, max_side / max(original_size))
+    image.draft("RGB", (int(original_size[0] * ratio), int(original_size[1] * ratio)))
+    image = image.convert("RGB")
+    if max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.Resampling.BILINEAR)
+    return PreparedImage(array=np.asarray(image))
+
+
+def crop_original(image_data: bytes, box, max_side: Optional[int] = None) -> Image.Image:
+    """Crop a normalized box (ymin, xmin, ymax, xmax) out of the upload, at full resolution.
+
+    Only the crop is converted to RGB. With max_side set, JPEGs are decoded in
+    draft mode at the smallest scale that still gives the crop max_side.
+    """
+    image = Image.open(io.BytesIO(image_data))
+    ymin, xmin, ymax, xmax = box
+    if max_side:
+        crop_side = max((xmax - xmin) * image.width, (ymax - ymin) * image.height, 1)
+        ratio = min(1.0, max_side / crop_side)
+        image.draft("RGB", (int(image.width * ratio), int(image.height * ratio)))
+    # the box is normalized, so it applies at whatever scale the draft decoded
+    width, height = image.size
+    cropped = image.crop((int(xmin * width), int(ymin * height), int(xmax * width), int(ymax * height))).convert("RGB")
+    if max_side and max(cropped.size) > max_side:
+        cropped.thumbnail((max_side, max_side), Image.Resampling.BILINEAR)
+    return cropped
+
+
+def detect_batch(images: List[np.ndarray]) -> List[Dict[str, np.ndarray]]:
+    """Run the detector once on a batch of images, one result dict per image."""
+    # TF Hub, ONNX Runtime or TFLite, see utils.detection_backends
+    backend = get_detector_backend()
+    if len(images) == 1:
+        return [backend.detect(images[0][np.newaxis, ...])]
+
+    # batched models have a leading batch dimension on every output, boxes
+    # are relative to the padded image and scaled back to each image
+    batch, scales = pad_to_common_shape(images)
+    results = backend.detect(batch)
+    per_image = []
+    for i, (height_scale, width_scale) in enumerate(scales):
+        image_results = {k: v[i] for k, v in results.items()}
+        boxes = image_results["detection_boxes"] * np.array([height_scale, width_scale, height_scale, width_scale])
+        image_results["detection_boxes"] = np.clip(boxes, 0.0, 1.0)
+        per_image.append(image_results)
+    return per_image
+
+
+def warm_up_detector():
+    """Load the detector and run one inference, so the first request doesn't pay for it."""
+    try:
+        get_detector_backend().warm_up()
+    except Exception as e:
+        # not fatal, the first request retries and reports the error there
+        log_error(f"Error warming up the detector: {e}", e)
+
+
+# concurrent detections share forward passes when the detector takes batches,
+# with batches of one the pool threads call the detector themselves
+detection_batcher = (
+    MicroBatcher(FOOD_DETECTOR, detect_batch, FOOD_DETECTOR_MAX_BATCH_SIZE, DETECTION_BATCH_WAIT_MS)
+    if FOOD_DETECTOR_MAX_BATCH_SIZE > 1 else None
+)
+
+
+def run_object_detection(image):
+    """Detect objects in a PIL image or uint8 array, see prepare_image for uploads."""
+    image_np = np.asarray(image)
+    if detection_batcher is None:
+        results = detect_batch([image_np])[0]
+    else:
+        results = detection_batcher(image_np)
+    return results, image_np
@@ -0,0 +1,164 @@
+import json
+import os
+import threading
+from typing import Dict, Optional
+
+import numpy as np
+
+from env import DETECTOR_BACKEND, INFERENCE_INTRA_OP_THREADS
+from logger_manager import log_info
+from utils.model_registry import FOOD_DETECTOR, get_detector, model_registry
+
+# Files of the converted detector next to the SavedModel in the model store,
+# written by scripts/convert_detector.py
+ONNX_MODEL_FILE = "detector.onnx"
+TFLITE_MODEL_FILE = "detector.tflite"
+LABELS_FILE = "labels.json"
+
+
+class DetectorBackend:
+    """Runs the food detector on a uint8 batch (N x height x width x 3).
+
+    Returns the outputs of the TF Hub signature: detection_boxes,
+    detection_scores, detection_class_labels and detection_class_entities
+    (bytes), without a batch dimension for a batch of one.
+    """
+
+    name = "base"
+
+    def detect(self, images: np.ndarray) -> Dict[str, np.ndarray]:
+        raise NotImplementedError
+
+    def warm_up(self):
+        self.detect(np.zeros((1, 480, 640, 3), dtype=np.uint8))
+
+
+class TFHubBackend(DetectorBackend):
+    """The SavedModel from the model store, run by TensorFlow."""
+
+    name = "tfhub"
+
+    def detect(self, images: np.ndarray) -> Dict[str, np.ndarray]:
+        import tensorflow as tf
+        # images stay uint8 up to here, the model's signature takes floats in [0, 1]
+        input_tensor = tf.image.convert_image_dtype(tf.convert_to_tensor(images), tf.float32)
+        return {k: v.numpy() for k, v in get_detector()(input_tensor).items()}
+
+    def warm_up(self):
+        model_registry.warm_up(FOOD_DETECTOR)
+
+
+class _ConvertedBackend(DetectorBackend):
+    """Shared by the converted models, which can't output strings: class
+    labels are mapped to entity names with the labels file."""
+
+    model_file = ""
+
+    def __init__(self):
+        self.model_path = os.path.join(model_registry.model_dir(FOOD_DETECTOR), self.model_file)
+        if not os.path.exists(self.model_path):
+            raise FileNotFoundError(f"{self.model_path} not found, run scripts/convert_detector.py first")
+        with open(os.path.join(model_registry.model_dir(FOOD_DETECTOR), LABELS_FILE)) as f:
+            labels = {int(label): entity for label, entity in json.load(f).items()}
+        # unknown labels map to b"", never a target class
+        self._entities = np.full(max(labels, default=0) + 1, b"", dtype=object)
+        for label, entity in labels.items():
+            self._entities[label] = entity.encode("utf-8")
+
+    def _input(self, images: np.ndarray, dtype) -> np.ndarray:
+        if np.dtype(dtype) == np.uint8:
+            return images
+        return images.astype(np.float32) / 255.0
+
+    def _with_entities(self, outputs: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        outputs = {name.split(":")[0]: np.asarray(value) for name, value in outputs.items()}
+        if "detection_class_entities" not in outputs:
+            labels = outputs["detection_class_labels"].astype(np.int64)
+            known = labels < self._entities.size
+            entities = np.full(labels.shape, b"", dtype=object)
+            entities[known] = self._entities[labels[known]]
+            outputs["detection_class_entities"] = entities
+        return outputs
+
+
+class ONNXBackend(_ConvertedBackend):
+    """The converted detector run by ONNX Runtime on CPU, no TensorFlow needed."""
+
+    name = "onnx"
+    model_file = ONNX_MODEL_FILE
+
+    def __init__(self):
+        super().__init__()
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        if INFERENCE_INTRA_OP_THREADS:
+            options.intra_op_num_threads = INFERENCE_INTRA_OP_THREADS
+        # sessions can be run from several threads at once
+        self._session = ort.InferenceSession(self.model_path, options, providers=["CPUExecutionProvider"])
+        self._input_meta = self._session.get_inputs()[0]
+        self._output_names = [output.name for output in self._session.get_outputs()]
+
+    def detect(self, images: np.ndarray) -> Dict[str, np.ndarray]:
+        dtype = np.uint8 if self._input_meta.type == "tensor(uint8)" else np.float32
+        values = self._session.run(None, {self._input_meta.name: self._input(images, dtype)})
+        return self._with_entities(dict(zip(self._output_names, values)))
+
+
+def _tflite_interpreter_class():
+    # the standalone runtimes are far lighter than TensorFlow
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+    return Interpreter
+
+
+class TFLiteBackend(_ConvertedBackend):
+    """The converted, quantized detector run by the TFLite interpreter."""
+
+    name = "tflite"
+    model_file = TFLITE_MODEL_FILE
+
+    def __init__(self):
+        super().__init__()
+        self._interpreter_class = _tflite_interpreter_class()
+        # interpreters aren't thread-safe, one per inference thread
+        self._local = threading.local()
+
+    def _runner(self):
+        runner = getattr(self._local, "runner", None)
+        if runner is None:
+            interpreter = self._interpreter_class(
+                model_path=self.model_path,
+                num_threads=INFERENCE_INTRA_OP_THREADS or None,
+            )
+            runner = self._local.runner = interpreter.get_signature_runner()
+        return runner
+
+    def detect(self, images: np.ndarray) -> Dict[str, np.ndarray]:
+        runner = self._runner()
+        input_name, details = next(iter(runner.get_input_details().items()))
+        # the signature runner resizes its input to each image's shape
+        return self._with_entities(runner(**{input_name: self._input(images, details["dtype"])}))
+
+
+BACKENDS = {backend.name: backend for backend in (TFHubBackend, ONNXBackend, TFLiteBackend)}
+
+_backend: Optional[DetectorBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_detector_backend() -> DetectorBackend:
+    """The DETECTOR_BACKEND backend, created once per process."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if DETECTOR_BACKEND not in BACKENDS:
+                    raise ValueError(f"Unknown DETECTOR_BACKEND {DETECTOR_BACKEND}, expected one of {', '.join(BACKENDS)}")
+                _backend = BACKENDS[DETECTOR_BACKEND]()
+                log_info(f"Using the {DETECTOR_BACKEND} detector backend")
+    return _backend
@@ -0,0 +1,136 @@
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+# Classes you care about
+TARGET_CLASSES = frozenset(["Food processor", "Fast food", "Food", "Seafood", "Snack"])
+
+
+@dataclass
+class Detection:
+    box: np.ndarray  # ymin, xmin, ymax, xmax, normalized
+    class_name: str
+    score: float
+
+
+class _ClassMask:
+    """Which of the detector's integer class labels belong to a set of classes.
+
+    Filled in lazily: the first time a label shows up its entity name is
+    compared once, afterwards filtering is a single array lookup. Shared by
+    the inference threads, the lookup table is only ever replaced as a whole.
+    """
+
+    def __init__(self, classes: Iterable[str]):
+        self.entities = np.array(sorted(name.encode("utf-8") for name in classes), dtype=object)
+        # (known, matches), always the same size, published in one assignment
+        self._table = (np.zeros(0, dtype=bool), np.zeros(0, dtype=bool))
+        self._lock = threading.Lock()
+
+    def __call__(self, labels: np.ndarray, entities: np.ndarray) -> np.ndarray:
+        known, matches = self._table
+        if not labels.size:
+            return np.zeros(0, dtype=bool)
+        if labels.max() < known.size and known[labels].all():
+            return matches[labels]
+
+        with self._lock:
+            known, matches = self._table
+            size = max(known.size, int(labels.max()) + 1)
+            known = np.concatenate([known, np.zeros(size - known.size, dtype=bool)])
+            matches = np.concatenate([matches, np.zeros(size - matches.size, dtype=bool)])
+            unknown = ~known[labels]
+            new_labels, first = np.unique(labels[unknown], return_index=True)
+            matches[new_labels] = np.isin(entities[np.flatnonzero(unknown)[first]], self.entities)
+            known[new_labels] = True
+            self._table = (known, matches)
+        return matches[labels]
+
+
+_target_mask = _ClassMask(TARGET_CLASSES)
+
+
+def _class_mask(classes: Iterable[str]) -> _ClassMask:
+    return _target_mask if classes is TARGET_CLASSES else _ClassMask(classes)
+
+
+def _iou(box: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    ymin = np.maximum(box[0], boxes[:, 0])
+    xmin = np.maximum(box[1], boxes[:, 1])
+    ymax = np.minimum(box[2], boxes[:, 2])
+    xmax = np.minimum(box[3], boxes[:, 3])
+    intersection = np.clip(ymax - ymin, 0, None) * np.clip(xmax - xmin, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return intersection / np.maximum(area + areas - intersection, 1e-9)
+
+
+def _nms(boxes: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """Indices of the boxes kept by greedy non-maximum suppression, boxes sorted by score."""
+    keep = []
+    remaining = np.arange(len(boxes))
+    while remaining.size:
+        keep.append(remaining[0])
+        overlaps = _iou(boxes[remaining[0]], boxes[remaining[1:]])
+        remaining = remaining[1:][overlaps <= iou_threshold]
+    return np.array(keep, dtype=int)
+
+
+def _select(results: Dict[str, np.ndarray], classes: Iterable[str], min_score: float):
+    """Indices of the detections of the given classes above min_score, and the class key per detection."""
+    scores = np.asarray(results["detection_scores"])
+    entities = np.asarray(results["detection_class_entities"], dtype=object)
+    class_mask = _class_mask(classes)
+    if "detection_class_labels" in results:
+        labels = np.asarray(results["detection_class_labels"]).astype(np.int64, copy=False)
+        in_classes = class_mask(labels, entities)
+    else:
+        labels = entities
+        in_classes = np.isin(entities, class_mask.entities)
+    return np.flatnonzero(in_classes & (scores > min_score)), labels
+
+
+def _detection(results: Dict[str, np.ndarray], i: int) -> Detection:
+    return Detection(
+        box=np.asarray(results["detection_boxes"])[i],
+        class_name=results["detection_class_entities"][i].decode("utf-8"),
+        score=float(results["detection_scores"][i]),
+    )
+
+
+def filter_detections(
+    results: Dict[str, np.ndarray],
+    classes: Iterable[str] = TARGET_CLASSES,
+    min_score: float = 0.0,
+    best_per_class: bool = True,
+    nms_iou: Optional[float] = None,
+    max_detections: Optional[int] = None,
+) -> List[Detection]:
+    """Detections of the given classes, highest score first.
+
+    `best_per_class` keeps only the highest scoring box of each class, `nms_iou`
+    drops boxes overlapping a higher scoring one by more than that IoU.
+    """
+    scores = np.asarray(results["detection_scores"])
+    indices, labels = _select(results, classes, min_score)
+    # stable, so equal scores keep the detector's order
+    indices = indices[np.argsort(-scores[indices], kind="stable")]
+    if best_per_class and indices.size:
+        _, first = np.unique(labels[indices], return_index=True)
+        indices = indices[np.sort(first)]
+    if nms_iou is not None and indices.size:
+        indices = indices[_nms(np.asarray(results["detection_boxes"])[indices], nms_iou)]
+    if max_detections is not None:
+        indices = indices[:max_detections]
+    return [_detection(results, i) for i in indices]
+
+
+def best_detection(results: Dict[str, np.ndarray], classes: Iterable[str] = TARGET_CLASSES, min_score: float = 0.0) -> Optional[Detection]:
+    """The highest scoring detection of the given classes, None if there's none."""
+    indices, _ = _select(results, classes, min_score)
+    if not indices.size:
+        return None
+    # argmax keeps the first of equal scores
+    return _detection(results, indices[np.argmax(np.asarray(results["detection_scores"])[indices])])
@@ -0,0 +1,184 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from logger_manager import log_info, log_warning
+
+# evict every this many writes instead of on every write
+EVICT_EVERY = 100
+
+
+class DiskCache:
+    """Size-bounded, persistent key/value cache in a single SQLite file.
+
+    Values are stored as zlib-compressed JSON under sha256(namespace + key),
+    each with its own expiry. Once the cache holds more than `max_entries`,
+    the least recently read entries are evicted. Any SQLite error is logged
+    and treated as a miss, the cache is never the source of truth.
+
+    The file is opened on first use. Async code uses `aget`/`aset`/`astats`,
+    which run the SQLite calls on the cache's own threads instead of the event loop.
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.sets = 0
+        self.evictions = 0
+        self.errors = 0
+
+        self._connection: Optional[sqlite3.Connection] = None
+        # the SQLite calls are serialized by the lock anyway, one thread is enough
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="disk_cache")
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # opened on first use, not at import, always called with the lock held
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, namespace TEXT NOT NULL, payload BLOB NOT NULL, "
+                "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_entries_accessed_at ON entries (accessed_at)")
+            self._connection = conn
+            log_info(f"Opened disk cache at {self.path}")
+        return self._connection
+
+    @staticmethod
+    def make_key(namespace: str, key: str) -> str:
+        return hashlib.sha256(f"{namespace}\x00{key}".encode("utf-8")).hexdigest()
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        digest = self.make_key(namespace, key)
+        now = time.time()
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT payload, expires_at FROM entries WHERE key = ?", (digest,)
+                ).fetchone()
+                if row is not None and row[1] > now:
+                    self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, digest))
+        except sqlite3.Error as e:
+            self.errors += 1
+            log_warning(f"Disk cache read failed: {e}")
+            return None
+
+        if row is None or row[1] <= now:
+            self.misses += 1
+            return None
+        try:
+            value = json.loads(zlib.decompress(row[0]))
+        except (zlib.error, ValueError) as e:
+            # a corrupt row is a miss, and dropped so it isn't read again
+            self.errors += 1
+            self.misses += 1
+            log_warning(f"Disk cache entry unreadable, deleting it: {e}")
+            self.delete(namespace, key)
+            return None
+        self.hits += 1
+        return value
+
+    def set(self, namespace: str, key: str, value: Any, ttl: float):
+        if ttl <= 0:
+            return
+        now = time.time()
+        payload = zlib.compress(json.dumps(value, default=str).encode("utf-8"))
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, namespace, payload, expires_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (self.make_key(namespace, key), namespace, payload, now + ttl, now),
+                )
+                self._writes += 1
+                if self._writes % EVICT_EVERY == 0:
+                    self._evict(now)
+        except sqlite3.Error as e:
+            self.errors += 1
+            log_warning(f"Disk cache write failed: {e}")
+            return
+        self.sets += 1
+
+    async def aget(self, namespace: str, key: str) -> Optional[Any]:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self.get, namespace, key)
+
+    async def aset(self, namespace: str, key: str, value: Any, ttl: float):
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.set, namespace, key, value, ttl)
+
+    async def astats(self) -> Dict[str, Any]:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self.stats)
+
+    def _evict(self, now: float):
+        # expired entries first, then the least recently read ones over the limit
+        removed = self._conn.execute("DELETE FROM entries WHERE expires_at <= ?", (now,)).rowcount
+        count = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        if count > self.max_entries:
+            removed += self._conn.execute(
+                "DELETE FROM entries WHERE key IN "
+                "(SELECT key FROM entries ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,),
+            ).rowcount
+        self.evictions += removed
+
+    def delete(self, namespace: str, key: str):
+        try:
+            with self._lock:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (self.make_key(namespace, key),))
+        except sqlite3.Error as e:
+            self.errors += 1
+            log_warning(f"Disk cache delete failed: {e}")
+
+    def clear(self, namespace: Optional[str] = None):
+        with self._lock:
+            if namespace is None:
+                self._conn.execute("DELETE FROM entries")
+            else:
+                self._conn.execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        rows = []
+        try:
+            with self._lock:
+                # not worth opening the file for, nothing was cached yet
+                if self._connection is not None:
+                    rows = self._connection.execute(
+                        "SELECT namespace, COUNT(*) FROM entries GROUP BY namespace"
+                    ).fetchall()
+        except sqlite3.Error:
+            pass
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "sets": self.sets,
+            "evictions": self.evictions,
+            "errors": self.errors,
+            "entries": dict(rows),
+            "max_entries": self.max_entries,
+        }
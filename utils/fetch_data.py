@@ -1,12 +1,14 @@
-import requests
 from fastapi import HTTPException
 
+from utils.http_clients import http_clients
+
 async def fetch_product_data_from_api(barcode):
     url = f"https://india.openfoodfacts.org/api/v2/product/{barcode}.json"
-    response = requests.get(url)
-    if response.status_code != 200:
-        return {"error": f"Failed to fetch data for barcode {barcode}",'status':0}
-    return response.json()
+    async with http_clients.session("open_food_facts") as session:
+        async with session.get(url) as response:
+            if response.status != 200:
+                return {"error": f"Failed to fetch data for barcode {barcode}",'status':0}
+            return await response.json(content_type=None)
 
 def extract_product_info(product_data: dict):
     """
@@ -0,0 +1,71 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict
+
+import aiohttp
+
+from logger_manager import log_info, log_warning
+
+from env import HTTP_DNS_CACHE_TTL, HTTP_KEEPALIVE_TIMEOUT, HTTP_POOL_LIMIT_PER_HOST
+
+# Upstreams that get their own pooled session
+UPSTREAMS = ["pubchem", "open_food_facts", "usda", "wikipedia", "vuforia"]
+
+
+class HttpClientRegistry:
+    """Keep-alive HTTP sessions per upstream, created at startup and closed at shutdown.
+
+    Every upstream gets its own aiohttp session (own connection pool, per-host
+    limit and DNS cache) so a slow upstream can't use up the connections of
+    the others. Code running outside the app's event loop (scripts, sync
+    LangChain tool calls) gets a short-lived session instead.
+    """
+
+    def __init__(self):
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+        self._loop = None
+
+    async def start(self):
+        if self._sessions:
+            return
+        self._loop = asyncio.get_running_loop()
+        for upstream in UPSTREAMS:
+            self._sessions[upstream] = aiohttp.ClientSession(connector=self._create_connector())
+        log_info(f"Started pooled HTTP sessions for: {', '.join(UPSTREAMS)}")
+
+    async def close(self):
+        for session in self._sessions.values():
+            await session.close()
+        self._sessions.clear()
+        self._loop = None
+        log_info("Closed pooled HTTP sessions")
+
+    @staticmethod
+    def _create_connector() -> aiohttp.TCPConnector:
+        return aiohttp.TCPConnector(
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        )
+
+    @asynccontextmanager
+    async def session(self, upstream: str) -> AsyncIterator[aiohttp.ClientSession]:
+        """Yield the pooled session for an upstream.
+
+        Outside the loop the registry was started on, a temporary session is
+        created and closed afterwards.
+        """
+        if upstream not in UPSTREAMS:
+            raise ValueError(f"Unknown upstream: {upstream}")
+        shared = self._sessions.get(upstream)
+        if shared is not None and not shared.closed and asyncio.get_running_loop() is self._loop:
+            yield shared
+            return
+
+        if self._sessions:
+            log_warning(f"Using a temporary HTTP session for {upstream} outside the app event loop")
+        async with aiohttp.ClientSession(connector=self._create_connector()) as session:
+            yield session
+
+
+http_clients = HttpClientRegistry()
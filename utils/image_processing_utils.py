@@ -1,18 +1,9 @@
-import tensorflow as tf
-import tensorflow_hub as hub
-import numpy as np
 from PIL import Image, ImageDraw, ImageFont, ImageOps
 import requests
 from io import BytesIO
 import os
 from env import UPLOADED_IMAGES_DIR
-
-# Load the model from TF Hub
-# Cache the model globally
-detector = hub.load("https://tfhub.dev/google/openimages_v4/ssd/mobilenet_v2/1").signatures['default']
-
-# Classes you care about
-TARGET_CLASSES = set(["Food processor", "Fast food", "Food", "Seafood", "Snack"])
+from utils.detection_postprocess import TARGET_CLASSES, filter_detections
 
 
 def load_image_from_url(url, size=(640, 480)):
@@ -22,38 +13,12 @@ def load_image_from_url(url, size=(640, 480)):
     return img
 
 
-def run_object_detection(image: Image.Image):
-    image_np = np.array(image)
-    # Convert to tensor without specifying dtype
-    input_tensor = tf.convert_to_tensor(image_np)[tf.newaxis, ...]
-    # Convert to float32 and normalize to [0,1]
-    input_tensor = tf.cast(input_tensor, tf.float32) / 255.0
-    results = detector(input_tensor)
-    results = {k: v.numpy() for k, v in results.items()}
-    return results, image_np
-
 def get_filtered_class_boxes(results):
     # for same class, keep the one with the highest score
-    # and remove duplicates
-    boxes = []
-    classes = []
-    scores = []
-
-    for i in range(len(results["detection_scores"])):
-        class_name = results["detection_class_entities"][i].decode("utf-8")
-        box = results["detection_boxes"][i]
-        score = results["detection_scores"][i]
-        if class_name in TARGET_CLASSES:
-            if class_name not in classes:
-                boxes.append(box)
-                classes.append(class_name)
-                scores.append(score)
-            else:
-                index = classes.index(class_name)
-                if score > scores[index]:
-                    boxes[index] = box
-                    classes[index] = class_name
-                    scores[index] = score
+    detections = filter_detections(results, best_per_class=True)
+    boxes = [d.box for d in detections]
+    classes = [d.class_name for d in detections]
+    scores = [d.score for d in detections]
     return boxes, classes, scores
 
 
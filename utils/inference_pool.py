@@ -0,0 +1,92 @@
+import asyncio
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict
+
+from env import INFERENCE_QUEUE_SIZE, INFERENCE_WORKERS
+
+
+class InferencePoolFull(Exception):
+    """Raised instead of queueing when every worker is busy and the queue is full."""
+
+
+class InferencePool:
+    """Dedicated threads for the object detection pipeline.
+
+    Decoding, the detector's forward pass and cropping hold the CPU for
+    hundreds of milliseconds, run on the event loop they'd stall every other
+    request. At most `workers` jobs run at once and `max_queue` wait, any
+    more are rejected with InferencePoolFull so callers can answer 503.
+    """
+
+    def __init__(self, workers: int, max_queue: int):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="inference")
+        self._pending = 0
+        self._counters = defaultdict(int)
+        # per stage: count, total and max seconds
+        self._stages: Dict[str, Dict[str, float]] = defaultdict(lambda: {"count": 0, "total": 0.0, "max": 0.0})
+
+    async def run(self, func: Callable[..., Any], *args) -> Any:
+        if self._pending >= self.workers + self.max_queue:
+            self._counters["rejected"] += 1
+            raise InferencePoolFull(f"Inference queue is full ({self._pending} jobs pending)")
+        self._pending += 1
+        submitted = time.perf_counter()
+
+        def job():
+            self.record("queue_wait", time.perf_counter() - submitted)
+            return func(*args)
+
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._executor, job)
+            self._counters["completed"] += 1
+            return result
+        except Exception:
+            self._counters["failed"] += 1
+            raise
+        finally:
+            self._pending -= 1
+
+    def record(self, stage: str, seconds: float):
+        stats = self._stages[stage]
+        stats["count"] += 1
+        stats["total"] += seconds
+        stats["max"] = max(stats["max"], seconds)
+
+    @contextmanager
+    def timed(self, stage: str, timings: Dict[str, float] = None):
+        """Time a stage of a job, also written to `timings` if given."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            self.record(stage, seconds)
+            if timings is not None:
+                timings[stage] = seconds
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "pending": self._pending,
+            **self._counters,
+            "stages": {
+                stage: {
+                    "count": stats["count"],
+                    "avg_ms": round(stats["total"] / stats["count"] * 1000, 1) if stats["count"] else 0,
+                    "max_ms": round(stats["max"] * 1000, 1),
+                }
+                for stage, stats in self._stages.items()
+            },
+        }
+
+
+inference_pool = InferencePool(INFERENCE_WORKERS, INFERENCE_QUEUE_SIZE)
@@ -0,0 +1,212 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
+
+from cachetools import TTLCache
+
+from interfaces.ingredientModels import IngredientAnalysisResult
+from logger_manager import log_debug, log_info, log_warning
+from utils.text_utils import normalize_ingredient_name
+
+from env import INGREDIENT_CACHE_SIZE, INGREDIENT_CACHE_TTL, REDIS_URL
+
+# redis is optional, without it only the in-process tier is used
+try:
+    import redis
+except ImportError:
+    redis = None
+
+SHARED_KEY_PREFIX = "food_analyzer:ingredient:"
+# set of all keys an ingredient is cached under, by its normalized name
+SHARED_INDEX_PREFIX = "food_analyzer:ingredient_keys:"
+
+
+class IngredientCache:
+    """Two-tier cache of ready-built IngredientAnalysisResult objects.
+
+    Entries are keyed by the normalized ingredient name, every alternate
+    name and the names it was looked up by, the keys of each ingredient are
+    indexed by its name so invalidating it drops all of them. The first tier is an in-process LRU with TTL, the second an optional
+    Redis shared by all workers. Any error from the shared tier is treated as
+    a miss so the database stays the source of truth.
+
+    Redis is only called from the cache's own thread: reads are awaited with
+    `aget`/`aget_many`, writes are queued behind them without waiting, so
+    the sync repository code can invalidate too.
+    """
+
+    def __init__(self, maxsize: int, ttl: int, redis_url: Optional[str] = None):
+        self.ttl = ttl
+        self._local = TTLCache(maxsize=maxsize, ttl=ttl)
+        # normalized name -> every key the ingredient is cached under
+        self._index = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._shared = None
+        # one thread keeps the shared reads and writes of this process in order
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingredient_cache")
+        if redis_url:
+            if redis is None:
+                log_warning("REDIS_URL is set but the redis package is not installed, shared ingredient cache disabled")
+            else:
+                self._shared = redis.Redis.from_url(redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+                log_info("Shared ingredient cache enabled")
+
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.sets = 0
+        self.invalidations = 0
+        self.shared_errors = 0
+
+    @staticmethod
+    def _keys(names: Iterable[str]) -> List[str]:
+        keys = []
+        for name in names:
+            key = normalize_ingredient_name(name)
+            if key and key not in keys:
+                keys.append(key)
+        return keys
+
+    def _get_local(self, keys: List[str]):
+        found = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                result = self._local.get(key)
+                if result is not None:
+                    found[key] = result.model_copy()
+                else:
+                    missing.append(key)
+        self.local_hits += len(found)
+        return found, missing
+
+    def _get_shared(self, keys: List[str]) -> Dict[str, IngredientAnalysisResult]:
+        # blocking, runs on the executor
+        try:
+            payloads = self._shared.mget([SHARED_KEY_PREFIX + key for key in keys])
+        except Exception as e:
+            self.shared_errors += 1
+            log_warning(f"Shared ingredient cache unavailable: {e}")
+            return {}
+
+        found = {}
+        for key, payload in zip(keys, payloads):
+            if not payload:
+                continue
+            try:
+                result = IngredientAnalysisResult.model_validate_json(payload)
+            except ValueError as e:
+                # corrupt or written by an incompatible version, same as a miss
+                self.shared_errors += 1
+                log_warning(f"Ignoring unreadable shared ingredient cache entry {key}: {e}")
+                continue
+            # indexed like set does, so invalidating the ingredient drops the local copy too
+            name_key = normalize_ingredient_name(result.name) or key
+            with self._lock:
+                self._local[key] = result
+                self._index[name_key] = self._index.get(name_key, set()) | {key}
+            found[key] = result.model_copy()
+        self.shared_hits += len(found)
+        return found
+
+    async def aget_many(self, names: Iterable[str]) -> Dict[str, IngredientAnalysisResult]:
+        """Cached results for these names, keyed by normalized name. Misses are left out."""
+        found, missing = self._get_local(self._keys(names))
+        if missing and self._shared is not None:
+            shared = await asyncio.get_running_loop().run_in_executor(self._executor, self._get_shared, missing)
+            found.update(shared)
+            self.misses += len(missing) - len(shared)
+        else:
+            self.misses += len(missing)
+        return found
+
+    async def aget(self, name: str) -> Optional[IngredientAnalysisResult]:
+        key = normalize_ingredient_name(name)
+        if not key:
+            return None
+        return (await self.aget_many([name])).get(key)
+
+    def set(self, result: IngredientAnalysisResult, extra_names: Iterable[str] = ()):
+        """Cache a result under its name, its alternate names and any extra names it was looked up by."""
+        # never cache placeholders for ingredients that are not stored
+        if not result.id:
+            return
+        keys = self._keys([result.name, *result.alternate_names, *extra_names])
+        if not keys:
+            return
+        name_key = normalize_ingredient_name(result.name) or keys[0]
+        stored = result.model_copy()
+        with self._lock:
+            for key in keys:
+                self._local[key] = stored
+            self._index[name_key] = self._index.get(name_key, set()) | set(keys)
+        self.sets += 1
+
+        if self._shared is not None:
+            self._executor.submit(self._set_shared, keys, name_key, stored.model_dump_json())
+        log_debug(f"Cached ingredient {result.name} under {len(keys)} keys")
+
+    def _set_shared(self, keys: List[str], name_key: str, payload: str):
+        try:
+            pipe = self._shared.pipeline()
+            for key in keys:
+                pipe.setex(SHARED_KEY_PREFIX + key, self.ttl, payload)
+            pipe.sadd(SHARED_INDEX_PREFIX + name_key, *keys)
+            pipe.expire(SHARED_INDEX_PREFIX + name_key, self.ttl)
+            pipe.execute()
+        except Exception as e:
+            self.shared_errors += 1
+            log_warning(f"Could not write shared ingredient cache: {e}")
+
+    def invalidate(self, names: Iterable[str]):
+        """Drop the ingredients with these names, under every key they were cached by."""
+        names_keys = self._keys(names)
+        if not names_keys:
+            return
+        keys = set(names_keys)
+        with self._lock:
+            for name_key in names_keys:
+                keys |= self._index.pop(name_key, set())
+            for key in keys:
+                self._local.pop(key, None)
+        self.invalidations += 1
+
+        if self._shared is not None:
+            self._executor.submit(self._invalidate_shared, names_keys, keys)
+
+    def _invalidate_shared(self, names_keys: List[str], keys: set):
+        try:
+            # keys other workers cached the ingredients under
+            index_keys = [SHARED_INDEX_PREFIX + key for key in names_keys]
+            pipe = self._shared.pipeline()
+            for index_key in index_keys:
+                pipe.smembers(index_key)
+            for members in pipe.execute():
+                keys |= {member.decode() if isinstance(member, bytes) else member for member in members}
+            self._shared.delete(*[SHARED_KEY_PREFIX + key for key in keys], *index_keys)
+        except Exception as e:
+            self.shared_errors += 1
+            log_warning(f"Could not invalidate shared ingredient cache: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+            self._index.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.local_hits + self.shared_hits + self.misses
+        return {
+            "local_hits": self.local_hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.local_hits + self.shared_hits) / lookups, 4) if lookups else 0.0,
+            "sets": self.sets,
+            "invalidations": self.invalidations,
+            "shared_errors": self.shared_errors,
+            "local_size": len(self._local),
+            "shared_enabled": self._shared is not None,
+        }
+
+
+ingredient_cache = IngredientCache(INGREDIENT_CACHE_SIZE, INGREDIENT_CACHE_TTL, REDIS_URL)
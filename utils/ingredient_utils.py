@@ -1,68 +1,277 @@
 import asyncio
-import os
-from sqlalchemy.orm import Session
-from db.database import SessionLocal
-from db.repositories import IngredientRepository
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from sqlalchemy.exc import IntegrityError
+from db.database import AsyncSessionLocal
+from db.repositories import AsyncIngredientRepository
 from interfaces.ingredientModels import IngredientAnalysisResult
-from logger_manager import log_error, log_info
+from logger_manager import log_debug, log_error, log_info, log_warning
 from services.ingredientFinderAgent import IngredientInfoAgentLangGraph
 from langsmith import traceable
 import pytz
 
+from env import INGREDIENT_DEADLINE_SECONDS
 from utils.db_utils import ingredient_db_to_pydantic
+from utils.deadline import deadline_scope
+from utils.ingredient_cache import ingredient_cache
+from utils.single_flight import SingleFlight
+from utils.text_utils import normalize_ingredient_name
 
-# Load environment variables
-from env import PARALLEL_RATE_LIMIT
+# Process-wide registry of ingredients currently being researched, so that
+# concurrent requests sharing an ingredient run the agent only once
+ingredient_single_flight = SingleFlight("ingredient_research")
 
 
-# Create a semaphore to limit concurrent API calls
-llm_semaphore = asyncio.Semaphore(PARALLEL_RATE_LIMIT)
+async def _store_ingredient(result: IngredientAnalysisResult) -> IngredientAnalysisResult:
+    """Save a researched ingredient and set its database id on the result."""
+    async with AsyncSessionLocal() as db:
+        repo = AsyncIngredientRepository(db)
+        try:
+            db_ingredient = await repo.create_ingredient(result)
+        except IntegrityError:
+            # another worker process stored the same ingredient first
+            await db.rollback()
+            log_warning(f"Ingredient already stored by another worker: {result.name}")
+            # the name is unique, its normalized alias may belong to another ingredient
+            db_ingredient = await repo.get_ingredient_by_exact_name(result.name)
+            if db_ingredient is None:
+                db_ingredient = await repo.get_ingredient_by_name(result.name)
+            if db_ingredient is None:
+                raise
+        result.id = db_ingredient.id
+        result.updated_at = db_ingredient.updated_at or db_ingredient.created_at
+    return result
 
 
-@traceable
-async def process_single_ingredient(ingredient_name: str) -> IngredientAnalysisResult:
-    """Process a single ingredient asynchronously with rate limiting"""
+async def _research_and_store(ingredient_name: str) -> IngredientAnalysisResult:
+    log_info(f"Processing new ingredient: {ingredient_name}")
+    ingredient_finder = IngredientInfoAgentLangGraph()
+
     try:
-        # First check if ingredient exists in the database
-        with SessionLocal() as db:
-            repo = IngredientRepository(db)
-            db_ingredient = repo.get_ingredient_by_name(ingredient_name)
-            
-            if db_ingredient:
-                log_info(f"Using cached ingredient data for: {ingredient_name}")
-                return ingredient_db_to_pydantic(db_ingredient)
-        
-        # If not in database, process it
-        log_info(f"Processing new ingredient: {ingredient_name}")
-        ingredient_finder = IngredientInfoAgentLangGraph()
-        
-        try:
-            result = await ingredient_finder.process_ingredient_async(ingredient_name)
-        except RuntimeError:
-            result = ingredient_finder.process_ingredient(ingredient_name)
-        
-        # Important: Add an id field even for new ingredients
-        # You can use a temporary id (will be replaced when saved to DB)
-        result.id = 0  # Temporary ID
-        
-        # Save to database for future use
-        with SessionLocal() as db:
-            repo = IngredientRepository(db)
-            db_ingredient = repo.create_ingredient(result)
-            # Update with the real database ID
-            result.id = db_ingredient.id
-            
+        result = await ingredient_finder.process_ingredient_async(ingredient_name)
+    except RuntimeError:
+        result = ingredient_finder.process_ingredient(ingredient_name)
+
+    if result.timed_out:
+        # incomplete, research it again next time instead of storing it
+        log_warning(f"Not storing timed out research for: {ingredient_name}")
         return result
+
+    # Save to database for future use, this also replaces the temporary id
+    result = await _store_ingredient(result)
+    ingredient_cache.set(result, extra_names=[ingredient_name])
+    return result
+
+
+async def research_ingredient(ingredient_name: str, timeout: Optional[float] = None) -> IngredientAnalysisResult:
+    """Research and store a new ingredient.
+
+    Concurrent calls for the same (normalized) name share a single agent run.
+    Raises asyncio.TimeoutError when it isn't done within `timeout` seconds,
+    the shared run itself is bounded by the deadline of the caller that started it.
+    """
+    key = normalize_ingredient_name(ingredient_name)
+    return await asyncio.wait_for(
+        ingredient_single_flight.do(key, lambda: _research_and_store(ingredient_name)),
+        timeout,
+    )
+
+
+async def research_ingredient_before_deadline(ingredient_name: str) -> IngredientAnalysisResult:
+    """Research a new ingredient within INGREDIENT_DEADLINE_SECONDS (or the request's deadline if sooner).
+
+    Returns a timed out placeholder once the deadline passes.
+    """
+    with deadline_scope(INGREDIENT_DEADLINE_SECONDS) as deadline:
+        try:
+            return await research_ingredient(ingredient_name, timeout=deadline.remaining())
+        except asyncio.TimeoutError:
+            log_warning(f"Research deadline passed for ingredient: {ingredient_name}")
+            return _timed_out_ingredient_result(ingredient_name)
+
+
+async def _research_and_store_many(ingredient_names: List[str]) -> Dict[str, IngredientAnalysisResult]:
+    log_info(f"Processing {len(ingredient_names)} new ingredients")
+    ingredient_finder = IngredientInfoAgentLangGraph()
+    results = await ingredient_finder.process_ingredients_async(ingredient_names)
+
+    stored = {}
+    for ingredient_name, result in zip(ingredient_names, results):
+        if result.timed_out:
+            # incomplete, research it again next time instead of storing it
+            log_warning(f"Not storing timed out research for: {ingredient_name}")
+            stored[normalize_ingredient_name(ingredient_name)] = result
+            continue
+        try:
+            result = await _store_ingredient(result)
+            ingredient_cache.set(result, extra_names=[ingredient_name])
+        except Exception as e:
+            log_error(f"Error storing ingredient {ingredient_name}: {e}", e)
+            result = _failed_ingredient_result(ingredient_name)
+        stored[normalize_ingredient_name(ingredient_name)] = result
+    return stored
+
+
+def _start_research(ingredient_names: List[str]) -> Dict[str, asyncio.Task]:
+    """Start researching and storing several new ingredients, a task per normalized name.
+
+    Ingredients already being researched by another request are joined, the
+    rest are analyzed together in LLM batches. The tasks are shared, don't
+    cancel them, they are bounded by the deadline current when they were started.
+    """
+    names_by_key = {}
+    for ingredient_name in ingredient_names:
+        key = normalize_ingredient_name(ingredient_name)
+        if key:
+            names_by_key.setdefault(key, ingredient_name)
+    if not names_by_key:
+        return {}
+    return ingredient_single_flight.start_many(
+        list(names_by_key),
+        lambda keys: _research_and_store_many([names_by_key[key] for key in keys]),
+    )
+
+
+async def get_known_ingredient(ingredient_name: str) -> Optional[IngredientAnalysisResult]:
+    """Look up an already analyzed ingredient, from the cache first and then the database."""
+    cached = await ingredient_cache.aget(ingredient_name)
+    if cached is not None:
+        log_debug(f"Ingredient cache hit for: {ingredient_name}")
+        return cached
+
+    async with AsyncSessionLocal() as db:
+        repo = AsyncIngredientRepository(db)
+        db_ingredient = await repo.get_ingredient_by_name(ingredient_name)
+        if not db_ingredient:
+            return None
+        result = ingredient_db_to_pydantic(db_ingredient)
+
+    ingredient_cache.set(result, extra_names=[ingredient_name])
+    return result
+
+
+async def get_known_ingredients(ingredient_names: List[str]) -> Dict[str, IngredientAnalysisResult]:
+    """Look up many already analyzed ingredients at once, keyed by normalized name.
+    
+    Cache hits are served directly and the rest is resolved with a single
+    repository query. Unknown ingredients are left out of the result.
+    """
+    results = await ingredient_cache.aget_many(ingredient_names)
+    missing = []
+    seen = set(results)
+    for ingredient_name in ingredient_names:
+        key = normalize_ingredient_name(ingredient_name)
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        missing.append(ingredient_name)
+
+    if missing:
+        async with AsyncSessionLocal() as db:
+            repo = AsyncIngredientRepository(db)
+            found = await repo.get_many_by_names(missing)
+            for ingredient_name in missing:
+                key = normalize_ingredient_name(ingredient_name)
+                db_ingredient = found.get(key)
+                if db_ingredient is None or key in results:
+                    continue
+                result = ingredient_db_to_pydantic(db_ingredient)
+                ingredient_cache.set(result, extra_names=[ingredient_name])
+                results[key] = result
+
+    log_info(f"Resolved {len(results)} known ingredients, {len(missing)} cache misses")
+    return results
+
+
+def _failed_ingredient_result(ingredient_name: str) -> IngredientAnalysisResult:
+    # Return a minimal valid result for failed ingredients
+    return IngredientAnalysisResult(
+        name=ingredient_name,
+        is_found=False,
+        id=0,  # Add this missing required field
+        alternate_names=[],
+        safety_rating=0,
+        description="Error processing this ingredient",
+        health_effects=["Unknown"],
+        details_with_source=[]
+    )
+
+
+def _timed_out_ingredient_result(ingredient_name: str) -> IngredientAnalysisResult:
+    # placeholder for ingredients whose research didn't finish before the deadline
+    return IngredientAnalysisResult(
+        name=ingredient_name,
+        is_found=False,
+        id=0,
+        alternate_names=[],
+        safety_rating=0,
+        description="Research for this ingredient timed out, please try again later",
+        health_effects=["Unknown"],
+        details_with_source=[],
+        timed_out=True
+    )
+
+
+async def iter_ingredients(ingredient_names: List[str]) -> AsyncIterator[Tuple[int, IngredientAnalysisResult]]:
+    """Yield (index, result) for a product's ingredient list as results resolve.
+    
+    Known ingredients are resolved together and come first, only the real
+    misses are sent to the agent, with batched LLM analysis, and follow as
+    each is done. Ingredients not researched within INGREDIENT_DEADLINE_SECONDS
+    (or the request's deadline if sooner) come last as timed out placeholders.
+    """
+    try:
+        known = await get_known_ingredients(ingredient_names)
     except Exception as e:
-        log_error(f"Error processing ingredient {ingredient_name}: {e}", e)
-        # Return a minimal valid result for failed ingredients
-        return IngredientAnalysisResult(
-            name=ingredient_name,
-            is_found=False,
-            id=0,  # Add this missing required field
-            alternate_names=[],
-            safety_rating=0,
-            description="Error processing this ingredient",
-            health_effects=["Unknown"],
-            details_with_source=[]
-        )
\ No newline at end of file
+        log_error(f"Error resolving known ingredients: {e}", e)
+        known = {}
+
+    missing_by_key: Dict[str, List[int]] = {}
+    for index, ingredient_name in enumerate(ingredient_names):
+        key = normalize_ingredient_name(ingredient_name)
+        if key in known:
+            yield index, known[key]
+        elif key:
+            missing_by_key.setdefault(key, []).append(index)
+        else:
+            yield index, _failed_ingredient_result(ingredient_name)
+    if not missing_by_key:
+        return
+
+    # the research tasks take the deadline along, it isn't kept across yields
+    with deadline_scope(INGREDIENT_DEADLINE_SECONDS) as deadline:
+        tasks = _start_research([ingredient_names[indexes[0]] for indexes in missing_by_key.values()])
+    keys_by_task = {task: key for key, task in tasks.items()}
+
+    # asyncio.wait leaves the shared tasks running when we stop waiting
+    pending = set(tasks.values())
+    while pending:
+        done, pending = await asyncio.wait(pending, timeout=deadline.remaining(), return_when=asyncio.FIRST_COMPLETED)
+        if not done:
+            break
+        for task in done:
+            for index in missing_by_key[keys_by_task[task]]:
+                yield index, _task_result(ingredient_names[index], task)
+
+    for task in pending:
+        for index in missing_by_key[keys_by_task[task]]:
+            log_warning(f"Research deadline passed for ingredient: {ingredient_names[index]}")
+            yield index, _timed_out_ingredient_result(ingredient_names[index])
+
+
+def _task_result(ingredient_name: str, task: asyncio.Task) -> IngredientAnalysisResult:
+    if task.cancelled():
+        log_error(f"Research cancelled for ingredient {ingredient_name}")
+        return _failed_ingredient_result(ingredient_name)
+    if task.exception() is not None:
+        log_error(f"Error processing ingredient {ingredient_name}: {task.exception()}", task.exception())
+        return _failed_ingredient_result(ingredient_name)
+    return task.result()
+
+
+@traceable
+async def process_ingredients(ingredient_names: List[str]) -> List[IngredientAnalysisResult]:
+    """Process a product's ingredient list, in order (see iter_ingredients)."""
+    results: List[Optional[IngredientAnalysisResult]] = [None] * len(ingredient_names)
+    async for index, result in iter_ingredients(ingredient_names):
+        results[index] = result
+    return results
@@ -0,0 +1,117 @@
+import queue
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+
+# upper bounds of the queue wait histogram, in milliseconds
+QUEUE_WAIT_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500)
+
+
+def pad_to_common_shape(images: List[np.ndarray]) -> Tuple[np.ndarray, List[Tuple[float, float]]]:
+    """Stack HxWxC images into one batch, padded at the bottom and right.
+
+    Returns the batch and, per image, the (height, width) scale that maps
+    normalized coordinates in the padded image back to the image itself.
+    """
+    height = max(image.shape[0] for image in images)
+    width = max(image.shape[1] for image in images)
+    batch = np.zeros((len(images), height, width, images[0].shape[2]), dtype=images[0].dtype)
+    scales = []
+    for i, image in enumerate(images):
+        batch[i, :image.shape[0], :image.shape[1]] = image
+        scales.append((height / image.shape[0], width / image.shape[1]))
+    return batch, scales
+
+
+class MicroBatcher:
+    """Collects concurrent calls into batches for one model call.
+
+    A batch is run once `max_batch_size` items are waiting or the oldest
+    one waited `max_wait_ms`, on the batcher's own thread. Callers block
+    until their item's result is scattered back. With max_batch_size 1 the
+    call runs directly in the caller's thread.
+
+    `run_batch` takes a list of items and returns one result per item.
+    """
+
+    def __init__(self, name: str, run_batch: Callable[[List[Any]], List[Any]], max_batch_size: int, max_wait_ms: float):
+        self.name = name
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self._queue: "queue.Queue[Tuple[Any, Future, float]]" = queue.Queue()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._batch_sizes = Counter()
+        self._queue_waits = Counter()
+
+    def __call__(self, item: Any) -> Any:
+        if self.max_batch_size == 1:
+            self._record([time.perf_counter()])
+            return self.run_batch([item])[0]
+        self._ensure_thread()
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        return future.result()
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._thread_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._loop, name=f"{self.name}_batcher", daemon=True)
+                    self._thread.start()
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = batch[0][2] + self.max_wait
+            while len(batch) < self.max_batch_size:
+                # items that queued up during the last batch are taken without waiting
+                timeout = deadline - time.perf_counter()
+                try:
+                    if timeout > 0:
+                        batch.append(self._queue.get(timeout=timeout))
+                    else:
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            self._record([queued_at for _, _, queued_at in batch])
+            try:
+                results = self.run_batch([item for item, _, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"{self.name} batch of {len(batch)} returned {len(results)} results")
+            except BaseException as e:
+                # every caller gets the error and the thread keeps going, no one is left waiting forever
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+    def _record(self, queued_at: List[float]):
+        now = time.perf_counter()
+        self._batch_sizes[len(queued_at)] += 1
+        for started in queued_at:
+            wait_ms = (now - started) * 1000
+            index = bisect_left(QUEUE_WAIT_BUCKETS_MS, wait_ms)
+            bucket = f"<={QUEUE_WAIT_BUCKETS_MS[index]}ms" if index < len(QUEUE_WAIT_BUCKETS_MS) else f">{QUEUE_WAIT_BUCKETS_MS[-1]}ms"
+            self._queue_waits[bucket] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queued": self._queue.qsize(),
+            "batch_sizes": dict(sorted(self._batch_sizes.items())),
+            "queue_wait": {
+                bucket: self._queue_waits[bucket]
+                for bucket in [f"<={b}ms" for b in QUEUE_WAIT_BUCKETS_MS] + [f">{QUEUE_WAIT_BUCKETS_MS[-1]}ms"]
+                if self._queue_waits[bucket]
+            },
+        }
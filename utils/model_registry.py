@@ -0,0 +1,147 @@
+import os
+import shutil
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+from env import (
+    FOOD_DETECTOR_HANDLE,
+    FOOD_DETECTOR_VERSION,
+    INFERENCE_INTRA_OP_THREADS,
+    MODEL_DOWNLOAD_ENABLED,
+    MODEL_STORE_DIR,
+)
+from logger_manager import log_error, log_info, log_warning
+
+# downloads through tensorflow_hub land in the store too, so they survive
+# restarts when MODEL_STORE_DIR is on a volume
+os.environ.setdefault("TFHUB_CACHE_DIR", os.path.join(MODEL_STORE_DIR, "tfhub"))
+
+FOOD_DETECTOR = "food_detector"
+
+
+@dataclass(frozen=True)
+class ModelSpec:
+    """A model pinned to a version, loaded from MODEL_STORE_DIR/<name>/<version>.
+
+    `handle` is where the version is downloaded from when it isn't in the
+    store yet, `warmup_input` builds the input of the warm-up inference.
+    """
+    name: str
+    version: str
+    handle: str
+    signature: str = "default"
+    warmup_input: Optional[Callable[[], Any]] = None
+
+
+def _detector_warmup_input():
+    import tensorflow as tf
+    return tf.zeros((1, 480, 640, 3), dtype=tf.float32)
+
+
+class ModelRegistry:
+    """Loads each registered model once per process, from the local store."""
+
+    def __init__(self, store_dir: str, download_enabled: bool = True):
+        self.store_dir = store_dir
+        self.download_enabled = download_enabled
+        self._specs: Dict[str, ModelSpec] = {}
+        self._models: Dict[str, Any] = {}
+        self._load_seconds: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._threads_configured = False
+
+    def register(self, spec: ModelSpec):
+        self._specs[spec.name] = spec
+
+    def model_dir(self, name: str) -> str:
+        spec = self._specs[name]
+        return os.path.join(self.store_dir, spec.name, spec.version)
+
+    def resolve(self, name: str) -> str:
+        """Path of the model's SavedModel in the store, downloaded into it if allowed."""
+        path = self.model_dir(name)
+        if os.path.exists(os.path.join(path, "saved_model.pb")):
+            return path
+        if not self.download_enabled:
+            raise FileNotFoundError(f"Model {name} not found in {path} and downloads are disabled")
+
+        import tensorflow_hub as hub
+        spec = self._specs[name]
+        log_info(f"Model {name} not in the store, downloading {spec.handle}")
+        downloaded = hub.resolve(spec.handle)
+        # copy next to the other versions, a partial copy is never picked up
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        shutil.copytree(downloaded, tmp_path)
+        if os.path.isdir(path):
+            # e.g. only converted models so far, they're kept next to the SavedModel
+            for entry in os.listdir(path):
+                if not os.path.exists(os.path.join(tmp_path, entry)):
+                    shutil.move(os.path.join(path, entry), os.path.join(tmp_path, entry))
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+        return path
+
+    def get(self, name: str):
+        """The loaded model's signature, loaded on first use."""
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        with self._lock:
+            if name not in self._models:
+                import tensorflow as tf
+                if INFERENCE_INTRA_OP_THREADS and not self._threads_configured:
+                    # only possible before TensorFlow's runtime started, so once, even if the load below fails
+                    self._threads_configured = True
+                    try:
+                        tf.config.threading.set_intra_op_parallelism_threads(INFERENCE_INTRA_OP_THREADS)
+                    except RuntimeError as e:
+                        log_warning(f"Could not limit TensorFlow's intra-op threads: {e}")
+                spec = self._specs[name]
+                path = self.resolve(name)
+                started = time.perf_counter()
+                self._models[name] = tf.saved_model.load(path).signatures[spec.signature]
+                self._load_seconds[name] = round(time.perf_counter() - started, 3)
+                log_info(f"Loaded model {name} v{spec.version} from {path} in {self._load_seconds[name]}s")
+            return self._models[name]
+
+    def warm_up(self, *names: str):
+        """Load the models (all registered ones by default) and run one inference
+        each, so the first request doesn't pay for loading and graph tracing."""
+        for name in names or tuple(self._specs):
+            spec = self._specs[name]
+            try:
+                model = self.get(name)
+                if spec.warmup_input is not None:
+                    started = time.perf_counter()
+                    model(spec.warmup_input())
+                    log_info(f"Warmed up model {name} in {time.perf_counter() - started:.3f}s")
+            except Exception as e:
+                # not fatal, get() retries on the first request and reports the error there
+                log_error(f"Error warming up model {name}: {e}", e)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            name: {
+                "version": spec.version,
+                "loaded": name in self._models,
+                "load_seconds": self._load_seconds.get(name),
+            }
+            for name, spec in self._specs.items()
+        }
+
+
+model_registry = ModelRegistry(MODEL_STORE_DIR, MODEL_DOWNLOAD_ENABLED)
+model_registry.register(ModelSpec(
+    name=FOOD_DETECTOR,
+    version=FOOD_DETECTOR_VERSION,
+    handle=FOOD_DETECTOR_HANDLE,
+    warmup_input=_detector_warmup_input,
+))
+
+
+def get_detector():
+    """The food detector (SSD MobileNet v2, Open Images v4), see ModelRegistry."""
+    return model_registry.get(FOOD_DETECTOR)
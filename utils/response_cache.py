@@ -0,0 +1,53 @@
+import functools
+from typing import Any, Awaitable, Callable, Dict
+
+from logger_manager import log_debug
+from utils.disk_cache import DiskCache
+from utils.text_utils import normalize_ingredient_name
+
+from env import (
+    RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_NEGATIVE_TTL,
+    RESPONSE_CACHE_PATH,
+    RESPONSE_CACHE_TTLS,
+)
+
+# Persistent store shared by the upstream response cache and other caches of
+# derived data, entries of each are kept apart by namespace
+disk_cache = DiskCache(RESPONSE_CACHE_PATH, RESPONSE_CACHE_MAX_ENTRIES)
+
+SOURCE_NAMESPACE = "source:"
+
+
+def cached_source(source: str):
+    """Cache the results of an async source tool taking an ingredient name.
+
+    Results are stored per (source, normalized ingredient) for the source's
+    TTL, results with nothing found for RESPONSE_CACHE_NEGATIVE_TTL. Results
+    with an error, or marked partial, are never cached.
+    """
+    ttl = RESPONSE_CACHE_TTLS[source]
+    namespace = SOURCE_NAMESPACE + source
+
+    def decorator(func: Callable[[str], Awaitable[Dict[str, Any]]]):
+        @functools.wraps(func)
+        async def wrapper(ingredient: str) -> Dict[str, Any]:
+            key = normalize_ingredient_name(ingredient)
+            if not RESPONSE_CACHE_ENABLED or not key:
+                return await func(ingredient)
+
+            cached = await disk_cache.aget(namespace, key)
+            if cached is not None:
+                log_debug(f"[{source}] response cache hit for: {ingredient}")
+                return cached
+
+            result = await func(ingredient)
+            if not result.get("error") and not result.get("partial"):
+                await disk_cache.aset(namespace, key, result, ttl if result.get("found") else RESPONSE_CACHE_NEGATIVE_TTL)
+            return result
+
+        return wrapper
+
+    return decorator
+
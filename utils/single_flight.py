@@ -0,0 +1,95 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List
+
+from logger_manager import log_debug
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into a single execution.
+
+    The first caller for a key starts the work as a task; every caller that
+    arrives while it is still running awaits the same task instead of
+    starting its own. The task is shielded, so a caller that gets cancelled
+    (client disconnect, timeout) does not cancel the work for the others.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        self.calls += 1
+
+        task = self._inflight.get(key)
+        # a task left over from another event loop (scripts, tests) can't be awaited here
+        if task is not None and task.get_loop() is loop:
+            self.coalesced += 1
+            log_debug(f"[{self.name}] joining in-flight call for: {key}")
+            return await asyncio.shield(task)
+
+        self.executions += 1
+        task = loop.create_task(func())
+        self._inflight[key] = task
+        task.add_done_callback(lambda t, key=key: self._forget(key, t))
+        return await asyncio.shield(task)
+
+    def start_many(self, keys: List[str], func: Callable[[List[str]], Awaitable[Dict[str, Any]]]) -> Dict[str, asyncio.Task]:
+        """Join or start the work for several keys, returns a task per key.
+
+        The keys not already in flight share one `func` call, which gets the
+        new keys and returns a result per key. Must be called from a running
+        event loop, await the tasks shielded.
+        """
+        loop = asyncio.get_running_loop()
+        keys = list(dict.fromkeys(keys))
+        self.calls += len(keys)
+
+        tasks = {}
+        new_keys = []
+        for key in keys:
+            task = self._inflight.get(key)
+            if task is not None and task.get_loop() is loop:
+                self.coalesced += 1
+                tasks[key] = task
+            else:
+                new_keys.append(key)
+
+        if new_keys:
+            log_debug(f"[{self.name}] starting one call for {len(new_keys)} keys")
+            self.executions += len(new_keys)
+            batch = loop.create_task(func(new_keys))
+            for key in new_keys:
+                # one task per key, so single `do` callers can join any of them
+                task = loop.create_task(self._pick(batch, key))
+                self._inflight[key] = task
+                task.add_done_callback(lambda t, key=key: self._forget(key, t))
+                tasks[key] = task
+        return tasks
+
+    @staticmethod
+    async def _pick(batch: asyncio.Task, key: str) -> Any:
+        results = await batch
+        return results[key]
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # mark the exception as retrieved in case every waiter was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "in_flight": self.in_flight(),
+            "coalesced_ratio": round(self.coalesced / self.calls, 4) if self.calls else 0.0,
+        }
@@ -0,0 +1,27 @@
+import json
+from typing import Any, Optional
+
+from fastapi.encoders import jsonable_encoder
+
+# no caching or proxy buffering, events have to reach the client as they are sent
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+SSE_MEDIA_TYPE = "text/event-stream"
+
+
+def sse_event(data: Any, event: Optional[str] = None, event_id: Optional[str] = None) -> str:
+    """Format one server-sent event, `data` is sent as JSON."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event is not None:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(jsonable_encoder(data), default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+
+def sse_comment(text: str = "ping") -> str:
+    """A comment line, ignored by clients, used as keep-alive."""
+    return f": {text}\n\n"
@@ -0,0 +1,22 @@
+import re
+import unicodedata
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_E_NUMBER_RE = re.compile(r"^e[\s\-]?(\d{3,4}[a-z]?)$")
+
+
+def normalize_ingredient_name(name: str) -> str:
+    """Normalize an ingredient name so that spelling variants share one key.
+
+    "  Citric  Acid. " -> "citric acid", "E 330" -> "e330"
+    """
+    if not name:
+        return ""
+    normalized = unicodedata.normalize("NFKC", str(name)).casefold()
+    normalized = _WHITESPACE_RE.sub(" ", normalized).strip(" .,;:*")
+
+    # collapse the common E-number spellings (E 330, E-330) into e330
+    e_number = _E_NUMBER_RE.match(normalized)
+    if e_number:
+        return f"e{e_number.group(1)}"
+    return normalized
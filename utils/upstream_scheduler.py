@@ -0,0 +1,230 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Optional
+
+from logger_manager import log_debug, log_info
+
+from env import UPSTREAM_LIMITS
+
+# Flow (usually one product request) the current task is working for, capacity
+# of every upstream is shared round-robin between the flows waiting for it
+current_flow: ContextVar[str] = ContextVar("upstream_flow", default="default")
+
+
+class TokenBucket:
+    """Request rate budget, `rate` requests per second with bursts up to `burst`."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class AdaptiveTokenBucket(TokenBucket):
+    """Token bucket whose rate follows the upstream's health.
+
+    Additive increase on every successful call, multiplicative decrease on
+    every throttling signal (AIMD), within [min_rate, max_rate].
+    """
+
+    def __init__(self, rate: float, burst: int, min_rate: float, max_rate: float,
+                 increase: float = 0.05, decrease: float = 0.5):
+        super().__init__(rate, burst)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.throttles = 0
+
+    def on_success(self):
+        self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self):
+        self.throttles += 1
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        # drop the saved burst so the lower rate applies right away
+        self._tokens = min(self._tokens, 0.0)
+        log_info(f"Upstream throttled, rate lowered to {self.rate:.2f}/s")
+
+
+class FairLimiter:
+    """Concurrency (and optional rate) budget of one upstream.
+
+    When the upstream is saturated, waiters are queued per flow and slots are
+    handed out round-robin between flows, so one product with 60 ingredients
+    can't starve a product with 3.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, rate: float = 0, burst: int = 1,
+                 min_rate: float = 0, max_rate: float = 0):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        if rate > 0 and max_rate > min_rate > 0:
+            self._bucket = AdaptiveTokenBucket(rate, burst, min_rate, max_rate)
+        else:
+            self._bucket = TokenBucket(rate, burst) if rate > 0 else None
+        self._active = 0
+        self._waiters: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+
+        self.granted = 0
+        self.queued_total = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def queue_depth(self) -> int:
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+    async def acquire(self, flow: str):
+        started = time.monotonic()
+        if self._active < self.max_concurrency and not self._waiters:
+            self._active += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self._waiters.setdefault(flow, deque()).append(future)
+            self.queued_total += 1
+            try:
+                # the slot is counted as active by release() before waking us
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    self.release()
+                else:
+                    self._remove_waiter(flow, future)
+                raise
+
+        if self._bucket is not None:
+            try:
+                await self._bucket.acquire()
+            except asyncio.CancelledError:
+                self.release()
+                raise
+
+        waited = time.monotonic() - started
+        self.granted += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    def release(self):
+        self._active -= 1
+        self._wake_next()
+
+    def report(self, throttled: bool):
+        """Feed the outcome of a call to an adaptive rate budget."""
+        if isinstance(self._bucket, AdaptiveTokenBucket):
+            if throttled:
+                self._bucket.on_throttle()
+            else:
+                self._bucket.on_success()
+
+    def _remove_waiter(self, flow: str, future: asyncio.Future):
+        waiters = self._waiters.get(flow)
+        if waiters is None:
+            return
+        try:
+            waiters.remove(future)
+        except ValueError:
+            pass
+        if not waiters:
+            del self._waiters[flow]
+
+    def _wake_next(self):
+        while self._active < self.max_concurrency and self._waiters:
+            # take the flow at the front and move it to the back
+            flow, waiters = self._waiters.popitem(last=False)
+            future = waiters.popleft()
+            if waiters:
+                self._waiters[flow] = waiters
+            if future.done():
+                continue
+            self._active += 1
+            future.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "rate_per_second": round(self._bucket.rate, 3) if self._bucket else None,
+            "throttles": getattr(self._bucket, "throttles", None),
+            "active": self._active,
+            "queue_depth": self.queue_depth(),
+            "waiting_flows": len(self._waiters),
+            "granted": self.granted,
+            "queued_total": self.queued_total,
+            "avg_wait_ms": round(self.total_wait / self.granted * 1000, 2) if self.granted else 0.0,
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+        }
+
+
+class UpstreamScheduler:
+    """Process-wide budgets for every upstream the ingredient pipeline calls.
+
+    Budgets are bound to the app's event loop in `start()`. Calls made from
+    any other loop (sync LangChain tool calls, scripts) are not scheduled.
+    """
+
+    def __init__(self, limits: Dict[str, Dict[str, Any]]):
+        self._limiters = {
+            name: FairLimiter(
+                name,
+                limit["max_concurrency"],
+                limit.get("rate", 0),
+                limit.get("burst", 1),
+                limit.get("min_rate", 0),
+                limit.get("max_rate", 0),
+            )
+            for name, limit in limits.items()
+        }
+        self._loop = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        log_info(f"Started upstream scheduler for: {', '.join(self._limiters)}")
+
+    def new_flow(self, name: Optional[str] = None) -> str:
+        """Start a new flow for the current task (and the tasks it spawns)."""
+        flow = name or uuid.uuid4().hex
+        current_flow.set(flow)
+        return flow
+
+    @asynccontextmanager
+    async def slot(self, upstream: str):
+        """Hold one slot of an upstream's budget for the duration of a call."""
+        limiter = self._limiters[upstream]
+        if asyncio.get_running_loop() is not self._loop:
+            yield
+            return
+        flow = current_flow.get()
+        await limiter.acquire(flow)
+        log_debug(f"[{upstream}] slot granted to flow {flow}")
+        try:
+            yield
+        finally:
+            limiter.release()
+
+    def report_success(self, upstream: str):
+        self._limiters[upstream].report(throttled=False)
+
+    def report_throttle(self, upstream: str):
+        self._limiters[upstream].report(throttled=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: limiter.stats() for name, limiter in self._limiters.items()}
+
+
+upstream_scheduler = UpstreamScheduler(UPSTREAM_LIMITS)
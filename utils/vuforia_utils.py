@@ -6,7 +6,8 @@ import time
 from datetime import datetime
 from logger_manager import log_info, log_error
 import os
-import aiohttp
+
+from utils.http_clients import http_clients
 
 from env import VUFORIA_SERVER_ACCESS_KEY, VUFORIA_SERVER_SECRET_KEY,UPLOADED_IMAGES_DIR
 
@@ -70,7 +71,7 @@ async def add_target_to_vuforia(image_name: str, image_path: str) -> str:
         }
         
         # Make the API request
-        async with aiohttp.ClientSession() as session:
+        async with http_clients.session("vuforia") as session:
             async with session.post(url, headers=headers, data=body) as response:
                 # Get response text and try to parse as JSON
                 response_text = await response.text()